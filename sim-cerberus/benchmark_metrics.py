@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import run_sim
+import params
+from datetime import datetime
+import time
+import sys
+
+# Measure per-packet cost of each metric tier over the same seeded traffic
+# usage: python3 benchmark_metrics.py [param_filename] [tier ...]
+def benchmark(param_filename: str, tiers: list[str]) -> dict[str, tuple[int, float]]:
+    results = {}
+    for tier in tiers:
+        sim = run_sim.Simulation(params.Params(param_filename, {"metrics": tier, "mem_usage": False}))
+        start_time = time.perf_counter()
+        sim.run()
+        elapsed_time = time.perf_counter() - start_time
+        sim.cerb.close()
+        results[tier] = sim.n_packet, elapsed_time
+    return results
+
+if __name__ == '__main__':
+    param_filename = "1_5_11_13"
+    tiers = list(params.metric_tiers)
+    if len(sys.argv) >= 2:
+        param_filename = sys.argv[1]
+    if len(sys.argv) >= 3:
+        tiers = sys.argv[2:]
+
+    print(f"Started benchmark {param_filename} at {datetime.now()}", flush=True)
+    results = benchmark(param_filename, tiers)
+    print(f"{'Tier':<24}{'Packets':>12}{'Time (s)':>12}{'us/packet':>12}{'Relative':>12}")
+    base = results[tiers[0]][1] / max(results[tiers[0]][0], 1)
+    for tier in tiers:
+        n_packet, elapsed_time = results[tier]
+        per_packet = elapsed_time / max(n_packet, 1)
+        print(f"{tier:<24}{n_packet:>12}{elapsed_time:>12.2f}{per_packet*1e6:>12.2f}{per_packet/base:>12.2f}")
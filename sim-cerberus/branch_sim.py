@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import run_sim
+from packet import attack_generator as gen
+import params
+from datetime import datetime
+import time
+import random
+import pickle
+import json
+import os
+import sys
+
+# Parameters that may differ between branches; everything else is baked into the state of the shared prefix
+branch_params = ["atk_profile", "task_match_action_table", "cp_processing_threshold", "data_to_control_channel_bandwidth",
+                 "adaptive_memory", "adaptive_memory_cycle", "profile", "profile_ticks", "checkpoint_cycle",
+                 "j_data"]   # raw contents of the params file; the parameters themselves are checked
+# Attack schedule of AttackGenerator, indexed by subtick
+schedule_keys = ["ratio", "rate", "seq_size", "seq_count", "seq_ratio", "loop_size", "loop_count", "loop_ratio", "loop_rate"]
+
+# Check that the branch only changes what can change after prefix_ticks, and returns the new attack generator (or None)
+def validate_branch(sim: run_sim.Simulation, param: params.Params, prefix_ticks: int) -> gen.AttackGenerator | None:
+    base = sim.param
+    changed = [key for key in vars(base) if key not in branch_params and getattr(base, key) != getattr(param, key)]
+    if changed:
+        raise ValueError(f"Branch changes parameters fixed by the shared prefix: {changed}")
+    for task_id in base.task_match_action_table:
+        base_task = {k: v for k, v in base.task_match_action_table[task_id].items() if k != "defense_threshold"}
+        task = {k: v for k, v in param.task_match_action_table.get(task_id, {}).items() if k != "defense_threshold"}
+        if base_task != task:
+            raise ValueError(f"Branch may only change defense_threshold of task {task_id}: {task}")
+    if len(param.task_match_action_table) != len(base.task_match_action_table):
+        raise ValueError("Branch changes the number of tasks")
+
+    if param.atk_profile == base.atk_profile:
+        return None
+    # AttackGenerator draws random flow keys and IPs on construction; keep the random stream of the prefix
+    state = random.getstate()
+    refresh_cycle_per_attack = {run_sim.defense_dict[param.task_match_action_table[i]['defense_no']]: param.refresh_cycle[i] for i in param.task_match_action_table}
+    generator = gen.AttackGenerator(param.benign_unique_flowkey, param.attack_unique_ip, param.atk_profile, param.benign_volume, param.attack_volume, refresh_cycle_per_attack, param.tick_divisor, param.attack_tick_to_subtick, param.attack_start_subtick, param.loop_engine, param.population, param.rng, param.seed)
+    random.setstate(state)
+    if generator.attack_key != sim.generator.attack_key:
+        raise ValueError(f"Branch changes the set of attacks: {generator.attack_key} != {sim.generator.attack_key}")
+    prefix_subticks = prefix_ticks * param.tick_divisor
+    for key in schedule_keys:
+        for atk in generator.attack_key:
+            new, old = getattr(generator, key)[atk], getattr(sim.generator, key)[atk]
+            if new[:prefix_subticks] + [None] * (prefix_subticks - len(new)) != old[:prefix_subticks] + [None] * (prefix_subticks - len(old)):
+                raise ValueError(f"Branch changes the attack profile before tick {prefix_ticks}: {atk}")
+    return generator
+
+# Switch a simulation that finished the prefix to the parameters of the branch
+def apply_branch(sim: run_sim.Simulation, param: params.Params, generator: gen.AttackGenerator | None):
+    sim.param = param
+    sim.cerb.param = param
+    sim.cerb.defense_table, _ = run_sim.make_tables(param)
+    if generator:
+        # traffic already scheduled for future subticks by the prefix is kept
+        for key in schedule_keys + ["max_tick", "attack_profile", "attack_ip_division", "attack_seq_ip_division", "attack_loop_ip_division"]:
+            setattr(sim.generator, key, getattr(generator, key))
+        sim.num_tick = ((sim.generator.max_tick+1)*param.attack_tick_to_subtick + param.attack_start_subtick - 1)//param.tick_divisor + 1
+    if param.profile and not sim.profiler:
+        sim.start_profiler()
+
+def run_branch(sim: run_sim.Simulation, param_filename: str, exp_name: str, param: params.Params, generator: gen.AttackGenerator | None) -> str:
+    apply_branch(sim, param, generator)
+    sim.run()
+    return sim.save(param_filename, exp_name)
+
+# Simulate prefix_ticks once, then run every branch from the snapshot
+# branches: {branch name: overrides of the params file}; results are saved as "<exp_name> <branch name>"
+def main(param_filename: str, exp_name: str, prefix_ticks: int, branches: dict[str, dict], max_workers: int = os.cpu_count()) -> dict[str, int]:
+    sim = run_sim.Simulation(params.Params(param_filename))
+    if not 0 < prefix_ticks < sim.num_tick:
+        raise ValueError(f"Prefix should be shorter than the experiment: {prefix_ticks} (total {sim.num_tick} ticks)")
+    branch_params_list = {name: params.Params(param_filename, branches[name]) for name in branches}
+    generators = {name: validate_branch(sim, branch_params_list[name], prefix_ticks) for name in branches}
+
+    sim.run(end_tick=prefix_ticks)
+    print(f"Finished shared prefix of {prefix_ticks} ticks", flush=True)
+
+    # A control plane process can't be shared by forked children, so each branch restores a pickled snapshot
+    snapshot = pickle.dumps((sim, random.getstate()), protocol=pickle.HIGHEST_PROTOCOL) if sim.param.cp_process or not hasattr(os, "fork") else None
+    status = {}
+    if not hasattr(os, "fork"):
+        for name in branches:
+            branch, state = pickle.loads(snapshot)
+            random.setstate(state)
+            run_branch(branch, param_filename, f"{exp_name} {name}", branch_params_list[name], generators[name])
+            status[name] = 0
+        sim.cerb.close()
+        return status
+
+    # Copy-on-write snapshot: each branch is a forked child of the process that simulated the prefix
+    # random reseeds itself in forked children, so its state is restored explicitly
+    state = random.getstate()
+    running = {}
+    for name in branches:
+        while len(running) >= max_workers:
+            pid, code = os.wait()
+            status[running.pop(pid)] = os.waitstatus_to_exitcode(code)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                branch, state = pickle.loads(snapshot) if snapshot else (sim, state)
+                random.setstate(state)
+                run_branch(branch, param_filename, f"{exp_name} {name}", branch_params_list[name], generators[name])
+            except BaseException as e:
+                print(f"Branch {name} failed: {e!r}", file=sys.stderr, flush=True)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        running[pid] = name
+    while running:
+        pid, code = os.wait()
+        status[running.pop(pid)] = os.waitstatus_to_exitcode(code)
+    sim.cerb.close()
+    return status
+
+if __name__ == '__main__':
+    # usage: python3 branch_sim.py <param_filename> <exp_name> <prefix_ticks> <branches.json>
+    # branches.json: {"branch name": {"atk_profile": "...", "task_match_action_table": {...}}, ...}
+    if len(sys.argv) < 5:
+        print(f"Usage: {sys.argv[0]} <param_filename> <exp_name> <prefix_ticks> <branches.json>", file=sys.stderr)
+        sys.exit(1)
+    param_filename, exp_name, prefix_ticks = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    with open(sys.argv[4], mode="r") as j_object:
+        branches = json.load(j_object)
+
+    print(f"Started branches {param_filename} {exp_name} at {datetime.now()}", flush=True)
+    start_time = time.time()
+    status = main(param_filename, exp_name, prefix_ticks, branches)
+    for name in status:
+        print(f"Branch {name}: {'finished' if status[name] == 0 else f'failed ({status[name]})'}", flush=True)
+    elapsed_time = time.time() - start_time
+    hours, rem = divmod(elapsed_time, 3600)
+    minutes, seconds = divmod(rem, 60)
+    print(f"Execution time: {int(hours):02}:{int(minutes):02}:{seconds:05.2f}", flush=True)
+    print(f"Finished branches {param_filename} {exp_name} at {datetime.now()}", flush=True)
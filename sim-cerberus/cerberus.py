@@ -4,7 +4,9 @@
 from common import *
 import data_plane as dp
 import control_plane as cp
+import control_plane_process as cpp
 import cms
+import counters
 from packet import packet as pkt
 import params
 import math
@@ -36,13 +38,22 @@ class Cerberus:
                         raise ValueError("For adaptive memory, array size must be same in a register")
 
         self.param = param
+        self.weight = 1 / param.sample_rate     # each simulated packet stands for 1/sample_rate packets of the channel to the control plane in a preview
         self.task_per_reg = task_per_reg
         self.n_task = sum(n_task_per_reg)
-        self.data_plane = dp.DataPlane(n_task_per_reg, slice_per_registers, array_size_per_registers, elephant_array_sizes, n_register, param.n_hash)
-        self.control_plane = cp.ControlPlane(self.n_task, cp_slice_per_tasks, sum(array_size_per_registers, []), param.n_hash)
-        self.blocklist = [cms.CountMinSketch(2, 2**param.blocklist_size, param.n_hash) for _ in range(2)]   # BF
+        self.count = counters.new()     # event counters of this instance, shared with its registers, sketches and control plane
+        self.data_plane = dp.DataPlane(n_task_per_reg, slice_per_registers, array_size_per_registers, elephant_array_sizes, n_register, param.n_hash, count=self.count)
+        if param.cp_process:
+            self.control_plane = cpp.ControlPlaneProcess(self.n_task, cp_slice_per_tasks, sum(array_size_per_registers, []), param.n_hash, param.cp_queue_size, count=self.count)
+        else:
+            self.control_plane = cp.ControlPlane(self.n_task, cp_slice_per_tasks, sum(array_size_per_registers, []), param.n_hash, count=self.count)
+        self.cp_pending = {}    # seq: context of a record waiting for the control plane process
+        self.cp_due = deque()   # packet after which the result of each pending record is applied, in the order of seq
+        self.cp_clock = 0       # packets updated so far
+        self.blocklist = [cms.CountMinSketch(2, 2**param.blocklist_size, param.n_hash, self.count) for _ in range(2)]   # BF
         self.flowkey_table = flowkey_table
         self.defense_table = defense_table
+        self.find_flowkey = find_flowkey    # replaced by a shared memo when Cerberus instances run in lockstep
         self.current_window = [0] * self.n_task
         self.hps_i = [dict() for _ in range(self.n_task)]
         self.rtps = [0] * self.n_task
@@ -67,6 +78,9 @@ class Cerberus:
         self.cp_max_bits_history = [[] for _ in range(self.n_task)]
         self.cp_not_processed_packet = 0
         self.cp_not_processed_packet_history = []
+        self.cp_backlog_history = []
+        self.counter_history = {name: [] for name in counters.names}   # events per tick
+        self.counter_snapshot = counters.snapshot(self.count)
 
     def find_task(self, task_id: int) -> tuple[int, int]:
         reg_index = 0
@@ -78,23 +92,37 @@ class Cerberus:
         raise ValueError("task_id exceeds number of tasks")
 
     def update(self, p: pkt.Packet) -> list[bool]:
+        self.count["packet"] += 1
+        if self.param.cp_process:
+            # results are applied cp_delay packets after their records, whenever the child process actually sends them
+            n = 0
+            while n < len(self.cp_due) and self.cp_due[n] < self.cp_clock:
+                n += 1
+            if n:
+                self.apply_cp_results(self.control_plane.receive(n))
+            self.cp_clock += 1
+
         # defense
         c2_key = calculate_flowkey(["src_ip", "dst_ip"], p)
         blocked = [bool(min(self.blocklist[i].read(c2_key))) for i in range(2)]
 
         overflow = [False] * self.n_task
         blocklist_update_request = [False] * self.n_task
-        cp_active = self.bandwidth_utilization <= self.param.cp_processing_threshold / self.param.tick_divisor
+        # with a control plane process, its saturation is modeled by the queue instead
+        cp_active = self.param.cp_process or self.bandwidth_utilization <= self.param.cp_processing_threshold / self.param.tick_divisor
+        self.cp_rejected = False
+        self.matched_flows = []     # (task_id, flow_key, amount) of the tasks updated by this packet
         for task_id in sum(self.task_per_reg, []):
             condition_key, task_key, task_action, task_value, _ = self.flowkey_table[task_id]
             defense_condition_key, defense_task_key, threshold, _, _ = self.defense_table[task_id]
-            condition, flow_key = find_flowkey(condition_key, task_key, p)
-            defense_condition, defense_flow_key = find_flowkey(defense_condition_key, defense_task_key, p)
+            condition, flow_key = self.find_flowkey(condition_key, task_key, p)
+            defense_condition, defense_flow_key = self.find_flowkey(defense_condition_key, defense_task_key, p)
             # update CMS and blocklist; it is True only if it is update to CMS or (non-attack) BF
             if condition:
                 amount = p.packet_size if task_value == 0 else task_value
+                self.matched_flows.append((task_id, flow_key, amount))
                 for operation in task_action:
-                    overflow[task_id], blocklist_update_request[task_id] = self.update_task(task_id, operation, flow_key, amount, p.packet_size, cp_active, threshold, defense_condition and task_key == defense_task_key and (not blocked[self.current_window[0]]))
+                    overflow[task_id], blocklist_update_request[task_id] = self.update_task(task_id, operation, flow_key, amount, p.packet_size, cp_active, threshold, defense_condition and task_key == defense_task_key and (not blocked[self.current_window[0]]), c2_key)
             # update blocklist (when not updating CMS); it is True only if it is defense to (attack) BF
             elif defense_condition:
                 reg_index, task_index = self.find_task(task_id)
@@ -109,21 +137,25 @@ class Cerberus:
                 self.num_packet[task_id] += 1
 
         if cp_active and any(blocklist_update_request):
-            self.blocklist[self.current_window[0]].setbit(c2_key, 1, False)
-            blocked[self.current_window[0]] = True
+            if self.param.cp_process:
+                self.submit_cp(cpp.BLOCKLIST_RECORD, 0, c2_key, [0] * self.param.n_hash, "setbitFalse", (c2_key, self.current_window[0]))
+            else:
+                self.blocklist[self.current_window[0]].setbit(c2_key, 1, False)
+                blocked[self.current_window[0]] = True
+                self.count["blocklist_install"] += 1
 
         if any(overflow):
             self.overflowed_packet[self.n_task] += 1
         if any(overflow) or any(blocklist_update_request):
-            self.bandwidth_utilization += p.packet_size
+            self.bandwidth_utilization += p.packet_size * self.weight
             self.uploaded_packet[self.n_task] += 1
-        if not cp_active:
+        if not cp_active or self.cp_rejected:
             self.cp_not_processed_packet += 1
         self.num_packet[self.n_task] += 1
         return blocked
 
     # df_active is True only if it is CMS (not BF) for now; hence block request if value >= threhsold
-    def update_task(self, task: int, operation: str, element, value: int, packet_size: int, cp_active: bool, threshold: int, df_active: bool) -> tuple[bool, bool]:
+    def update_task(self, task: int, operation: str, element, value: int, packet_size: int, cp_active: bool, threshold: int, df_active: bool, c2_key: bytes = bytes(0)) -> tuple[bool, bool]:
         blocklist_update_request = False
         reg_index, task_index = self.find_task(task)
         overflow_value, data_plane_data = self.data_plane.update_register(reg_index, task_index, operation, element, value, self.current_window[task])
@@ -132,35 +164,73 @@ class Cerberus:
             blocklist_update_request = True
 
         if cp_active and any(overflow_value):
-            control_plane_data = self.control_plane.co_monitoring(task, element, overflow_value, operation, self.current_window[task])
-            diff_control_plane_data = self.control_plane.read(task, element, self.current_window[task])
-            # Calc current data
-            # data = self.read(task, element)
-            # Update HPS
-            hps_ij = self.calc_hps_ij(task, min([overflow_value[i] for i in min_indices(list_elementwise_sub(control_plane_data, overflow_value))]), packet_size)
-            if element not in self.hps_i[task]:
-                self.hps_i[task][element] = hps_ij
+            if self.param.cp_process:
+                self.submit_cp(cpp.OVERFLOW_RECORD, task, element, overflow_value, operation, (task, element, overflow_value, packet_size, threshold, df_active, c2_key, self.current_window[0]))
             else:
-                self.hps_i[task][element] += hps_ij
-            self.rtps[task] += hps_ij
-            self.cb[task] += hps_ij*packet_size
-
-            cp_max = max(control_plane_data)
-            max_bit = intlog2(cp_max)+1 if cp_max > 0 else 0
-            self.cp_max[task] = max(self.cp_max[task], cp_max)
-            self.cp_max_bits[task] = max(self.cp_max_bits[task], max_bit)
-
-            if df_active and sum([min(control_plane_data), min(diff_control_plane_data)]) * 2**(self.data_plane.register[self.current_window[task]][reg_index].cms[task_index].counter_size-1) >= threshold / 2**self.param.shrink_ratio_exp:
-                blocklist_update_request = True
+                control_plane_data = self.control_plane.co_monitoring(task, element, overflow_value, operation, self.current_window[task])
+                diff_control_plane_data = self.control_plane.read(task, element, self.current_window[task])
+                if self.update_control_plane_data(task, element, overflow_value, control_plane_data, diff_control_plane_data, packet_size, threshold, df_active):
+                    blocklist_update_request = True
 
         return any(overflow_value), blocklist_update_request
 
+    # Update HPS and control plane maximum with the data returned by the control plane; returns blocklist update request
+    def update_control_plane_data(self, task: int, element, overflow_value: list[int], control_plane_data: list[int], diff_control_plane_data: list[int], packet_size: int, threshold: int, df_active: bool) -> bool:
+        reg_index, task_index = self.find_task(task)
+        # Calc current data
+        # data = self.read(task, element)
+        # Update HPS
+        hps_ij = self.calc_hps_ij(task, min([overflow_value[i] for i in min_indices(list_elementwise_sub(control_plane_data, overflow_value))]), packet_size)
+        if element not in self.hps_i[task]:
+            self.hps_i[task][element] = hps_ij
+        else:
+            self.hps_i[task][element] += hps_ij
+        self.rtps[task] += hps_ij
+        self.cb[task] += hps_ij*packet_size
+
+        cp_max = max(control_plane_data)
+        max_bit = intlog2(cp_max)+1 if cp_max > 0 else 0
+        self.cp_max[task] = max(self.cp_max[task], cp_max)
+        self.cp_max_bits[task] = max(self.cp_max_bits[task], max_bit)
+
+        if df_active and sum([min(control_plane_data), min(diff_control_plane_data)]) * 2**(self.data_plane.register[self.current_window[task]][reg_index].cms[task_index].counter_size-1) >= threshold / 2**self.param.shrink_ratio_exp:
+            return True
+        return False
+
+    def submit_cp(self, kind: int, task: int, element, overflow_value: list[int], operation: str, context: tuple):
+        seq = self.control_plane.submit(kind, task, element, overflow_value, operation, self.current_window[task])
+        if seq < 0:     # control plane queue is full
+            self.cp_rejected = True
+            self.count["cp_rejected"] += 1
+        else:
+            self.cp_pending[seq] = kind, context
+            self.cp_due.append(self.cp_clock + self.param.cp_delay)
+
+    def apply_cp_results(self, results: list[tuple[int, int, list[int], list[int]]]):
+        for seq, kind, control_plane_data, diff_control_plane_data in results:
+            _, context = self.cp_pending.pop(seq)
+            self.cp_due.popleft()
+            if kind == cpp.OVERFLOW_RECORD:
+                self.count["co_monitoring"] += 1
+                task, element, overflow_value, packet_size, threshold, df_active, c2_key, window = context
+                if self.update_control_plane_data(task, element, overflow_value, control_plane_data, diff_control_plane_data, packet_size, threshold, df_active):
+                    self.blocklist[window].setbit(c2_key, 1, False)
+                    self.count["blocklist_install"] += 1
+            else:
+                c2_key, window = context
+                self.blocklist[window].setbit(c2_key, 1, False)
+                self.count["blocklist_install"] += 1
+
     def update_subtick(self, subtick: int):
         # statistics
         if (subtick + 1) % self.param.statistics_cycle_subtick == 0:
             self.collect_statistics_subtick()
 
     def update_tick(self, tick: int):
+        # wait for the control plane process; it owns its sketches again after release()
+        if self.param.cp_process:
+            self.apply_cp_results(self.control_plane.sync())
+
         # choose top-k for elephant region
         if self.param.elephant_region and (tick + 1) % self.param.elephant_cycle == 0 and self.data_plane.register[0][0].elephant_region:
             self.change_top_k()
@@ -178,6 +248,25 @@ class Cerberus:
             if (tick + 1) % self.param.refresh_cycle[task_id] == 0:
                 self.change_current_window(task_id)
 
+        if self.param.cp_process:
+            self.control_plane.release()
+
+        # event counters of this tick
+        snapshot = counters.snapshot(self.count)
+        for name, value in counters.delta(snapshot, self.counter_snapshot).items():
+            self.counter_history[name].append(value)
+        self.counter_snapshot = snapshot
+
+    def close(self):
+        if self.param.cp_process:
+            self.control_plane.close()
+
+    # Estimated memory of each component (bytes)
+    def memory_usage(self) -> dict[str, int]:
+        return {"Sketch": self.data_plane.memory_usage() + self.control_plane.memory_usage(),
+                "Elephant": self.data_plane.elephant_memory_usage() + sum(sys.getsizeof(d) for d in self.hps_i),
+                "Blocklist": sum(x.memory_usage() for x in self.blocklist)}
+
     def read(self, task: int, element) -> int:
         reg_index, task_index = self.find_task(task)
         data_plane_data = self.data_plane.read(reg_index, task_index, element, self.current_window[task])
@@ -185,7 +274,27 @@ class Cerberus:
         data = min(list_elementwise_add(data_plane_data, [x * (2**(self.data_plane.register[(self.current_window[task]-1) % 2][reg_index].cms[task_index].counter_size-1)) for x in control_plane_data]))
         return data
 
+    # Batch version of read(); returns estimates of all elements in order
+    def read_many(self, task: int, elements: list) -> np.ndarray:
+        reg_index, task_index = self.find_task(task)
+        window = (self.current_window[task]-1) % 2
+        register = self.data_plane.register[window][reg_index]
+        dp_cms = register.cms[task_index]
+        cp_cms = self.control_plane.cms[window][task]
+        scale = 2**(dp_cms.counter_size-1)
+        data = np.zeros(len(elements), dtype=np.int64)
+        for i in range(dp_cms.depth):
+            dp_index = np.fromiter((hash_crc(element, i) % dp_cms.cms_array_size for element in elements), dtype=np.int64, count=len(elements))
+            cp_index = np.fromiter((hash_crc(element, i) % cp_cms.cms_array_size for element in elements), dtype=np.int64, count=len(elements))
+            row = np.array(dp_cms.cms[i], dtype=np.int64)[dp_index] + np.array(cp_cms.cms[i], dtype=np.int64)[cp_index] * scale
+            data = row if i == 0 else np.minimum(data, row)
+        if register.elephant_region and register.elephant_region[task_index]:
+            elephant_region = register.elephant_region[task_index]
+            data += np.fromiter((elephant_region.get(element, 0) for element in elements), dtype=np.int64, count=len(elements))
+        return data
+
     def change_adaptive_memory(self):
+        self.count["adaptive_memory"] += 1
         for reg_index in range(len(self.adaptive_task_per_reg)):
             if len(self.adaptive_task_per_reg[reg_index]) > 1:
                 current_counter_sizes = [0] * len(self.adaptive_task_per_reg[reg_index])
@@ -224,6 +333,9 @@ class Cerberus:
                     sending_data = self.control_plane.send_to_dataplane(w, task_id, slicings[i])
 
                 received_data = self.data_plane.register[w][reg_index].resize_cms(task_index, slicings[i], 2**array_sizes[i], sending_data)
+                self.count["resize"] += 1
+                if slicings[i] != 0:
+                    self.count["resize_counter"] += self.control_plane.cms[w][task_id].depth * self.control_plane.cms[w][task_id].cms_array_size
 
                 if slicings[i] < 0:   # receive data from data plane
                     self.control_plane.receive_from_dataplane(w, task_id, slicings[i], received_data)
@@ -233,9 +345,10 @@ class Cerberus:
         #         self.data_plane.register[window][reg_index].integrity_check()
 
     def collect_statistics_subtick(self):
+        self.cp_backlog_history.append(self.control_plane.backlog() if self.param.cp_process else 0)
         self.bandwidth_utilization_history.append(self.bandwidth_utilization / (self.param.statistics_cycle_subtick/self.param.tick_divisor) / self.param.data_to_control_channel_bandwidth * 100)
         for task in range(self.n_task + 1):
-            self.uploaded_packet_history[task].append(self.uploaded_packet[task]/1000000*10 * 2**self.param.shrink_ratio_exp)
+            self.uploaded_packet_history[task].append(self.uploaded_packet[task]/1000000*10 * 2**self.param.shrink_ratio_exp * self.weight)
             if self.num_packet[task] != 0:
                 self.overflowed_packet_ratio_history[task].append(self.overflowed_packet[task] / self.num_packet[task] * 100)
                 self.uploaded_packet_ratio_history[task].append(self.uploaded_packet[task] / self.num_packet[task] * 100)
@@ -260,6 +373,7 @@ class Cerberus:
             self.cp_max_bits_history[task].append(self.cp_max_bits[task])
 
     def change_current_window(self, task_id: int):
+        self.count["window_change"] += 1
         self.current_window[task_id] = (self.current_window[task_id] + 1) % 2
         self.clear_register(task_id)
         self.hps_i = [dict() for _ in range(self.n_task)]
@@ -281,7 +395,7 @@ class Cerberus:
                 for j in range(cms.cms_array_size):
                     cms.cms[i][j] = 0
         if reg.elephant_region:
-            reg.elephant_region = [{} for _ in range(reg.n_task)]
+            reg.clear_elephant_region()
 
         if task_id == 0:
             for i in range(self.blocklist[self.current_window[0]].depth):
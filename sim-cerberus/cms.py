@@ -2,14 +2,16 @@
 # -*- coding: utf-8 -*-
 
 from common import *
+import counters
 import unittest
 from random import randint
 
 class CountMinSketch:
-    def __init__(self, counter_size: int, array_size: int, n_hash: int):
+    def __init__(self, counter_size: int, array_size: int, n_hash: int, count: dict[str, int] = None):
         self.counter_size = counter_size
         self.cms_array_size = array_size
         self.depth = n_hash
+        self.count = counters.count if count is None else count     # event counters of the owning Cerberus
         self.max = 2**(self.counter_size-1) - 1
         # self.carry_bits = [[False] * self.cms_array_size for _ in range(self.depth)] # not used
         self.cms = [[0] * self.cms_array_size for _ in range(self.depth)]
@@ -25,6 +27,9 @@ class CountMinSketch:
             # if overflow_value[i] != 0:
             #     self.carry_bits[i][hash_value] = True
             read_value.append(self.cms[i][hash_value])
+        self.count["cms_update"] += 1
+        if any(overflow_value):
+            self.count["cms_overflow"] += 1
         return overflow_value, read_value
 
     def plus(self, element, value: int = 1) -> tuple[list[int], list[int]]:
@@ -41,7 +46,12 @@ class CountMinSketch:
                 return value
         return self.operate(element, action)
 
+    # Counters are counted as references only, which keeps the estimate O(1); int objects of counters above 256 (28+ bytes each) are not included
+    def memory_usage(self) -> int:
+        return list_memory_usage(self.depth) + self.depth * list_memory_usage(self.cms_array_size)
+
     def read(self, element) -> list[int]:
+        self.count["cms_read"] += 1
         read_value = []
         for i in range(self.depth):
             hash_value = hash_crc(element, i) % self.cms_array_size
@@ -12,6 +12,8 @@ from numbers import Number
 from collections import deque
 from collections.abc import Set, Mapping
 ZERO_DEPTH_BASES = (str, bytes, Number, range, bytearray)
+POINTER_SIZE = 8
+EMPTY_LIST_SIZE = sys.getsizeof([])
 def getsize(obj_0):
     """Recursively iterate to sum size of object & members."""
     _seen_ids = set()
@@ -35,6 +37,10 @@ def getsize(obj_0):
         return size
     return inner(obj_0)
 
+# Size of a list of n references, without the referenced objects
+def list_memory_usage(n: int) -> int:
+    return EMPTY_LIST_SIZE + POINTER_SIZE * n
+
 def gen_string(length: int) -> list[str]:
     chars = ascii_lowercase + digits
     lst = [''.join(choice(chars) for _ in range(32)) for _ in range(length)]
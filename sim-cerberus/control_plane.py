@@ -3,10 +3,15 @@
 
 from common import *
 import cms as cms
+import counters
 
 class ControlPlane:
-    def __init__(self, n_task: int, counter_size_per_tasks: list[int], array_size_per_tasks: list[int], n_hash: int, n_window: int = 2):
-        self.cms = [[cms.CountMinSketch(counter_size_per_tasks[i], 2**array_size_per_tasks[i], n_hash) for i in range(n_task)] for _ in range(n_window)]
+    def __init__(self, n_task: int, counter_size_per_tasks: list[int], array_size_per_tasks: list[int], n_hash: int, n_window: int = 2, count: dict[str, int] = None):
+        self.count = counters.count if count is None else count     # event counters of the owning Cerberus
+        self.cms = [[cms.CountMinSketch(counter_size_per_tasks[i], 2**array_size_per_tasks[i], n_hash, self.count) for i in range(n_task)] for _ in range(n_window)]
+
+    def memory_usage(self) -> int:
+        return sum(x.memory_usage() for l in self.cms for x in l)
 
     def read(self, task_id: int, element, current_window: int) -> list[int]:
         return self.cms[(current_window-1) % 2][task_id].read(element)
@@ -14,6 +19,7 @@ class ControlPlane:
     def co_monitoring(self, task_id: int, element, overflowed_data: list[int], operation: str, current_window: int) -> list[int]:
         # Manage CMS in Control Plane
         # Write overflow values from data plane to CMS
+        self.count["co_monitoring"] += 1
         read_value = []
         for i in range(self.cms[current_window][task_id].depth):
             hash_value = hash_crc(element, i) % self.cms[current_window][task_id].cms_array_size
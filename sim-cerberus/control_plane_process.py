@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from common import *
+import control_plane as cp
+import counters
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import struct
+import unittest
+
+OVERFLOW_RECORD = 0
+BLOCKLIST_RECORD = 1
+operation_code = {"plus": 0, "minus": 1, "setbitTrue": 2, "setbitFalse": 3}
+code_operation = {v: k for k, v in operation_code.items()}
+max_element_size = 64
+
+class SharedRingBuffer:
+    # Single-producer single-consumer ring of fixed-size slots in shared memory
+    # Header: [head (written by producer), tail (written by consumer)], slot: [length, payload]
+    header = struct.Struct("<QQ")
+    length = struct.Struct("<I")
+
+    def __init__(self, n_slot: int, slot_size: int, name: str = None):
+        self.n_slot = n_slot
+        self.slot_size = slot_size
+        self.stride = self.length.size + slot_size
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=self.header.size + n_slot * self.stride)
+        self.name = self.shm.name
+        if self.owner:
+            self.header.pack_into(self.shm.buf, 0, 0, 0)
+
+    def __len__(self) -> int:
+        head, tail = self.header.unpack_from(self.shm.buf, 0)
+        return head - tail
+
+    def put(self, data: bytes) -> bool:
+        if len(data) > self.slot_size:
+            raise ValueError(f"Record is larger than the slot size: {len(data)} > {self.slot_size}")
+        head, tail = self.header.unpack_from(self.shm.buf, 0)
+        if head - tail >= self.n_slot:
+            return False
+        offset = self.header.size + (head % self.n_slot) * self.stride
+        self.length.pack_into(self.shm.buf, offset, len(data))
+        self.shm.buf[offset + self.length.size: offset + self.length.size + len(data)] = data
+        struct.pack_into("<Q", self.shm.buf, 0, head + 1)  # publish after the slot is written
+        return True
+
+    def get(self) -> bytes | None:
+        head, tail = self.header.unpack_from(self.shm.buf, 0)
+        if head == tail:
+            return None
+        offset = self.header.size + (tail % self.n_slot) * self.stride
+        size = self.length.unpack_from(self.shm.buf, offset)[0]
+        data = bytes(self.shm.buf[offset + self.length.size: offset + self.length.size + size])
+        struct.pack_into("<Q", self.shm.buf, 8, tail + 1)
+        return data
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class ControlPlaneProcess(cp.ControlPlane):
+    # ControlPlane running in its own process. Overflow and blocklist-upload records are sent through a shared-memory
+    # ring buffer and results come back asynchronously through another one.
+    # self.cms is only valid between sync() and release(); in between, the child process owns the sketches.
+    def __init__(self, n_task: int, counter_size_per_tasks: list[int], array_size_per_tasks: list[int], n_hash: int, queue_size: int, n_window: int = 2, count: dict[str, int] = None):
+        super().__init__(n_task, counter_size_per_tasks, array_size_per_tasks, n_hash, n_window, count)
+        self.n_hash = n_hash
+        self.queue_size = queue_size
+        self.seq = 0
+        self.in_flight = 0
+        self.start()
+
+    def start(self):
+        self.request_format = struct.Struct(f"<QBHBBB{self.n_hash}q")   # seq, kind, task_id, window, operation, element length, overflow
+        self.response_format = struct.Struct(f"<QB{2*self.n_hash}q")    # seq, kind, control plane data, diff control plane data
+        self.requests = SharedRingBuffer(self.queue_size, self.request_format.size + max_element_size)
+        self.responses = SharedRingBuffer(self.queue_size, self.response_format.size)
+        self.conn, child_conn = mp.Pipe()
+        self.process = mp.Process(target=run_control_plane, args=(self.cms, self.n_hash, self.queue_size, self.requests.name, self.responses.name, child_conn), daemon=True)
+        self.process.start()
+
+    # Sketches are held by the child process, queues are in shared memory
+    def memory_usage(self) -> int:
+        return super().memory_usage() + self.requests.shm.size + self.responses.shm.size
+
+    def backlog(self) -> int:
+        return len(self.requests)
+
+    # Returns sequence number of the record, or -1 if the queue is full
+    # The queue counts records whose results are not received yet, so that it fills up regardless of the speed of the child process
+    def submit(self, kind: int, task_id: int, element, overflowed_data: list[int], operation: str, current_window: int) -> int:
+        if len(element) > max_element_size:
+            raise ValueError(f"Flow key is too long for the control plane queue: {len(element)} bytes")
+        if self.in_flight >= self.queue_size:
+            return -1
+        record = self.request_format.pack(self.seq, kind, task_id, current_window, operation_code[operation], len(element), *overflowed_data) + element
+        if not self.requests.put(record):
+            return -1
+        self.seq += 1
+        self.in_flight += 1
+        return self.seq - 1
+
+    # Returns list of (seq, kind, control_plane_data, diff_control_plane_data) processed so far, at most limit of them
+    def poll(self, limit: int = None) -> list[tuple[int, int, list[int], list[int]]]:
+        results = []
+        while self.in_flight and (limit is None or len(results) < limit):
+            data = self.responses.get()
+            if data is None:
+                break
+            seq, kind, *values = self.response_format.unpack(data)
+            results.append((seq, kind, values[:self.n_hash], values[self.n_hash:]))
+            self.in_flight -= 1
+        return results
+
+    # Wait until the results of the next n records are received
+    def receive(self, n: int) -> list[tuple[int, int, list[int], list[int]]]:
+        results = []
+        while len(results) < n:
+            received = self.poll(n - len(results))
+            if not received:
+                self.wait()
+            results += received
+        return results
+
+    # Wait a moment for the child process; raise if it has exited
+    def wait(self):
+        self.process.join(0.0001)
+        if not self.process.is_alive():
+            raise RuntimeError(f"Control plane process exited with code {self.process.exitcode}")
+
+    # Wait until the queue is empty, and fetch the sketches from the child process
+    def sync(self) -> list[tuple[int, int, list[int], list[int]]]:
+        results = self.receive(self.in_flight)
+        self.conn.send(("pull",))
+        self.cms = self.reply()
+        for sketches in self.cms:   # sketches come back with a copy of the counters
+            for sketch in sketches:
+                sketch.count = self.count
+        return results
+
+    # Hand the (possibly modified) sketches back to the child process, before any record submitted after this
+    def release(self):
+        self.conn.send(("push", self.cms))
+        self.reply()
+
+    def reply(self):
+        while not self.conn.poll():
+            self.wait()
+        return self.conn.recv()
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(("stop",))
+            self.process.join()
+        self.requests.close()
+        self.responses.close()
+
+    def __getstate__(self):
+        # Only the sketches are saved; a fresh process is started when restored
+        if self.in_flight:
+            raise RuntimeError(f"Control plane has {self.in_flight} records in flight; save it at a tick boundary")
+        self.sync()
+        self.release()
+        state = self.__dict__.copy()
+        for key in ["request_format", "response_format", "requests", "responses", "conn", "process"]:
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.start()
+
+def run_control_plane(cms: list, n_hash: int, queue_size: int, request_name: str, response_name: str, conn):
+    control_plane = cp.ControlPlane.__new__(cp.ControlPlane)
+    control_plane.cms = cms
+    control_plane.count = counters.new()   # co_monitoring is counted by Cerberus when the results are applied
+    request_format = struct.Struct(f"<QBHBBB{n_hash}q")
+    response_format = struct.Struct(f"<QB{2*n_hash}q")
+    requests = SharedRingBuffer(queue_size, request_format.size + max_element_size, request_name)
+    responses = SharedRingBuffer(queue_size, response_format.size, response_name)
+    while True:
+        data = requests.get()
+        if data is None:
+            if conn.poll(0.0001):
+                command = conn.recv()
+                if command[0] == "pull":
+                    conn.send(control_plane.cms)
+                elif command[0] == "push":
+                    control_plane.cms = command[1]
+                    conn.send(("pushed",))
+                elif command[0] == "stop":
+                    break
+            elif not mp.parent_process().is_alive():
+                break
+            continue
+        seq, kind, task_id, window, operation, element_length, *overflowed_data = request_format.unpack_from(data)
+        element = data[request_format.size: request_format.size + element_length]
+        if kind == OVERFLOW_RECORD:
+            control_plane_data = control_plane.co_monitoring(task_id, element, overflowed_data, code_operation[operation], window)
+            diff_control_plane_data = control_plane.read(task_id, element, window)
+        else:   # blocklist upload is installed by the control plane as it is
+            control_plane_data = [0] * n_hash
+            diff_control_plane_data = [0] * n_hash
+        response = response_format.pack(seq, kind, *control_plane_data, *diff_control_plane_data)
+        while not responses.put(response):
+            if not mp.parent_process().is_alive():
+                raise RuntimeError("Simulation process exited while the control plane was sending results")
+    requests.shm.close()
+    responses.shm.close()
+
+############################################
+# Unit Test
+############################################
+class TestControlPlaneProcess(unittest.TestCase):
+    def test_co_monitoring(self):
+        n_hash = 4
+        reference = cp.ControlPlane(2, [16, 16], [4, 4], n_hash)
+        process = ControlPlaneProcess(2, [16, 16], [4, 4], n_hash, 8)
+        elements = [x.encode() for x in gen_string(50)]
+        seqs = {}
+        results = {}
+        for i, element in enumerate(elements):
+            expected = reference.co_monitoring(i % 2, element, [1] * n_hash, "plus", 0), reference.read(i % 2, element, 0)
+            seq = -1
+            while seq < 0:
+                seq = process.submit(OVERFLOW_RECORD, i % 2, element, [1] * n_hash, "plus", 0)
+                for r_seq, _, cp_data, diff_cp_data in process.poll():
+                    results[r_seq] = cp_data, diff_cp_data
+            seqs[seq] = expected
+        for r_seq, _, cp_data, diff_cp_data in process.sync():
+            results[r_seq] = cp_data, diff_cp_data
+        process.release()
+        process.close()
+        self.assertEqual(results, seqs)
+        self.assertEqual([[x.cms for x in l] for l in process.cms], [[x.cms for x in l] for l in reference.cms])
+
+    def test_crash(self):
+        process = ControlPlaneProcess(2, [16, 16], [4, 4], 4, 8)
+        process.submit(OVERFLOW_RECORD, 0, b"a", [1] * 4, "plus", 0)
+        process.process.kill()
+        with self.assertRaises(RuntimeError):
+            process.receive(2)
+        process.close()
+
+    # Results of the control plane process are applied at the same packets in every run
+    def test_deterministic(self):
+        import run_sim
+        import params
+        results = []
+        for _ in range(3):
+            sim = run_sim.Simulation(params.Params("1_5_11_13", {"atk_profile": "1_5_11_13 small", "shrink_ratio_exp": 8, "cp_process": True, "cp_queue_size": 8}))
+            sim.run(end_tick=2)
+            sim.cerb.close()
+            results.append((sim.fpr, sim.fnr, sim.cerb.uploaded_packet_history, sim.cerb.cp_not_processed_packet_history, sim.cerb.rtps))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+if __name__ == '__main__':
+    unittest.main()
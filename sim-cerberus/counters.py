@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from common import hash_crc
+import unittest
+
+# Event counters of the hot path
+# Each Cerberus keeps its own counters and passes them down to its registers, sketches and control plane, so that simulations sharing a process count separately
+# Increment with self.count[name] += 1; names must be listed here
+names = [
+    "packet",               # packets processed by Cerberus.update
+    "cms_update",           # CountMinSketch.operate calls
+    "cms_overflow",         # CountMinSketch.operate calls with overflow in any row
+    "cms_read",             # CountMinSketch.read calls
+    "elephant_hit",         # register updates that hit the elephant region
+    "elephant_insert",      # flows inserted into the elephant region
+    "elephant_evict",       # flows evicted from the elephant region
+    "co_monitoring",        # ControlPlane.co_monitoring calls
+    "cp_rejected",          # records not accepted by the control plane process queue
+    "blocklist_install",    # flows installed into the blocklist
+    "adaptive_memory",      # Cerberus.change_adaptive_memory calls
+    "resize",               # sketches resized by adaptive memory (per window)
+    "resize_counter",       # counters moved between data plane and control plane by resizing
+    "window_change",        # window changes of tasks
+    "hash_hit",             # hash_crc cache hits (taken from lru_cache)
+    "hash_miss"             # hash_crc cache misses (taken from lru_cache)
+]
+# Counters taken from caches shared by the process; simulations sharing the process can't be told apart
+process_names = ["hash_hit", "hash_miss"]
+
+def new() -> dict[str, int]:
+    return {name: 0 for name in names}
+
+count = new()   # counters of sketches and control planes created outside Cerberus, e.g., in tests
+
+def snapshot(count: dict[str, int] = count) -> dict[str, int]:
+    cache_info = hash_crc.cache_info()
+    count["hash_hit"] = cache_info.hits
+    count["hash_miss"] = cache_info.misses
+    return count.copy()
+
+# Difference of two snapshots
+def delta(current: dict[str, int], previous: dict[str, int]) -> dict[str, int]:
+    return {name: current[name] - previous.get(name, 0) for name in current}
+
+def reset(count: dict[str, int] = count):
+    for name in names:
+        count[name] = 0
+
+############################################
+# Unit Test
+############################################
+class TestCounters(unittest.TestCase):
+    def test_delta(self):
+        count = new()
+        previous = snapshot(count)
+        count["packet"] += 3
+        hash_crc(b"counters", 0)
+        hash_crc(b"counters", 0)
+        d = delta(snapshot(count), previous)
+        self.assertEqual(d["packet"], 3)
+        self.assertGreaterEqual(d["hash_hit"], 1)
+        self.assertEqual(d["hash_hit"] + d["hash_miss"], 2)
+
+    # Sketches count into the counters they are given
+    def test_separate(self):
+        import cms
+        a, b = new(), new()
+        cms.CountMinSketch(8, 16, 4, a).plus(b"a", 1)
+        cms.CountMinSketch(8, 16, 4, b).read(b"a")
+        self.assertEqual((a["cms_update"], a["cms_read"]), (1, 0))
+        self.assertEqual((b["cms_update"], b["cms_read"]), (0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import run_sim
+import params
+import counters
+from datetime import datetime
+from tqdm import tqdm
+import random
+import json
+import sys
+import unittest
+
+# Statistics of Cerberus compared at tick boundaries
+cerberus_statistics = ["bandwidth_utilization_history", "overflowed_packet_ratio_history", "uploaded_packet_history", "uploaded_packet_ratio_history",
+                       "counter_size_history", "cp_max_history", "cp_max_bits_history", "cp_not_processed_packet_history", "cp_backlog_history",
+                       "current_window", "hps_i", "rtps", "cb", "cp_max", "cp_max_bits"]
+
+# Results of the last packet, compared after every packet
+def packet_state(sim: run_sim.Simulation) -> dict:
+    cerb = sim.cerb
+    return {"blocked": [sim.true_positive, sim.false_positive, sim.false_negative, sim.true_negative],
+            "matched_flows": cerb.matched_flows,
+            "uploaded_packet": cerb.uploaded_packet,
+            "overflowed_packet": cerb.overflowed_packet,
+            "bandwidth_utilization": cerb.bandwidth_utilization,
+            "cp_not_processed_packet": cerb.cp_not_processed_packet}
+
+# Whole state of a simulation, compared at tick boundaries (and after every packet of a tick being replayed)
+# Within a tick, sketches held by a control plane process are not fetched: that would apply its pending results early
+def state(sim: run_sim.Simulation, tick_boundary: bool = True) -> dict:
+    cerb = sim.cerb
+    cp_sketches = not sim.param.cp_process or tick_boundary
+    if sim.param.cp_process and tick_boundary:
+        cerb.control_plane.sync()       # fetch the sketches from the control plane process; no record is in flight at tick boundaries
+    result = {}
+    for w, registers in enumerate(cerb.data_plane.register):
+        for r, register in enumerate(registers):
+            for t, sketch in enumerate(register.cms):
+                result[f"data_plane.register[{w}][{r}].cms[{t}]"] = {"counter_size": sketch.counter_size, "cms": sketch.cms}
+            result[f"data_plane.register[{w}][{r}].elephant_region"] = register.elephant_region
+    for w, sketches in enumerate(cerb.control_plane.cms if cp_sketches else []):
+        for t, sketch in enumerate(sketches):
+            result[f"control_plane.cms[{w}][{t}]"] = {"counter_size": sketch.counter_size, "cms": sketch.cms}
+    for w, sketch in enumerate(cerb.blocklist):
+        result[f"blocklist[{w}]"] = sketch.cms
+    for name in cerberus_statistics:
+        result[f"cerberus.{name}"] = getattr(cerb, name)
+    # counters of the hash cache are shared by both simulations
+    result["cerberus.counter_history"] = {name: value for name, value in cerb.counter_history.items() if name not in counters.process_names}
+    for name in ["fpr", "fnr", "rate", "re_cerb", "epoch"]:
+        result[f"simulation.{name}"] = getattr(sim, name)
+    if sim.param.cp_process and tick_boundary:
+        cerb.control_plane.release()
+    return result
+
+# Path and values of the first difference of two nested values, or None if they are equal
+def first_difference(a, b, path: str = "") -> tuple[str, object, object] | None:
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in list(a) + [key for key in b if key not in a]:
+            if key not in a or key not in b:
+                return f"{path}[{key!r}]", a.get(key, "<missing>"), b.get(key, "<missing>")
+            difference = first_difference(a[key], b[key], f"{path}[{key!r}]")
+            if difference:
+                return difference
+        return None
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        for i, (x, y) in enumerate(zip(a, b)):
+            difference = first_difference(x, y, f"{path}[{i}]")
+            if difference:
+                return difference
+        if len(a) != len(b):
+            return f"{path} (length)", len(a), len(b)
+        return None
+    return None if a == b else (path, a, b)
+
+# Fields of a packet, with addresses and ports in hex
+def packet_context(p) -> dict:
+    return {key: value.hex() if isinstance(value, bytes) else value for key, value in vars(p).items()}
+
+# Run the same seeded experiment with two configurations in lockstep, packet by packet
+# reference, candidate: overrides of the params file, e.g., {} and {"loop_engine": "vectorized"}
+# Returns None if both agree until end_tick (default: the end of the experiment), or the first divergence:
+# traffic (the packets generated in a subtick differ), packet (results of a packet differ) or state (state differs)
+# A state difference found at a tick boundary is traced to the first packet after which the state differs by replaying the tick;
+# if there is no such packet, it arose at the end of a subtick or of the tick, and packet_index is None
+def compare(param_filename: str, reference: dict, candidate: dict, end_tick: int = None) -> dict | None:
+    result = run_experiments(param_filename, reference, candidate, end_tick)
+    if result is None or result["kind"] != "state":
+        return result
+    return run_experiments(param_filename, reference, candidate, result["tick"] + 1, result["tick"]) or result
+
+def simulations(param_filename: str, reference: dict, candidate: dict) -> tuple[dict[str, run_sim.Simulation], dict]:
+    sims = {}
+    random_state = {}
+    for name, overrides in [("reference", reference), ("candidate", candidate)]:
+        sims[name] = run_sim.Simulation(params.Params(param_filename, overrides))
+        sims[name].pbar = tqdm(disable=True)
+        random_state[name] = random.getstate()     # each simulation generates traffic from its own copy of the seeded random
+    return sims, random_state
+
+# Same seeded experiment with both configurations; the state is compared after every packet of replay_tick
+def run_experiments(param_filename: str, reference: dict, candidate: dict, end_tick: int = None, replay_tick: int = None) -> dict | None:
+    sims, random_state = simulations(param_filename, reference, candidate)
+    ref, cand = sims["reference"], sims["candidate"]
+    num_tick = min(ref.num_tick, cand.num_tick) if end_tick is None else min(end_tick, ref.num_tick, cand.num_tick)
+    try:
+        return run_lockstep(sims, random_state, num_tick, replay_tick)
+    finally:
+        for sim in sims.values():
+            sim.cerb.close()
+
+def divergence(kind: str, tick: int, subtick: int | None, index: int | None, where: str, reference_value, candidate_value, **context) -> dict:
+    return {"kind": kind, "tick": tick, "subtick": subtick, "packet_index": index, "where": where,
+            "reference": reference_value, "candidate": candidate_value} | context
+
+def run_lockstep(sims: dict[str, run_sim.Simulation], random_state: dict, num_tick: int, replay_tick: int = None) -> dict | None:
+    ref, cand = sims["reference"], sims["candidate"]
+    tick_divisor = ref.param.tick_divisor
+    for tick in range(num_tick):
+        if tick == replay_tick:     # e.g., sketches of different sizes differ from the start
+            difference = first_difference(state(ref, False), state(cand, False))
+            if difference:
+                return divergence("state", tick, None, None, *difference)
+        for subtick in range(tick_divisor):
+            current_subtick = tick * tick_divisor + subtick
+            for name, sim in sims.items():
+                random.setstate(random_state[name])
+                sim.generator.generate(current_subtick)
+                random_state[name] = random.getstate()
+            ref_traffic, cand_traffic = ref.generator.traffic[current_subtick], cand.generator.traffic[current_subtick]
+            difference = first_difference([packet_context(p) for p in ref_traffic], [packet_context(p) for p in cand_traffic], "traffic")
+            if difference:
+                return divergence("traffic", tick, current_subtick, None, *difference)
+
+            for sim in sims.values():
+                sim.begin_subtick(current_subtick)
+            for index, (ref_packet, cand_packet) in enumerate(zip(ref_traffic, cand_traffic)):
+                ref.process_packet(ref_packet, current_subtick)
+                cand.process_packet(cand_packet, current_subtick)
+                difference = first_difference(packet_state(ref), packet_state(cand), "packet")
+                if difference:
+                    # full context: the packet, its results in both simulations and the first difference of the whole state
+                    return divergence("packet", tick, current_subtick, index, *difference, packet=packet_context(ref_packet),
+                                      reference_packet_state=packet_state(ref), candidate_packet_state=packet_state(cand),
+                                      state_difference=first_difference(state(ref, False), state(cand, False)))
+                if tick == replay_tick:
+                    ref_state, cand_state = state(ref, False), state(cand, False)
+                    if ref_state != cand_state:
+                        return divergence("state", tick, current_subtick, index, *first_difference(ref_state, cand_state), packet=packet_context(ref_packet))
+            for sim in sims.values():
+                sim.end_subtick(current_subtick)
+                sim.generator.delete_traffic(current_subtick)
+            if tick == replay_tick:
+                difference = first_difference(state(ref, False), state(cand, False))
+                if difference:
+                    return divergence("state", tick, current_subtick, None, *difference)
+
+        for sim in sims.values():
+            sim.end_tick(tick)
+        difference = first_difference(state(ref), state(cand))
+        if difference:
+            return divergence("state", tick, None, None, *difference)
+    return None
+
+############################################
+# Unit Test
+############################################
+class TestDifferential(unittest.TestCase):
+    def test_first_difference(self):
+        self.assertIsNone(first_difference({"a": [1, 2], "b": {}}, {"a": [1, 2], "b": {}}))
+        self.assertEqual(first_difference({"a": [1, [2, 3]]}, {"a": [1, [2, 4]]}), ("['a'][1][1]", 3, 4))
+        self.assertEqual(first_difference([1], [1, 2]), (" (length)", 1, 2))
+
+    def test_compare(self):
+        overrides = {"atk_profile": "1_5_11_13 small", "shrink_ratio_exp": 8}
+        # stage timers don't change results
+        self.assertIsNone(compare("1_5_11_13", overrides, overrides | {"profile": True}, end_tick=2))
+        divergence = compare("1_5_11_13", overrides, overrides | {"rng": "streams"}, end_tick=2)
+        self.assertEqual((divergence["kind"], divergence["tick"], divergence["subtick"]), ("traffic", 0, 0))
+        # without the control plane, a blocked packet is not installed into the blocklist
+        divergence = compare("1_5_11_13", overrides, overrides | {"cp_processing_threshold": 0}, end_tick=2)
+        self.assertEqual((divergence["kind"], divergence["packet_index"], divergence["where"]), ("packet", 1, "packet['blocked'][1]"))
+        self.assertEqual(divergence["state_difference"][0], "['blocklist[0]'][0][60717]")
+        divergence = compare("1_5_11_13", overrides, overrides | {"blocklist_size": 12}, end_tick=2)
+        self.assertEqual((divergence["kind"], divergence["tick"], divergence["packet_index"], divergence["where"]), ("state", 0, None, "['blocklist[0]'][0] (length)"))
+        # window of task 0 changes at the end of tick 0, not after a packet
+        small = overrides | {"blocklist_size": 12}     # the tick is replayed with the whole state compared after every packet
+        divergence = compare("1_5_11_13", small, small | {"refresh_cycle": [1, 4, 4, 4]}, end_tick=2)
+        self.assertEqual((divergence["kind"], divergence["tick"], divergence["packet_index"], divergence["where"]), ("state", 0, None, "['cerberus.current_window'][0]"))
+
+    # A state difference that doesn't change the results of packets is traced to its packet
+    def test_replay(self):
+        overrides = {"atk_profile": "1_5_11_13 small", "shrink_ratio_exp": 8}
+        for replay_tick in [None, 0]:
+            sims, random_state = simulations("1_5_11_13", overrides, overrides)
+            cerb = sims["candidate"].cerb
+            update = cerb.update
+            packets = []
+            def update_cb(p):
+                if len(packets) == 10:
+                    cerb.cb[0] += 1
+                packets.append(p)
+                return update(p)
+            cerb.update = update_cb
+            divergence = run_lockstep(sims, random_state, 1, replay_tick)
+            for sim in sims.values():
+                sim.cerb.close()
+            if replay_tick is None:
+                self.assertEqual((divergence["kind"], divergence["packet_index"]), ("state", None))
+            else:
+                self.assertEqual((divergence["kind"], divergence["subtick"], divergence["packet_index"], divergence["where"]), ("state", 0, 10, "['cerberus.cb'][0]"))
+                self.assertIn("src_ip", divergence["packet"])
+
+if __name__ == '__main__':
+    # usage: python3 differential.py <param_filename> <candidate.json> [reference.json] [--ticks=N]
+    # candidate.json, reference.json: overrides of the params file, e.g., {"loop_engine": "vectorized"}; the reference defaults to the params file itself
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--ticks=")]
+    ticks = [int(arg[len("--ticks="):]) for arg in sys.argv[1:] if arg.startswith("--ticks=")]
+    if len(args) < 2:
+        print(f"Usage: {sys.argv[0]} <param_filename> <candidate.json> [reference.json] [--ticks=N]", file=sys.stderr)
+        sys.exit(1)
+    overrides = []
+    for path in args[1:3]:
+        with open(path, mode="r") as j_object:
+            overrides.append(json.load(j_object))
+    candidate, reference = overrides[0], overrides[1] if len(overrides) > 1 else {}
+
+    print(f"Started differential test of {args[0]} at {datetime.now()}", flush=True)
+    result = compare(args[0], reference, candidate, ticks[0] if ticks else None)
+    if result is None:
+        print("No divergence", flush=True)
+    else:
+        print(json.dumps(result, indent=4, default=repr), flush=True)
+    print(f"Finished differential test of {args[0]} at {datetime.now()}", flush=True)
+    sys.exit(0 if result is None else 1)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from common import *
+from functools import lru_cache
+import crcmod.predefined
+import heapq
+import unittest
+
+# independent of the hash functions of sketches; cached since flows out of the sample are hashed again on each of their packets
+sample_hash = lru_cache(maxsize=60000)(crcmod.predefined.mkCrcFun("crc-64"))
+
+class GroundTruth:
+    # Exact value of every flow in the current window of each task.
+    # Flow keys are interned to flow IDs, and values are kept in growable arrays indexed by flow ID.
+    # Updates are buffered per packet and applied in bulk by flush().
+    # If sample_size > 0, only the sample_size flows with the smallest sample hash (bottom-k sampling) are tracked.
+    # A flow is tracked from its first packet or never, since the sampling threshold only decreases within a window.
+    def __init__(self, flowkey_table: dict, initial_size: int = 1024, sample_size: int = 0):
+        self.initial_size = initial_size if sample_size == 0 else min(initial_size, sample_size)
+        self.sample_size = sample_size
+        self.operations = {task_id: flowkey_table[task_id][2] for task_id in flowkey_table}
+        self.flow_id = {task_id: {} for task_id in flowkey_table}    # flow key: flow ID
+        self.values = {task_id: np.zeros(self.initial_size, dtype=np.int64) for task_id in flowkey_table}
+        self.pending_id = {task_id: [] for task_id in flowkey_table}
+        self.pending_amount = {task_id: [] for task_id in flowkey_table}
+        self.sample = {task_id: [] for task_id in flowkey_table}    # max-heap of (-sample hash, flow key)
+        self.key_bytes = {task_id: 0 for task_id in flowkey_table}  # total size of interned flow keys
+
+    def add(self, task_id: int, flow_key: bytes, amount: int):
+        flow_id = self.flow_id[task_id]
+        if flow_key not in flow_id:
+            if self.sample_size:
+                if not self.admit(task_id, flow_key):
+                    return
+            else:
+                flow_id[flow_key] = len(flow_id)
+                self.key_bytes[task_id] += sys.getsizeof(flow_key)
+        self.pending_id[task_id].append(flow_id[flow_key])
+        self.pending_amount[task_id].append(amount)
+
+    def admit(self, task_id: int, flow_key: bytes) -> bool:
+        flow_id = self.flow_id[task_id]
+        sample = self.sample[task_id]
+        h = sample_hash(flow_key)
+        if len(sample) < self.sample_size:
+            heapq.heappush(sample, (-h, flow_key))
+            flow_id[flow_key] = len(flow_id)
+            self.key_bytes[task_id] += sys.getsizeof(flow_key)
+            return True
+        if h >= -sample[0][0]:
+            return False
+        # evict the flow with the largest hash and reuse its flow ID
+        self.flush()
+        _, evicted = heapq.heapreplace(sample, (-h, flow_key))
+        flow_id[flow_key] = flow_id.pop(evicted)
+        self.values[task_id][flow_id[flow_key]] = 0
+        self.key_bytes[task_id] += sys.getsizeof(flow_key) - sys.getsizeof(evicted)
+        return True
+
+    def flush(self):
+        for task_id in self.pending_id:
+            if not self.pending_id[task_id]:
+                continue
+            n_flow = len(self.flow_id[task_id])
+            if n_flow > len(self.values[task_id]):
+                size = max(2*len(self.values[task_id]), n_flow)
+                if self.sample_size:
+                    size = min(size, self.sample_size)
+                values = np.zeros(size, dtype=np.int64)
+                values[:len(self.values[task_id])] = self.values[task_id]
+                self.values[task_id] = values
+            apply_operations(self.values[task_id], self.operations[task_id], np.array(self.pending_id[task_id], dtype=np.int64), np.array(self.pending_amount[task_id], dtype=np.int64))
+            self.pending_id[task_id] = []
+            self.pending_amount[task_id] = []
+
+    # Returns flow keys and their values
+    def flows(self, task_id: int) -> tuple[list[bytes], np.ndarray]:
+        self.flush()
+        if self.sample_size:
+            return list(self.flow_id[task_id]), self.values[task_id][np.fromiter(self.flow_id[task_id].values(), dtype=np.int64, count=len(self.flow_id[task_id]))]
+        return list(self.flow_id[task_id]), self.values[task_id][:len(self.flow_id[task_id])]
+
+    def get(self, task_id: int, flow_key: bytes) -> int:
+        self.flush()
+        return int(self.values[task_id][self.flow_id[task_id][flow_key]])
+
+    def memory_usage(self) -> int:
+        size = 0
+        for task_id in self.flow_id:
+            size += sys.getsizeof(self.flow_id[task_id]) + self.key_bytes[task_id] + self.values[task_id].nbytes
+            size += list_memory_usage(len(self.pending_id[task_id])) + list_memory_usage(len(self.pending_amount[task_id]))
+            size += list_memory_usage(len(self.sample[task_id])) + len(self.sample[task_id]) * sys.getsizeof((0, None))
+        return size
+
+    def n_flow(self, task_id: int) -> int:
+        return len(self.flow_id[task_id])
+
+    # Forget the window of the task and release its memory
+    def clear(self, task_id: int):
+        self.flow_id[task_id] = {}
+        self.values[task_id] = np.zeros(self.initial_size, dtype=np.int64)
+        self.pending_id[task_id] = []
+        self.pending_amount[task_id] = []
+        self.sample[task_id] = []
+        self.key_bytes[task_id] = 0
+
+def apply_operations(values: np.ndarray, operations: list[str], ids: np.ndarray, amounts: np.ndarray):
+    if all(operation in ["plus", "minus"] for operation in operations):
+        sign = operations.count("plus") - operations.count("minus")
+        np.add.at(values, ids, amounts * sign)
+    elif all(operation == "setbitTrue" for operation in operations):
+        np.bitwise_or.at(values, ids, amounts)
+    elif all(operation == "setbitFalse" for operation in operations):
+        # the last update of each flow wins
+        _, last = np.unique(ids[::-1], return_index=True)
+        values[ids[::-1][last]] = amounts[::-1][last]
+    else:
+        for flow_id, amount in zip(ids.tolist(), amounts.tolist()):
+            value = int(values[flow_id])
+            for operation in operations:
+                if operation == "plus":
+                    value += amount
+                elif operation == "minus":
+                    value -= amount
+                elif operation == "setbitTrue":
+                    value |= amount
+                elif operation == "setbitFalse":
+                    value = amount
+                else:
+                    raise ValueError(f"Incorrect operation: {operation}")
+            values[flow_id] = value
+
+############################################
+# Unit Test
+############################################
+class TestGroundTruth(unittest.TestCase):
+    def test_operations(self):
+        operations = [["plus"], ["minus"], ["setbitTrue"], ["setbitFalse"], ["plus", "setbitTrue"]]
+        flowkey_table = {task_id: [None, None, operations[task_id], 1, False] for task_id in range(len(operations))}
+        truth = GroundTruth(flowkey_table, 4)
+        expected = {task_id: {} for task_id in flowkey_table}
+        elements = [x.encode() for x in gen_string(20)]
+        for _ in range(500):
+            element = choice(elements)
+            amount = randint(1, 8)
+            for task_id in flowkey_table:
+                truth.add(task_id, element, amount)
+                value = expected[task_id].get(element, 0)
+                for operation in operations[task_id]:
+                    if operation == "plus":
+                        value += amount
+                    elif operation == "minus":
+                        value -= amount
+                    elif operation == "setbitTrue":
+                        value |= amount
+                    else:
+                        value = amount
+                expected[task_id][element] = value
+            if randint(0, 10) == 0:
+                truth.flush()
+        for task_id in flowkey_table:
+            keys, values = truth.flows(task_id)
+            self.assertEqual(dict(zip(keys, values.tolist())), expected[task_id])
+        truth.clear(0)
+        self.assertEqual(truth.n_flow(0), 0)
+
+    def test_sample(self):
+        flowkey_table = {0: [None, None, ["plus"], 1, False]}
+        truth = GroundTruth(flowkey_table, 4, 16)
+        expected = {}
+        elements = [x.encode() for x in gen_string(200)]
+        for _ in range(2000):
+            element = choice(elements)
+            truth.add(0, element, 1)
+            expected[element] = expected.get(element, 0) + 1
+        sampled = sorted(expected, key=sample_hash)[:16]
+        keys, values = truth.flows(0)
+        self.assertEqual(dict(zip(keys, values.tolist())), {element: expected[element] for element in sampled})
+        self.assertLessEqual(len(truth.values[0]), 16)
+
+if __name__ == '__main__':
+    unittest.main()
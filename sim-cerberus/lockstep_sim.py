@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import run_sim
+import cerberus
+import params
+from datetime import datetime
+from tqdm import tqdm
+import time
+import random
+import json
+import sys
+
+# Parameters that decide the generated traffic; variants in lockstep must agree on them
+traffic_params = ["shrink_ratio_exp", "pcap_file", "benign_volume", "attack_volume", "atk_profile", "benign_unique_flowkey", "attack_unique_ip",
+                  "tick_divisor", "attack_start_subtick", "attack_tick_to_subtick", "seed", "loop_engine", "population", "rng"]
+
+class FlowkeyMemo:
+    # Flow keys of the current packet, shared by all Cerberus instances
+    # Condition and task keys are interned, so that equal keys of different instances have the same id
+    def __init__(self):
+        self.interned = {}
+        self.memo = {}
+
+    def intern(self, key: list) -> list:
+        return self.interned.setdefault(repr(key), key)
+
+    def clear(self):
+        self.memo.clear()
+
+    def find_flowkey(self, condition_keys: list[list], task_key: list[str], p) -> tuple[bool, bytes]:
+        key = (id(condition_keys), id(task_key))
+        if key not in self.memo:
+            self.memo[key] = cerberus.find_flowkey(condition_keys, task_key, p)
+        return self.memo[key]
+
+    def attach(self, cerb: cerberus.Cerberus):
+        for table in [cerb.flowkey_table, cerb.defense_table]:
+            for task_id in table:
+                entry = list(table[task_id])
+                entry[0], entry[1] = self.intern(entry[0]), self.intern(entry[1])
+                table[task_id] = entry
+        cerb.find_flowkey = self.find_flowkey
+
+# Check that all variants generate the same traffic
+def validate_variants(variant_params: dict[str, params.Params], generator) -> None:
+    names = list(variant_params)
+    base = variant_params[names[0]]
+    # refresh cycle changes the IPs of loop attacks
+    loop_attacks = [atk.split("/")[0] for atk in generator.loop_size if any(generator.loop_size[atk])]
+    base_refresh = refresh_cycle_per_attack(base)
+    for name in names[1:]:
+        param = variant_params[name]
+        changed = [key for key in traffic_params if getattr(param, key) != getattr(base, key)]
+        refresh = refresh_cycle_per_attack(param)
+        changed += [f"refresh_cycle ({atk})" for atk in loop_attacks if refresh.get(atk) != base_refresh.get(atk)]
+        if changed:
+            raise ValueError(f"Variant {name} changes traffic of variant {names[0]}: {changed}")
+
+def refresh_cycle_per_attack(param: params.Params) -> dict[str, int]:
+    return {run_sim.defense_dict[param.task_match_action_table[i]['defense_no']]: param.refresh_cycle[i] for i in param.task_match_action_table}
+
+# Generate each subtick once and feed every packet to all variants before the next packet
+# variants: {variant name: overrides of the params file}; results are saved as "<exp_name> <variant name>"
+def main(param_filename: str, exp_name: str, variants: dict[str, dict]) -> dict[str, str]:
+    variant_params = {name: params.Params(param_filename, variants[name]) for name in variants}
+    sims = {}
+    for name in variants:
+        sims[name] = run_sim.Simulation(variant_params[name], sims[next(iter(sims))].generator if sims else None)
+    generator = next(iter(sims.values())).generator
+    validate_variants(variant_params, generator)
+    random.seed(next(iter(variant_params.values())).seed)
+
+    memo = FlowkeyMemo()
+    for sim in sims.values():
+        memo.attach(sim.cerb)
+        sim.pbar = tqdm(disable=True)
+    num_tick = max(sim.num_tick for sim in sims.values())
+    tick_divisor = generator.tick_divisor
+    pbar = tqdm(total=next(iter(sims.values())).expected_total_bytes())
+    for tick in range(num_tick):
+        for subtick in range(tick_divisor):
+            current_subtick = tick * tick_divisor + subtick
+            generator.generate(current_subtick)
+            for sim in sims.values():
+                sim.begin_subtick(current_subtick)
+            for p in generator.traffic[current_subtick]:
+                memo.clear()
+                for sim in sims.values():
+                    sim.process_packet(p, current_subtick)
+                pbar.update(p.packet_size)
+            for sim in sims.values():
+                sim.end_subtick(current_subtick)
+            generator.delete_traffic(current_subtick)
+        for sim in sims.values():
+            sim.end_tick(tick)
+    pbar.close()
+
+    return {name: sims[name].save(param_filename, f"{exp_name} {name}") for name in sims}
+
+if __name__ == '__main__':
+    # usage: python3 lockstep_sim.py <param_filename> <exp_name> <variants.json>
+    # variants.json: {"variant name": {"reg_alloc_table": {...}, "adaptive_memory": false, ...}, ...}
+    if len(sys.argv) < 4:
+        print(f"Usage: {sys.argv[0]} <param_filename> <exp_name> <variants.json>", file=sys.stderr)
+        sys.exit(1)
+    param_filename, exp_name = sys.argv[1], sys.argv[2]
+    with open(sys.argv[3], mode="r") as j_object:
+        variants = json.load(j_object)
+
+    print(f"Started lockstep {param_filename} {exp_name} with {len(variants)} variants at {datetime.now()}", flush=True)
+    start_time = time.time()
+    main(param_filename, exp_name, variants)
+    elapsed_time = time.time() - start_time
+    hours, rem = divmod(elapsed_time, 3600)
+    minutes, seconds = divmod(rem, 60)
+    print(f"Execution time: {int(hours):02}:{int(minutes):02}:{seconds:05.2f}", flush=True)
+    print(f"Finished lockstep {param_filename} {exp_name} at {datetime.now()}", flush=True)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from packet import attack_generator as gen
+from datetime import datetime
+import hashlib
+import shutil
+import socket
+import json
+import glob
+import ast
+import os
+import unittest
+
+sim_dir = os.path.dirname(os.path.realpath(__file__))
+manifest_dir = "results/manifest"
+
+# Local modules imported by run_sim, directly or indirectly
+def simulator_files(entry: str = "run_sim.py") -> list[str]:
+    files = []
+    todo = [os.path.join(sim_dir, entry)]
+    while todo:
+        path = todo.pop()
+        if path in files:
+            continue
+        files.append(path)
+        with open(path, "r") as f:
+            tree = ast.parse(f.read())
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names.append(node.module)
+                names += [f"{node.module}.{alias.name}" for alias in node.names]
+        for name in names:
+            module = os.path.join(sim_dir, *name.split(".")) + ".py"
+            if os.path.exists(module):
+                todo.append(module)
+    return sorted(files)
+
+# Hash of the simulator source code; tools around run_sim (sweeps, schedulers) don't change results
+def code_version() -> str:
+    h = hashlib.sha256()
+    for path in simulator_files():
+        h.update(os.path.relpath(path, sim_dir).encode())
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def without_comments(value):
+    if isinstance(value, dict):
+        return {k: without_comments(v) for k, v in value.items() if k != "__comment__"}
+    if isinstance(value, list):
+        return [without_comments(v) for v in value]
+    return value
+
+# Content address of an experiment: its params (contents of the params file) with the attack profile itself instead of its file name, and the simulator code
+# Comments don't count, so the same experiment in differently named sweeps has the same key
+def experiment_key(setting: dict, version: str = None) -> str:
+    setting = dict(setting)
+    setting["atk_profile"] = gen.load_attack_profile(setting["atk_profile"])
+    h = hashlib.sha256()
+    h.update(json.dumps(without_comments(setting), sort_keys=True).encode())
+    h.update((version or code_version()).encode())
+    return h.hexdigest()
+
+class Manifest:
+    # Status of experiments by content address, one JSON file per experiment so that nodes sharing results/ don't conflict
+    # An experiment is done only if its run finished saving; a crash leaves it "running" and it is run again
+    def __init__(self, path: str = manifest_dir):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        try:
+            with open(self.file(key), mode="r") as j_object:
+                return json.load(j_object)
+        except FileNotFoundError:
+            return None
+
+    def record(self, key: str, **entry):
+        entry["updated"] = str(datetime.now())
+        entry["node"] = socket.gethostname()
+        with open(f"{self.file(key)}.{os.getpid()}.tmp", "w") as j_object:
+            json.dump(entry, j_object, indent=4)
+        os.replace(f"{self.file(key)}.{os.getpid()}.tmp", self.file(key))
+
+    def start(self, key: str, param_filename: str, exp_name: str):
+        self.record(key, status="running", param_filename=param_filename, exp_name=exp_name)
+
+    def finish(self, key: str, param_filename: str, exp_name: str, results: str, seconds: float):
+        self.record(key, status="done", param_filename=param_filename, exp_name=exp_name, results=results, seconds=seconds)
+
+    def fail(self, key: str, param_filename: str, exp_name: str, error: str):
+        self.record(key, status="failed", param_filename=param_filename, exp_name=exp_name, error=error)
+
+    # Results made available under another setting by reuse_results, so that they are not taken for results of sweeps before the manifest
+    def reused(self, key: str, results: str):
+        entry = self.get(key)
+        if results not in entry.setdefault("reused", []):
+            entry["reused"].append(results)
+            self.record(key, **entry)
+
+    def entries(self) -> list[dict]:
+        entries = []
+        for path in glob.glob(os.path.join(glob.escape(self.path), "*.json")):
+            try:
+                with open(path, mode="r") as j_object:
+                    entries.append(json.load(j_object))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return entries
+
+    # Results filenames recorded by any entry, including reused ones
+    def recorded_results(self) -> set[str]:
+        recorded = set()
+        for entry in self.entries():
+            recorded.update([entry["results"]] if "results" in entry else [])
+            recorded.update(entry.get("reused", []))
+        return recorded
+
+    # Results of a setting saved before the manifest was kept, i.e., not in recorded (see recorded_results); like the old check, any saved run of the setting counts
+    # They are recorded as done under key, so that later sweeps reuse them through the manifest
+    def adopt(self, key: str, param_filename: str, exp_name: str, recorded: set[str]) -> str | None:
+        prefix = f"results/{param_filename} {exp_name} "
+        candidates = [path[:-len(".json")] for path in glob.glob(f"{glob.escape(prefix)}*.json") if not path.endswith(" params.json")]
+        legacy = sorted(results for results in candidates if results not in recorded)
+        if not legacy:
+            return None
+        self.record(key, status="done", param_filename=param_filename, exp_name=exp_name, results=legacy[-1], seconds=None, adopted=True)
+        recorded.add(legacy[-1])
+        return legacy[-1]
+
+    # Results filename of a completed experiment whose results still exist
+    def completed(self, key: str) -> str | None:
+        entry = self.get(key)
+        if entry and entry["status"] == "done" and os.path.exists(f"{entry['results']}.json"):
+            return entry["results"]
+        return None
+
+# Make results of the same experiment available under another setting and experiment name, by hard links (or copies)
+def reuse_results(results: str, param_filename: str, exp_name: str) -> str:
+    prefix = f"results/{param_filename} {exp_name} "
+    if results.startswith(prefix):
+        return results
+    target = prefix + " ".join(results.rsplit(" ", 2)[-2:])  # keep the date and time of the run
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    for path in glob.glob(f"{glob.escape(results)}*"):
+        new_path = target + path[len(results):]
+        if os.path.exists(new_path):
+            continue
+        try:
+            os.link(path, new_path)
+        except OSError:
+            shutil.copyfile(path, new_path)
+    return target
+
+############################################
+# Unit Test
+############################################
+class TestManifest(unittest.TestCase):
+    def test_simulator_files(self):
+        files = [os.path.relpath(path, sim_dir) for path in simulator_files()]
+        self.assertIn("cerberus.py", files)
+        self.assertIn(os.path.join("packet", "attack_generator.py"), files)
+        self.assertNotIn("run_multiple_comb.py", files)
+
+    def test_key(self):
+        setting = {"__comment__": "a", "task_match_action_table": {"0": {"__comment__": "ICMP flood", "defense_no": 1}}, "atk_profile": [{"tick": 0}]}
+        other = {"task_match_action_table": {"0": {"defense_no": 1}}, "atk_profile": [{"tick": 0}]}
+        self.assertEqual(experiment_key(setting, "v"), experiment_key(other, "v"))
+        self.assertNotEqual(experiment_key(setting, "v"), experiment_key(setting, "w"))
+
+    def test_status(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as path:
+            manifest = Manifest(os.path.join(path, "manifest"))
+            results = os.path.join(path, "1_5 exp 2026-01-01 00;00;00.000000")
+            manifest.start("key", "1_5", "exp")
+            self.assertIsNone(manifest.completed("key"))
+            manifest.finish("key", "1_5", "exp", results, 1.0)
+            self.assertIsNone(manifest.completed("key"))    # results were deleted
+            with open(f"{results}.json", "w") as f:
+                f.write("{}")
+            self.assertEqual(manifest.completed("key"), results)
+
+    def test_adopt(self):
+        import tempfile
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as path:
+            os.chdir(path)
+            try:
+                manifest = Manifest()
+                os.makedirs("results/comb")
+                for name in ["1_5 exp 2026-01-01 00;00;00.000000", "1_5 exp 2026-01-01 00;00;00.000000 params", "1_5 exp 2026-01-02 00;00;00.000000", "1_11 exp 2026-01-03 00;00;00.000000"]:
+                    with open(f"results/comb/{name}.json", "w") as f:
+                        f.write("{}")
+                recorded = manifest.recorded_results()
+                self.assertIsNone(manifest.adopt("key", "comb/5_11", "exp", recorded))
+                self.assertEqual(manifest.adopt("key", "comb/1_5", "exp", recorded), "results/comb/1_5 exp 2026-01-02 00;00;00.000000")
+                self.assertEqual(manifest.completed("key"), "results/comb/1_5 exp 2026-01-02 00;00;00.000000")
+                # results recorded by the manifest are not adopted again, e.g., after the code changed
+                self.assertEqual(manifest.adopt("new key", "comb/1_5", "exp", manifest.recorded_results()), "results/comb/1_5 exp 2026-01-01 00;00;00.000000")
+                self.assertIsNone(manifest.adopt("newer key", "comb/1_5", "exp", manifest.recorded_results()))
+                # nor are results reused by another sweep
+                reused = reuse_results("results/comb/1_5 exp 2026-01-02 00;00;00.000000", "other/1", "other")
+                manifest.reused("key", reused)
+                self.assertIsNone(manifest.adopt("newer key", "other/1", "other", manifest.recorded_results()))
+            finally:
+                os.chdir(cwd)
+
+if __name__ == '__main__':
+    unittest.main()
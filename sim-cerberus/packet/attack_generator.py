@@ -8,39 +8,56 @@ except ImportError:
 from typing import List, Dict
 import unittest
 import math
-from random import randint, choice, choices, random
+from random import Random, getrandbits
+from bisect import bisect_right
+import numpy as np
+import array
+import hashlib
+import pickle
+import json
 import os
+import sys
 import yaml
 
 largest_psize, smallest_psize = 1518, 64
+loop_engines = ["sequential", "vectorized"]
+populations = ["python", "numpy"]
+population_dir = "cache/population"         # relative to the working directory, like checkpoints/
+compiled_profile_dir = "cache/atk_profile"   # relative to the working directory, like checkpoints/
+rng_modes = ["global", "streams"]
+global_random = getrandbits.__self__        # instance behind the functions of random, seeded by random.seed()
+
+class RandomStreams:
+    # Named random streams of the components of traffic generation (benign flow choice, each attack, ...)
+    # Each stream is seeded from the seed and its name by a NumPy SeedSequence, so a stream doesn't depend on how often other components draw
+    # Without a seed, every stream is the global random, as before streams existed
+    def __init__(self, seed: int | None = None):
+        self.seed = seed
+        self.streams: dict[str, Random] = {}
+
+    def get(self, name: str) -> Random:
+        if self.seed is None:
+            return global_random
+        if name not in self.streams:
+            state = np.random.SeedSequence(self.seed, spawn_key=tuple(name.encode())).generate_state(4, dtype=np.uint64)
+            self.streams[name] = Random(int.from_bytes(state.tobytes(), "little"))
+        return self.streams[name]
+
+    def numpy(self, name: str) -> np.random.Generator:
+        return np.random.default_rng(self.get(name).getrandbits(64))
+
+global_streams = RandomStreams()
 
 class AttackGenerator:
-    def __init__(self, benign_unique_flowkey: int, attack_unique_ip: int, atk_profile_yaml: str, benign_volume, attack_volume, refresh_cycle_per_attack: dict[str, int], tick_divisor: int, attack_tick_to_subtick: int, attack_start_subtick: int):
-        self.attack_profile = parse_attack_profile(atk_profile_yaml)
-        self.attack_dict = {
-            "Benign"        : benign,
-            "ICMP flood"    : icmp_flood,
-            "Smurf attack"  : smurf_attack,
-            "Coremelt"      : coremelt,
-            "DNS amp"       : dns_amp,
-            "UDP flood"     : udp_flood,
-            "DNS flood"     : dns_flood,
-            "NTP amp"       : ntp_amp,
-            "SSDP amp"      : ssdp_amp,
-            "Memcached amp" : memcached_amp,
-            "QUIC amp"      : quic_amp,
-            "HTTP flood"    : http_flood,
-            "Slowloris"     : slowloris,
-            "SYN flood"     : syn_flood,
-            "ACK flood"     : ack_flood,
-            "RST FIN flood" : rst_fin_flood
-        }
-        self.attack_key = list(dict.fromkeys(sum([[get_key(x) for x in d['attacks']] if get_key(d) == 'attacks' else [] for d in self.attack_profile], [])))
+    def __init__(self, benign_unique_flowkey: int, attack_unique_ip: int, atk_profile_yaml: str, benign_volume, attack_volume, refresh_cycle_per_attack: dict[str, int], tick_divisor: int, attack_tick_to_subtick: int, attack_start_subtick: int, loop_engine: str = "sequential", population: str = "python", rng: str = "global", rng_seed: int = None):
+        self.attack_profile = load_attack_profile(atk_profile_yaml)
+        self.attack_dict = attack_functions
+        self.attack_key = get_attack_key(self.attack_profile)
         self.attack_str_key = []
         for atk in self.attack_key:
             atk_str = atk.split("/")[0]
             if atk_str not in self.attack_dict:
-                raise ValueError(f"Invalid attack exists in attack profile '{atk_profile_yaml}.yaml': {atk}")
+                raise ValueError(f"Invalid attack exists in attack profile {repr(atk_profile_yaml + '.yaml') if isinstance(atk_profile_yaml, str) else '(in memory)'}: {atk}")
             if atk_str not in self.attack_str_key:
                 self.attack_str_key.append(atk_str)
         self.attack_key = sorted(self.attack_key, key=lambda x: list(self.attack_dict.keys()).index(x.split("/")[0]))
@@ -48,22 +65,45 @@ class AttackGenerator:
 
         self.benign_volume = benign_volume  # Gbps
         self.attack_volume = attack_volume  # Gbps
-        self.max_tick, self.ratio, self.rate, self.seq_size, self.seq_count, self.seq_ratio, self.loop_size, self.loop_count, self.loop_ratio, self.loop_rate \
-            = get_rate(self.attack_profile, self.attack_key, self.attack_volume, attack_tick_to_subtick, attack_start_subtick)  # rate in B
+        self.max_tick, self.ratio, self.rate, self.seq_size, self.seq_count, self.seq_ratio, self.loop_size, self.loop_count, self.loop_ratio, self.loop_rate, \
+            self.attack_ip_division, self.attack_seq_ip_division, self.attack_loop_ip_division \
+            = compile_attack_profile(self.attack_profile, self.attack_key, self.attack_volume, attack_tick_to_subtick, attack_start_subtick, attack_unique_ip)  # rate in B
         self.benign_byte_used = {}
         self.refresh_cycle_per_attack = refresh_cycle_per_attack
         self.tick_divisor = tick_divisor
         self.attack_tick_to_subtick = attack_tick_to_subtick
         self.attack_start_subtick = attack_start_subtick
-
-        self.benign_flowkey = generate_benign_flowkey(benign_unique_flowkey)
-        self.benign_flowkey = [[src_ip, src_port, dst_ip, dst_port, "BEGIN", None, None] for src_ip, src_port, dst_ip, dst_port in self.benign_flowkey] # 4-tuple, TCP_state, TCP_type, TCP_dst_port
-        self.attack_ip = [[ip, [], [], -1, -1, -1] for ip in generate_attack_ip(attack_unique_ip)]   # ip, loop_size, loop_count, loop_count_index, loop_count_count, loop_last_subtick
-        self.attack_ip_division = {atk: [divide_list_by_ratio(attack_unique_ip, [l[i] - l[i-1] for i in range(len(l)) if i > 0]) for l in self.ratio[atk]] for atk in self.ratio}
-        self.attack_seq_ip_division = {atk: [divide_list_by_ratio(attack_unique_ip, [l[i] - l[i-1] for i in range(len(l)) if i > 0]) for l in self.seq_ratio[atk]] for atk in self.seq_ratio}
-        self.attack_loop_ip_division = {atk: [divide_list_by_ratio(attack_unique_ip, [l[i] - l[i-1] for i in range(len(l)) if i > 0]) for l in self.loop_ratio[atk]] for atk in self.loop_ratio}
+        if rng not in rng_modes:
+            raise ValueError(f"Invalid rng: {rng} (modes: {rng_modes})")
+        self.streams = RandomStreams(rng_seed if rng == "streams" else None)
+
+        if population not in populations:
+            raise ValueError(f"Invalid population: {population} (populations: {populations})")
+        if population == "numpy":
+            # 4-tuples are memory-mapped from a file shared by runs with the same seed, e.g., workers of a sweep
+            self.benign_flowkey = BenignPopulation(load_population("benign", benign_unique_flowkey, self.streams.get("benign population").getrandbits(64), generate_benign_flowkey_array))
+            attack_ip = load_population("attack", attack_unique_ip, self.streams.get("attack population").getrandbits(64), generate_attack_ip_array)
+            attack_ip = attack_ip.astype(">u4").tobytes()
+            self.attack_ip = [[attack_ip[i:i+4], [], [], -1, -1, -1] for i in range(0, len(attack_ip), 4)]
+        else:
+            self.benign_flowkey = generate_benign_flowkey(benign_unique_flowkey, self.streams.get("benign population"))
+            self.benign_flowkey = [[src_ip, src_port, dst_ip, dst_port, "BEGIN", None, None] for src_ip, src_port, dst_ip, dst_port in self.benign_flowkey] # 4-tuple, TCP_state, TCP_type, TCP_dst_port
+            self.attack_ip = [[ip, [], [], -1, -1, -1] for ip in generate_attack_ip(attack_unique_ip, self.streams.get("attack population"))]   # ip, loop_size, loop_count, loop_count_index, loop_count_count, loop_last_subtick
+        self.division_ip = {}       # IPs and indices of each division, built on first use; IPs of attack_ip never change
+        if loop_engine not in loop_engines:
+            raise ValueError(f"Invalid loop engine: {loop_engine} (engines: {loop_engines})")
+        self.loop_engine = loop_engine
+        if loop_engine == "vectorized":
+            # loop state of attack_ip in arrays: pattern (index of loop_patterns), position in the cycle of the pattern, last subtick
+            self.loop_patterns = []     # [(sizes, counts), sizes of each packet of the cycle]
+            self.loop_pattern_id = {}
+            self.loop_pattern = np.full(attack_unique_ip, -1, dtype=np.int64)
+            self.loop_position = np.zeros(attack_unique_ip, dtype=np.int64)
+            self.loop_last_subtick = np.full(attack_unique_ip, -1, dtype=np.int64)
+            self.loop_rng = self.streams.numpy("vectorized loop")
         self.victim_ip = pkt.ip_to_bytes("192.168.0.1")
         self.traffic: dict[int, list[pkt.Packet]] = dict()
+        self.packet_memory = 0  # estimated size of a packet, measured once
 
     def add_to_traffic(self, packet: pkt.Packet):
         tick = packet.tick
@@ -71,13 +111,22 @@ class AttackGenerator:
             self.traffic[tick] = []
         self.traffic[tick].append(packet)
 
+    # Attacker IPs and their indices in attack_ip selected by a division; the same lists are returned for the same division
+    def get_division_ip(self, attack_ip_division: list[int]) -> tuple[list[bytes], range | list[int]]:
+        key = tuple(attack_ip_division)
+        if key not in self.division_ip:
+            intervals = [range(attack_ip_division[2*i], attack_ip_division[2*i+1]) for i in range(len(attack_ip_division)//2)]
+            indices = intervals[0] if len(intervals) == 1 else [index for interval in intervals for index in interval]
+            self.division_ip[key] = ([self.attack_ip[index][0] for index in indices], indices)
+        return self.division_ip[key]
+
     # Wrapper function for iterative generation of attack traffic
     def iterative_generate(self, atk: str, initial_left_volume: float, current_subtick: int, attack_ip_division: list[int]) -> list[pkt.Packet]:
-        attack_ip = sum([[x for x, _, _, _, _, _ in self.attack_ip[attack_ip_division[2*i]: attack_ip_division[2*i+1]]] for i in range(len(attack_ip_division)//2)], [])
+        attack_ip, _ = self.get_division_ip(attack_ip_division)
         packets = []
         left_volume = initial_left_volume
         while left_volume > 0:
-            packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, attack_ip, 0)
+            packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, attack_ip, 0, self.streams)
             for p in packet_list:
                 p.count = -1
                 if p.attack_type == 0 and p.tick != current_subtick:
@@ -91,14 +140,14 @@ class AttackGenerator:
         return packets
 
     def iterative_generate_seq(self, atk: str, psize: list[int], pcount: list[int], current_subtick: int, attack_ip_division: list[int]) -> list[pkt.Packet]:
-        attack_ip = sum([[x for x, _, _, _, _, _ in self.attack_ip[attack_ip_division[2*i]: attack_ip_division[2*i+1]]] for i in range(len(attack_ip_division)//2)], [])
+        attack_ip, _ = self.get_division_ip(attack_ip_division)
         packets = []
         for i in range(len(attack_ip)):
             count = 1
             for j in range(len(psize)):
                 left_count = pcount[j]
                 while left_count > 0:
-                    packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [attack_ip[i]], psize[j])
+                    packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [attack_ip[i]], psize[j], self.streams)
                     for p in packet_list:
                         p.count = count
                         count += 1
@@ -107,14 +156,14 @@ class AttackGenerator:
         return packets
 
     def iterative_generate_seq_real(self, atk: str, psize: list[int], pcount: list[int], current_subtick: int, attack_ip_division: list[int]) -> list[list[pkt.Packet]]:
-        attack_ip = sum([[x for x, _, _, _, _, _ in self.attack_ip[attack_ip_division[2*i]: attack_ip_division[2*i+1]]] for i in range(len(attack_ip_division)//2)], [])
+        attack_ip, _ = self.get_division_ip(attack_ip_division)
         packets_list = [[] for _ in range(len(attack_ip))]
         for i in range(len(attack_ip)):
             count = 1
             for j in range(len(psize)):
                 left_count = pcount[j]
                 while left_count > 0:
-                    packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [attack_ip[i]], psize[j])
+                    packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [attack_ip[i]], psize[j], self.streams)
                     for p in packet_list:
                         p.count = count
                         count += 1
@@ -123,11 +172,12 @@ class AttackGenerator:
         return packets_list
 
     def iterative_generate_loop(self, atk: str, psize: list[int], pcount: list[int], initial_left_volume: float, current_subtick: int, attack_ip_division: list[int]) -> list[pkt.Packet]:
-        attack_ip_indices = sum([list(range(attack_ip_division[2*i], attack_ip_division[2*i+1])) for i in range(len(attack_ip_division)//2)], [])
+        _, attack_ip_indices = self.get_division_ip(attack_ip_division)
         packets = []
         left_volume = initial_left_volume
+        rng = self.streams.get(f"{atk} loop")
         while left_volume > 0 and any(x > 0 for x in pcount):
-            index = choice(attack_ip_indices)
+            index = rng.choice(attack_ip_indices)
             ip, loop_size, loop_count, loop_count_index, loop_count_count, loop_last_subtick = self.attack_ip[index]
             if loop_last_subtick != current_subtick:
                 if loop_size != psize or loop_count != pcount:
@@ -142,13 +192,67 @@ class AttackGenerator:
             loop_count_count += 1
             self.attack_ip[index] = [ip, loop_size, loop_count, loop_count_index, loop_count_count, loop_last_subtick]
 
-            packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [ip], size)
+            packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [ip], size, self.streams)
             for p in packet_list:
                 p.count = -1
                 left_volume -= p.packet_size
                 packets.append(p)
         return packets
 
+    # Same cursor semantics as iterative_generate_loop, but attacker IPs are drawn in batches and their loop state is advanced in bulk
+    # A loop position is the number of packets an IP sent since its loop was reset, modulo the packets of a cycle of the pattern
+    # Batches are no larger than the budget allows for packets of the largest size, so that the budget ends on the same packet as the sequential engine would
+    def iterative_generate_loop_vectorized(self, atk: str, psize: list[int], pcount: list[int], initial_left_volume: float, current_subtick: int, attack_ip_division: list[int]) -> list[pkt.Packet]:
+        packets = []
+        left_volume = initial_left_volume
+        if left_volume <= 0 or not any(x > 0 for x in pcount):
+            return packets
+        attack_ip, attack_ip_indices = self.get_division_ip(attack_ip_division)
+        attack_ip_indices = np.asarray(attack_ip_indices, dtype=np.int64)
+        pattern = (tuple(psize), tuple(pcount))
+        if pattern not in self.loop_pattern_id:
+            self.loop_pattern_id[pattern] = len(self.loop_patterns)
+            self.loop_patterns.append((pattern, np.repeat(psize, pcount)))
+        pattern_id = self.loop_pattern_id[pattern]
+        max_size = max(max(sizes) for _, sizes in self.loop_patterns)
+        refresh_subtick = self.tick_divisor*self.refresh_cycle_per_attack[atk]
+
+        while left_volume > 0:
+            draws = self.loop_rng.integers(0, len(attack_ip_indices), max(1, int(left_volume // max_size)))
+            indices = attack_ip_indices[draws]
+            # reset loops of IPs that send their first packet in this subtick
+            touched = np.unique(indices)
+            first = touched[self.loop_last_subtick[touched] != current_subtick]
+            changed = self.loop_pattern[first] != pattern_id
+            refreshed = self.loop_last_subtick[first] // refresh_subtick != current_subtick // refresh_subtick
+            self.loop_pattern[first[changed]] = pattern_id
+            self.loop_position[first[changed | refreshed]] = 0
+            self.loop_last_subtick[first] = current_subtick
+
+            # k-th draw of an IP in the batch sends the k-th next packet of its loop
+            order = np.argsort(indices, kind="stable")
+            sorted_indices = indices[order]
+            group_start = np.flatnonzero(np.r_[True, sorted_indices[1:] != sorted_indices[:-1]])
+            group_size = np.diff(np.r_[group_start, len(sorted_indices)])
+            rank = np.empty(len(indices), dtype=np.int64)
+            rank[order] = np.arange(len(indices)) - np.repeat(group_start, group_size)
+            ip_pattern = self.loop_pattern[indices]
+            sizes = np.empty(len(indices), dtype=np.int64)
+            for pid in np.unique(ip_pattern):
+                cycle = self.loop_patterns[pid][1]
+                selected = ip_pattern == pid
+                sizes[selected] = cycle[(self.loop_position[indices[selected]] + rank[selected]) % len(cycle)]
+            group_indices = sorted_indices[group_start]
+            self.loop_position[group_indices] = (self.loop_position[group_indices] + group_size) % np.array([len(self.loop_patterns[pid][1]) for pid in self.loop_pattern[group_indices]], dtype=np.int64)
+
+            for draw, size in zip(draws.tolist(), sizes.tolist()):
+                packet_list = self.attack_dict[atk](current_subtick, self.victim_ip, self.benign_flowkey, [attack_ip[draw]], size, self.streams)
+                for p in packet_list:
+                    p.count = -1
+                    left_volume -= p.packet_size
+                    packets.append(p)
+        return packets
+
     # Generate attack traffic based on attack profile
     def generate(self, subtick: int):
         # Generate attack traffic
@@ -160,7 +264,8 @@ class AttackGenerator:
 
                 packets_list.append(self.iterative_generate_seq(atk_str, self.seq_size[atk][subtick], self.seq_count[atk][subtick], subtick, self.attack_seq_ip_division[atk][subtick]))
                 # packets_list += self.iterative_generate_seq_real(atk_str, self.seq_size[atk][subtick], self.seq_count[atk][subtick], subtick, self.attack_seq_ip_division[atk][subtick])
-                packets_list.append(self.iterative_generate_loop(atk_str, self.loop_size[atk][subtick], self.loop_count[atk][subtick], self.loop_rate[atk][subtick], subtick, self.attack_loop_ip_division[atk][subtick]))
+                iterative_generate_loop = self.iterative_generate_loop_vectorized if self.loop_engine == "vectorized" else self.iterative_generate_loop
+                packets_list.append(iterative_generate_loop(atk_str, self.loop_size[atk][subtick], self.loop_count[atk][subtick], self.loop_rate[atk][subtick], subtick, self.attack_loop_ip_division[atk][subtick]))
 
         # Generate benign traffic
         benign_byte_volume = self.benign_volume * 125 * 1000 * 1000 / self.attack_tick_to_subtick
@@ -171,7 +276,7 @@ class AttackGenerator:
             packets_list.append(self.traffic[subtick])
         packets_list.append(benign_packets)
 
-        self.traffic[subtick] = combine_lists(packets_list)
+        self.traffic[subtick] = combine_lists(packets_list, self.streams.get("interleave"))
 
     def generate_all(self, tick_divisor: int):
         num_tick = ((self.max_tick+1)*self.attack_tick_to_subtick + self.attack_start_subtick - 1)//tick_divisor + 1
@@ -180,6 +285,14 @@ class AttackGenerator:
                 current_subtick = tick * self.attack_tick_to_subtick + subtick
                 self.generate(current_subtick)
 
+    # Estimated memory of generated traffic that is not deleted yet
+    def memory_usage(self) -> int:
+        n_packet = sum(len(packets) for packets in self.traffic.values())
+        if self.packet_memory == 0 and n_packet > 0:
+            p = next(packets[0] for packets in self.traffic.values() if packets)
+            self.packet_memory = sys.getsizeof(p) + sys.getsizeof(vars(p)) + sum(sys.getsizeof(x) for x in vars(p).values() if isinstance(x, (bytes, str)))
+        return sys.getsizeof(self.traffic) + sum(sys.getsizeof(packets) for packets in self.traffic.values()) + n_packet * self.packet_memory
+
     def delete_traffic(self, subtick: int):
         traffic = self.traffic.pop(subtick)
         traffic.clear()
@@ -188,24 +301,24 @@ class AttackGenerator:
 #  Benign Traffic  #
 ####################
 
-def benign_packet_size() -> int:
-        prob = random()
+def benign_packet_size(rng: Random = global_random) -> int:
+        prob = rng.random()
         if prob < 0.35:
-            packet_size = randint(smallest_psize, 128)
+            packet_size = rng.randint(smallest_psize, 128)
         elif prob < 0.35 + 0.20:
-            packet_size = randint(129, 512)
+            packet_size = rng.randint(129, 512)
         elif prob < 0.35 + 0.20 + 0.20:
-            packet_size = randint(513, 1023)
+            packet_size = rng.randint(513, 1023)
         elif prob < 0.35 + 0.20 + 0.20 + 0.15:
-            packet_size = randint(1024, 1280)
+            packet_size = rng.randint(1024, 1280)
         else:
-            packet_size = randint(1281, largest_psize)
+            packet_size = rng.randint(1281, largest_psize)
         return packet_size
 
 # packet_stats gave ["SYN", "SNACK", "ACK", "FIN", "RST"]: [0.04654168326127674, 0.0059460687168807575, 0.9427417974641836, 0.0, 0.004764852375948292]
 # ratio of ["SYN", "SNACK", "ACK", "FIN", "RST"]: [0.03398531571863376, 0.03334388664318601, 0.9056742604772693, 0.017182507696874554, 0.00981402946403635]
-def benign_TCP_state(tcp_state: str) -> tuple[str, bool]:
-    prob = random()
+def benign_TCP_state(tcp_state: str, rng: Random = global_random) -> tuple[str, bool]:
+    prob = rng.random()
     if tcp_state == "BEGIN" or tcp_state == "ACK_FIN2":
         return "SYN", False
     elif tcp_state == "SYN":
@@ -248,8 +361,8 @@ def benign_TCP_state(tcp_state: str) -> tuple[str, bool]:
     else:
         raise ValueError(f"No TCP state named: {tcp_state}")
 
-def benign_TCP_type(dst_port: bytes) -> tuple[str, bytes]:
-    prob = random()
+def benign_TCP_type(dst_port: bytes, rng: Random = global_random) -> tuple[str, bytes]:
+    prob = rng.random()
     if prob < 0.0008:
         return "_DNS", pkt.int_to_bytes(53, 2)
     elif prob < 0.0008 + 0.1013:
@@ -261,192 +374,228 @@ def benign_TCP_type(dst_port: bytes) -> tuple[str, bytes]:
     else:
         return "", dst_port
 
-def benign(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
-    index = choice(range(len(benign_flowkey)))
+def benign(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    flow_rng, state_rng, size_rng = streams.get("benign flow"), streams.get("benign TCP state"), streams.get("benign packet size")
+    index = flow_rng.choice(range(len(benign_flowkey)))
     src_ip, src_port, dst_ip, dst_port, old_tcp_state, tcp_type, tcp_dst_port = benign_flowkey[index]
-    prob = random()
+    prob = flow_rng.random()
     packets = []
     if prob < 0.80:
-        tcp_state, src_dst_reverse = benign_TCP_state(old_tcp_state)
+        tcp_state, src_dst_reverse = benign_TCP_state(old_tcp_state, state_rng)
         if tcp_state == "SYN":
-            tcp_type, tcp_dst_port = benign_TCP_type(dst_port)
+            tcp_type, tcp_dst_port = benign_TCP_type(dst_port, state_rng)
             benign_flowkey[index][5] = tcp_type
             benign_flowkey[index][6] = tcp_dst_port
         benign_flowkey[index][4] = tcp_state
         (src_ip, src_port, dst_ip, tcp_dst_port) = (dst_ip, tcp_dst_port, src_ip, src_port) if src_dst_reverse else (src_ip, src_port, dst_ip, tcp_dst_port)
         if old_tcp_state == "ACK" and tcp_state == "ACK":
             if tcp_type == "_DNS" or tcp_type == "_Memcached":
-                packets.append(pkt.Packet(src_ip, src_port, dst_ip, tcp_dst_port, f"TCP_{tcp_state}{tcp_type}Q", benign_packet_size(), tick, 0))
-                packets.append(pkt.Packet(dst_ip, tcp_dst_port, src_ip, src_port, f"TCP_{tcp_state}{tcp_type}R", benign_packet_size(), tick+1, 0))
+                packets.append(pkt.Packet(src_ip, src_port, dst_ip, tcp_dst_port, f"TCP_{tcp_state}{tcp_type}Q", benign_packet_size(size_rng), tick, 0))
+                packets.append(pkt.Packet(dst_ip, tcp_dst_port, src_ip, src_port, f"TCP_{tcp_state}{tcp_type}R", benign_packet_size(size_rng), tick+1, 0))
             else:
-                (src_ip, src_port, dst_ip, tcp_dst_port) = (dst_ip, tcp_dst_port, src_ip, src_port) if random() < 0.5 else (src_ip, src_port, dst_ip, tcp_dst_port)
-                packets.append(pkt.Packet(src_ip, src_port, dst_ip, tcp_dst_port, f"TCP_{tcp_state}{tcp_type}", benign_packet_size(), tick, 0))
+                (src_ip, src_port, dst_ip, tcp_dst_port) = (dst_ip, tcp_dst_port, src_ip, src_port) if flow_rng.random() < 0.5 else (src_ip, src_port, dst_ip, tcp_dst_port)
+                packets.append(pkt.Packet(src_ip, src_port, dst_ip, tcp_dst_port, f"TCP_{tcp_state}{tcp_type}", benign_packet_size(size_rng), tick, 0))
         else:
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, tcp_dst_port, f"TCP_{tcp_state}{tcp_type}", randint(smallest_psize, 80), tick, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, tcp_dst_port, f"TCP_{tcp_state}{tcp_type}", size_rng.randint(smallest_psize, 80), tick, 0))
     elif prob < 0.80 + 0.18:
-        udp_prob = random()
+        udp_prob = flow_rng.random()
         if udp_prob < 0.30:                                         # DNS
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(53, 2), "UDP_DNSQ", benign_packet_size(), tick, 0))
-            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(53, 2), src_ip, src_port, "UDP_DNSR", benign_packet_size(), tick+1, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(53, 2), "UDP_DNSQ", benign_packet_size(size_rng), tick, 0))
+            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(53, 2), src_ip, src_port, "UDP_DNSR", benign_packet_size(size_rng), tick+1, 0))
         elif udp_prob < 0.30 + 0.02:                                # QUIC1
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(80, 2), "UDP", benign_packet_size(), tick, 0))
-            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(80, 2), src_ip, src_port, "UDP", benign_packet_size(), tick+1, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(80, 2), "UDP", benign_packet_size(size_rng), tick, 0))
+            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(80, 2), src_ip, src_port, "UDP", benign_packet_size(size_rng), tick+1, 0))
         elif udp_prob < 0.30 + 0.02 + 0.35:                         # QUIC2
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(443, 2), "UDP", benign_packet_size(), tick, 0))
-            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(443, 2), src_ip, src_port, "UDP", benign_packet_size(), tick+1, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(443, 2), "UDP", benign_packet_size(size_rng), tick, 0))
+            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(443, 2), src_ip, src_port, "UDP", benign_packet_size(size_rng), tick+1, 0))
         elif udp_prob < 0.30 + 0.02 + 0.35 + 0.03:                  # NTP
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(123, 2), "UDP_NTP", benign_packet_size(), tick, 0))
-            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(123, 2), src_ip, src_port, "UDP_NTP", benign_packet_size(), tick+1, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(123, 2), "UDP_NTP", benign_packet_size(size_rng), tick, 0))
+            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(123, 2), src_ip, src_port, "UDP_NTP", benign_packet_size(size_rng), tick+1, 0))
         elif udp_prob < 0.30 + 0.02 + 0.35 + 0.03 + 0.03:           # SSDP
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(1900, 2), "UDP_SSDP", benign_packet_size(), tick, 0))
-            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(1900, 2), src_ip, src_port, "UDP_SSDP", benign_packet_size(), tick+1, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, pkt.int_to_bytes(1900, 2), "UDP_SSDP", benign_packet_size(size_rng), tick, 0))
+            packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(1900, 2), src_ip, src_port, "UDP_SSDP", benign_packet_size(size_rng), tick+1, 0))
         elif udp_prob < 0.30 + 0.02 + 0.35 + 0.03 + 0.03 + 0.02:    # memcached
-            server_ip = choice(memcached_servers)
-            packets.append(pkt.Packet(src_ip, src_port, server_ip, pkt.int_to_bytes(11211, 2), "UDP", benign_packet_size(), tick, 0))
-            packets.append(pkt.Packet(server_ip, pkt.int_to_bytes(11211, 2), src_ip, src_port, "UDP", benign_packet_size(), tick+1, 0))
+            server_ip = flow_rng.choice(memcached_servers)
+            packets.append(pkt.Packet(src_ip, src_port, server_ip, pkt.int_to_bytes(11211, 2), "UDP", benign_packet_size(size_rng), tick, 0))
+            packets.append(pkt.Packet(server_ip, pkt.int_to_bytes(11211, 2), src_ip, src_port, "UDP", benign_packet_size(size_rng), tick+1, 0))
         else:
-            packets.append(pkt.Packet(src_ip, src_port, dst_ip, dst_port, "UDP", benign_packet_size(), tick, 0))
+            packets.append(pkt.Packet(src_ip, src_port, dst_ip, dst_port, "UDP", benign_packet_size(size_rng), tick, 0))
     else:
-        packets.append(pkt.Packet(src_ip, pkt.int_to_bytes(0, 2), dst_ip, pkt.int_to_bytes(0, 2), "ICMP_request", benign_packet_size(), tick, 0))
-        packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(0, 2), src_ip, pkt.int_to_bytes(0, 2), "ICMP_reply", benign_packet_size(), tick+1, 0))
+        packets.append(pkt.Packet(src_ip, pkt.int_to_bytes(0, 2), dst_ip, pkt.int_to_bytes(0, 2), "ICMP_request", benign_packet_size(size_rng), tick, 0))
+        packets.append(pkt.Packet(dst_ip, pkt.int_to_bytes(0, 2), src_ip, pkt.int_to_bytes(0, 2), "ICMP_reply", benign_packet_size(size_rng), tick+1, 0))
     return packets
 
 ####################
 #   DDoS Attacks   #
 ####################
 # ICMP flooding
-def icmp_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def icmp_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("ICMP flood")
     atk_type = 1
-    src_ip = choice(attack_ip)
+    src_ip = rng.choice(attack_ip)
     psize = 84 if psize == 0 else psize
     packet = pkt.Packet(src_ip, pkt.int_to_bytes(0, 2), victim_ip, pkt.int_to_bytes(0, 2), "ICMP_request", psize, tick, atk_type)
     return [packet]
 
 # Smurf attack
-def smurf_attack(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def smurf_attack(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("Smurf attack")
     atk_type = 2
-    src_ip = choice(attack_ip)
+    src_ip = rng.choice(attack_ip)
     psize = 84 if psize == 0 else psize
     packet = pkt.Packet(src_ip, pkt.int_to_bytes(0, 2), victim_ip, pkt.int_to_bytes(0, 2), "ICMP_reply", psize, tick, atk_type)
     return [packet]
 
 # Coremelt attack
-def coremelt(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def coremelt(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("Coremelt")
     atk_type = 3
-    src_ip = choice(attack_ip)
-    psize = randint(512, 1024) if psize == 0 else psize
+    src_ip = rng.choice(attack_ip)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
     # UDP/TCP ratio
     udp_ratio = 0.7
-    protocol = "UDP" if random() < udp_ratio else "TCP"
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), protocol, psize, tick, atk_type)
+    protocol = "UDP" if rng.random() < udp_ratio else "TCP"
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), protocol, psize, tick, atk_type)
     return [packet]
 
 # DNS amplification attack
-def dns_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def dns_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("DNS amp")
     # IP pool not used but kept for consistency for iterative_generate()
     atk_type = 4
-    resolver_ip = choice(dns_resolvers)
-    psize = randint(2048, 65536) if psize == 0 else psize
+    resolver_ip = rng.choice(dns_resolvers)
+    psize = rng.randint(2048, 65536) if psize == 0 else psize
     # generate DNS amplification packet
-    packets = split_packet(resolver_ip, pkt.int_to_bytes(53, 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "UDP_DNSR", psize, tick, atk_type)
+    packets = split_packet(resolver_ip, pkt.int_to_bytes(53, 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "UDP_DNSR", psize, tick, atk_type)
     return packets
 
 # UDP flooding
-def udp_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def udp_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("UDP flood")
     atk_type = 5
-    src_ip = choice(attack_ip)
-    psize = randint(512, 1024) if psize == 0 else psize
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "UDP", psize, tick, atk_type)
+    src_ip = rng.choice(attack_ip)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "UDP", psize, tick, atk_type)
     return [packet]
 
 # DNS flooding
-def dns_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def dns_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("DNS flood")
     atk_type = 6
-    src_ip = choice(attack_ip)
-    psize = randint(512, 1024) if psize == 0 else psize
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(53, 2), "UDP_DNSQ", psize, tick, atk_type)
+    src_ip = rng.choice(attack_ip)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(53, 2), "UDP_DNSQ", psize, tick, atk_type)
     return [packet]
 
 # NTP amplification attack
-def ntp_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def ntp_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("NTP amp")
     atk_type = 7
-    resolver_ip = choice(ntp_servers)
-    psize = randint(512, 1024) if psize == 0 else psize
-    packet = pkt.Packet(resolver_ip, pkt.int_to_bytes(123, 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "UDP_NTP", psize, tick, atk_type)
+    resolver_ip = rng.choice(ntp_servers)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
+    packet = pkt.Packet(resolver_ip, pkt.int_to_bytes(123, 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "UDP_NTP", psize, tick, atk_type)
     return [packet]
 
 # SSDP amplification attack
-def ssdp_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def ssdp_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("SSDP amp")
     atk_type = 8
-    upnp_ip = choice(attack_ip)
-    psize = randint(512, 1024) if psize == 0 else psize
-    packet = pkt.Packet(upnp_ip, pkt.int_to_bytes(1900, 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "UDP_SSDP", psize, tick, atk_type)
+    upnp_ip = rng.choice(attack_ip)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
+    packet = pkt.Packet(upnp_ip, pkt.int_to_bytes(1900, 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "UDP_SSDP", psize, tick, atk_type)
     return [packet]
 
 # Memcached amplification attack
-def memcached_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def memcached_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("Memcached amp")
     atk_type = 9
-    server_ip = choice(memcached_servers)
-    psize = randint(512, 1024) if psize == 0 else psize
+    server_ip = rng.choice(memcached_servers)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
     # Attacket spoof ip and request HTTP_GET to memcached server
-    packet = pkt.Packet(server_ip, pkt.int_to_bytes(11211, 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "TCP_ACK", psize, tick, atk_type)
+    packet = pkt.Packet(server_ip, pkt.int_to_bytes(11211, 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "TCP_ACK", psize, tick, atk_type)
     return [packet]
 
 # QUIC amplification attack
-def quic_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def quic_amp(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("QUIC amp")
     atk_type = 10
-    quic_server_ip = choice(quic_servers)
+    quic_server_ip = rng.choice(quic_servers)
     psize = 428 if psize == 0 else psize
-    src_port = 80 if random() < 0.5 else 443
-    packet = pkt.Packet(quic_server_ip, pkt.int_to_bytes(src_port, 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "UDP", psize, tick, atk_type)
+    src_port = 80 if rng.random() < 0.5 else 443
+    packet = pkt.Packet(quic_server_ip, pkt.int_to_bytes(src_port, 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "UDP", psize, tick, atk_type)
     return [packet]
 
 # HTTP GET/POST flooding
-def http_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def http_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("HTTP flood")
     atk_type = 11
-    src_ip = choice(attack_ip)
-    psize = randint(512, 1024) if psize == 0 else psize
+    src_ip = rng.choice(attack_ip)
+    psize = rng.randint(512, 1024) if psize == 0 else psize
     protocol_ratio = 0.5
-    (protocol_type, dst_port) = ("TCP_ACK_HTTP", 80) if random() < protocol_ratio else ("TCP_ACK_HTTPS", 443)
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(dst_port, 2), protocol_type, psize, tick, atk_type)
+    (protocol_type, dst_port) = ("TCP_ACK_HTTP", 80) if rng.random() < protocol_ratio else ("TCP_ACK_HTTPS", 443)
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(dst_port, 2), protocol_type, psize, tick, atk_type)
     return [packet]
 
 # Slowloris attack
-def slowloris(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def slowloris(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("Slowloris")
     atk_type = 12
-    src_ip = choice(attack_ip)
+    src_ip = rng.choice(attack_ip)
     psize = smallest_psize if psize == 0 else psize
     protocol_ratio = 0.5
-    (protocol_type, dst_port) = ("TCP_SYN_HTTP", 80) if random() < protocol_ratio else ("TCP_SYN_HTTPS", 443)
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(dst_port, 2), protocol_type, psize, tick, atk_type)
+    (protocol_type, dst_port) = ("TCP_SYN_HTTP", 80) if rng.random() < protocol_ratio else ("TCP_SYN_HTTPS", 443)
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(dst_port, 2), protocol_type, psize, tick, atk_type)
     return [packet]
 
 # TCP SYN flooding
-def syn_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def syn_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("SYN flood")
     atk_type = 13
-    src_ip = choice(attack_ip)
+    src_ip = rng.choice(attack_ip)
     psize = smallest_psize if psize == 0 else psize
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "TCP_SYN", psize, tick, atk_type)
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "TCP_SYN", psize, tick, atk_type)
     return [packet]
 
 # TCP ACK flooding
-def ack_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def ack_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("ACK flood")
     atk_type = 14
-    src_ip = choice(attack_ip)
+    src_ip = rng.choice(attack_ip)
     psize = smallest_psize if psize == 0 else psize
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), "TCP_ACK", psize, tick, atk_type)
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), "TCP_ACK", psize, tick, atk_type)
     return [packet]
 
 # TCP RST/FIN flooding
-def rst_fin_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int) -> list[pkt.Packet]:
+def rst_fin_flood(tick: int, victim_ip: bytes, benign_flowkey: list, attack_ip: list[bytes], psize: int, streams: RandomStreams = global_streams) -> list[pkt.Packet]:
+    rng = streams.get("RST FIN flood")
     atk_type = 15
-    src_ip = choice(attack_ip)
+    src_ip = rng.choice(attack_ip)
     psize = smallest_psize if psize == 0 else psize
     rst_ratio = 0.5
-    protocol_type = "TCP_FIN" if random() < rst_ratio else "TCP_RST"
-    packet = pkt.Packet(src_ip, pkt.int_to_bytes(randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(randint(1024, 65535), 2), protocol_type, psize, tick, atk_type)
+    protocol_type = "TCP_FIN" if rng.random() < rst_ratio else "TCP_RST"
+    packet = pkt.Packet(src_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), victim_ip, pkt.int_to_bytes(rng.randint(1024, 65535), 2), protocol_type, psize, tick, atk_type)
     return [packet]
 
+# Packet generator of each attack type
+attack_functions = {
+    "Benign"        : benign,
+    "ICMP flood"    : icmp_flood,
+    "Smurf attack"  : smurf_attack,
+    "Coremelt"      : coremelt,
+    "DNS amp"       : dns_amp,
+    "UDP flood"     : udp_flood,
+    "DNS flood"     : dns_flood,
+    "NTP amp"       : ntp_amp,
+    "SSDP amp"      : ssdp_amp,
+    "Memcached amp" : memcached_amp,
+    "QUIC amp"      : quic_amp,
+    "HTTP flood"    : http_flood,
+    "Slowloris"     : slowloris,
+    "SYN flood"     : syn_flood,
+    "ACK flood"     : ack_flood,
+    "RST FIN flood" : rst_fin_flood
+}
+
 # Minor functions
 def get_key(d: Dict):
     if len(d) == 1:
@@ -454,18 +603,65 @@ def get_key(d: Dict):
     else:
         raise ValueError(f"Invalid dictionary to get a single key: {d}")
 
-def parse_attack_profile(filename = "profile1") -> List[Dict]:
+# Attacks in a profile, in order of first appearance
+def get_attack_key(attack_profile: list[dict]) -> list[str]:
+    return list(dict.fromkeys(get_key(x) for d in attack_profile if get_key(d) == 'attacks' for x in d['attacks']))
+
+def attack_profile_path(filename = "profile1") -> str:
     path = f"{os.path.dirname(os.path.realpath(__file__))}/../atk_profile/"
     if filename != "profile1":
         path += f"{filename}.yaml"
     else:
         # default profile
         path += "profile1.yaml" 
+    return path
 
+# Attack profile given by the name of its YAML file, or already parsed (e.g., generated in memory)
+def load_attack_profile(atk_profile: str | list[dict]) -> List[Dict]:
+    return parse_attack_profile(atk_profile) if isinstance(atk_profile, str) else atk_profile
+
+def parse_attack_profile(filename = "profile1") -> List[Dict]:
+    path = attack_profile_path(filename)
     with open(path, "r") as file:
         attack_profile = yaml.safe_load(file)
     return attack_profile
 
+# Per-subtick values of a profile field given for all subticks of a tick or as a list with a value per subtick
+def subtick_values(value, attack_tick_to_subtick: int, is_valid, name: str) -> list:
+    if is_valid(value):
+        return [value] * attack_tick_to_subtick
+    if isinstance(value, list) and all(is_valid(x) for x in value) and len(value) == attack_tick_to_subtick:
+        return value
+    raise ValueError(f"Invalid type for {name}: {value}")
+
+def is_number(x) -> bool:
+    return isinstance(x, int) or isinstance(x, float)
+
+def is_interval_list(l) -> bool:
+    return isinstance(l, list) and len(l) % 2 == 0 and all(is_number(x) for x in l) and leq(0.0, l[0]) and all(leq(l[i], l[i+1]) for i in range(len(l)-1)) and leq(l[-1], 1.0)
+
+def is_size_list(l) -> bool:
+    return isinstance(l, list) and all(isinstance(x, int) and smallest_psize <= x <= largest_psize for x in l)
+
+def is_count_list(l) -> bool:
+    return isinstance(l, list) and all(isinstance(x, int) and x >= 0 for x in l)
+
+def is_rate_ratio(x) -> bool:
+    return is_number(x) and leq(0.0, x) and leq(x, 1.0)
+
+profile_fields = {
+    # field: (validity of the value of a subtick, table, whether the values of the same subtick add up)
+    'ratio'           : (is_interval_list, "ratio", False),
+    'rate ratio'      : (is_rate_ratio, "rate", True),
+    'seq size'        : (is_size_list, "seq_size", False),
+    'seq count'       : (is_count_list, "seq_count", False),
+    'seq ratio'       : (is_interval_list, "seq_ratio", False),
+    'loop size'       : (is_size_list, "loop_size", False),
+    'loop count'      : (is_count_list, "loop_count", False),
+    'loop ratio'      : (is_interval_list, "loop_ratio", False),
+    'loop rate ratio' : (is_rate_ratio, "loop_rate", True)
+}
+
 def get_rate(attack_profile: list[dict], attack_key: list[str], attack_volume: int, attack_tick_to_subtick: int, attack_start_subtick: int) \
              -> tuple[int, dict[str, list[list[int | float]]], dict[str, list[float]], dict[str, list[list[int]]], dict[str, list[list[int]]], dict[str, list[list[int | float]]], dict[str, list[list[int]]], dict[str, list[list[int]]], dict[str, list[list[int | float]]], dict[str, list[float]]]:
     max_tick = -1
@@ -486,15 +682,20 @@ def get_rate(attack_profile: list[dict], attack_key: list[str], attack_volume: i
     if max_tick < 0:
         raise ValueError(f"Max tick should be nonnegative: {max_tick}")
 
-    ratio = {atk: [[0.0, 0.0] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    rate = {atk: [0.0] * (attack_tick_to_subtick*(max_tick+1) + attack_start_subtick) for atk in attack_key}
-    seq_size = {atk: [[] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    seq_count = {atk: [[] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    seq_ratio = {atk: [[0.0, 0.0] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    loop_size = {atk: [[] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    loop_count = {atk: [[] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    loop_ratio = {atk: [[0.0, 0.0] for _ in range((attack_tick_to_subtick*(max_tick+1) + attack_start_subtick))] for atk in attack_key}
-    loop_rate = {atk: [0.0] * (attack_tick_to_subtick*(max_tick+1) + attack_start_subtick) for atk in attack_key}
+    # subticks without a value share the same empty value, which is never modified
+    n_subtick = attack_tick_to_subtick*(max_tick+1) + attack_start_subtick
+    no_interval, no_list = [0.0, 0.0], []
+    tables = {
+        "ratio"      : {atk: [no_interval] * n_subtick for atk in attack_key},
+        "rate"       : {atk: [0.0] * n_subtick for atk in attack_key},
+        "seq_size"   : {atk: [no_list] * n_subtick for atk in attack_key},
+        "seq_count"  : {atk: [no_list] * n_subtick for atk in attack_key},
+        "seq_ratio"  : {atk: [no_interval] * n_subtick for atk in attack_key},
+        "loop_size"  : {atk: [no_list] * n_subtick for atk in attack_key},
+        "loop_count" : {atk: [no_list] * n_subtick for atk in attack_key},
+        "loop_ratio" : {atk: [no_interval] * n_subtick for atk in attack_key},
+        "loop_rate"  : {atk: [0.0] * n_subtick for atk in attack_key}
+    }
     current_ticks = []
     for d in attack_profile:
         key = get_key(d)
@@ -506,127 +707,219 @@ def get_rate(attack_profile: list[dict], attack_key: list[str], attack_volume: i
             else:
                 raise ValueError(f"Invalid type for tick: {d['tick']}")
         elif key == "attacks":
+            if not current_ticks:
+                continue
+            # each field is validated once, not for every subtick it is used in
+            attacks = []
+            for atk in d["attacks"]:
+                atk_type = get_key(atk)
+                fields = []
+                for field, (is_valid, table, add) in profile_fields.items():
+                    if field in atk[atk_type]:
+                        values = subtick_values(atk[atk_type][field], attack_tick_to_subtick, is_valid, field)
+                        if add:
+                            values = [x * attack_volume * 125 * 1000 * 1000 / attack_tick_to_subtick for x in values]
+                        fields.append((tables[table][atk_type], values, add))
+                attacks.append((atk_type, fields))
             for current_tick in current_ticks:
                 for i in range(attack_tick_to_subtick):
                     current_subtick = attack_start_subtick + current_tick*attack_tick_to_subtick + i
-                    for atk in d["attacks"]:
-                        atk_type = get_key(atk)
-                        if 'ratio' in atk[atk_type]:
-                            atk_ratio = atk[atk_type]['ratio']
-                            if isinstance(atk_ratio, list):
-                                if len(atk_ratio) % 2 == 0 and all(isinstance(x, int) or isinstance(x, float) for x in atk_ratio) and leq(0.0, atk_ratio[0]) and all(leq(atk_ratio[i], atk_ratio[i+1]) for i in range(len(atk_ratio)-1)) and leq(atk_ratio[-1], 1.0):
-                                    ratio[atk_type][current_subtick] = atk_ratio
-                                elif all(isinstance(l, list) and len(l) % 2 == 0 and all(isinstance(x, int) or isinstance(x, float) for x in l) and leq(0.0, l[0]) and all(leq(l[i], l[i+1]) for i in range(len(l)-1)) and leq(l[-1], 1.0) for l in atk_ratio) and len(atk_ratio) == attack_tick_to_subtick:
-                                    ratio[atk_type][current_subtick] = atk_ratio[i]
-                                else:
-                                    raise ValueError(f"Invalid type for ratio: {atk_ratio}")
-                            else:
-                                raise ValueError(f"Invalid type for ratio: {atk_ratio}")
-                        if 'rate ratio' in atk[atk_type]:
-                            atk_rate_ratio = atk[atk_type]['rate ratio']
-                            if (isinstance(atk_rate_ratio, int) or isinstance(atk_rate_ratio, float)) and leq(0.0, atk_rate_ratio) and leq(atk_rate_ratio, 1.0):
-                                rate[atk_type][current_subtick] += atk_rate_ratio * attack_volume * 125 * 1000 * 1000 / attack_tick_to_subtick
-                            elif isinstance(atk_rate_ratio, list) and all((isinstance(x, int) or isinstance(x, float)) and leq(0.0, x) and leq(x, 1.0) for x in atk_rate_ratio) and len(atk_rate_ratio) == attack_tick_to_subtick:
-                                rate[atk_type][current_subtick] += atk_rate_ratio[i] * attack_volume * 125 * 1000 * 1000 / attack_tick_to_subtick
-                            else:
-                                raise ValueError(f"Invalid type for rate ratio: {atk_rate_ratio}")
-                        if 'seq size' in atk[atk_type]:
-                            atk_seq_size = atk[atk_type]['seq size']
-                            if isinstance(atk_seq_size, list):
-                                if all(isinstance(x, int) and smallest_psize <= x <= largest_psize for x in atk_seq_size):
-                                    seq_size[atk_type][current_subtick] = atk_seq_size
-                                elif all(isinstance(l, list) and all(isinstance(x, int) and smallest_psize <= x <= largest_psize for x in l) for l in atk_seq_size) and len(atk_seq_size) == attack_tick_to_subtick:
-                                    seq_size[atk_type][current_subtick] = atk_seq_size[i]
-                                else:
-                                    raise ValueError(f"Invalid type for seq size: {atk_seq_size}")
-                            else:
-                                raise ValueError(f"Invalid type for seq size: {atk_seq_size}")
-                        if 'seq count' in atk[atk_type]:
-                            atk_seq_count = atk[atk_type]['seq count']
-                            if isinstance(atk_seq_count, list):
-                                if all(isinstance(x, int) and x >= 0 for x in atk_seq_count):
-                                    seq_count[atk_type][current_subtick] = atk_seq_count
-                                elif all(isinstance(l, list) and all(isinstance(x, int) and x >= 0 for x in l) for l in atk_seq_count) and len(atk_seq_count) == attack_tick_to_subtick:
-                                    seq_count[atk_type][current_subtick] = atk_seq_count[i]
-                                else:
-                                    raise ValueError(f"Invalid type for seq count: {atk_seq_count}")
-                            else:
-                                raise ValueError(f"Invalid type for seq count: {atk_seq_count}")
-                        if len(seq_size[atk_type][current_subtick]) != len(seq_count[atk_type][current_subtick]):
-                            raise ValueError(f"Length of seq size and seq count of attack {atk_type} differs on tick {current_tick} (subtick {current_subtick}): {seq_size[atk_type][current_subtick]} and {seq_count[atk_type][current_subtick]}")
-                        if 'seq ratio' in atk[atk_type]:
-                            atk_seq_ratio = atk[atk_type]['seq ratio']
-                            if isinstance(atk_seq_ratio, list):
-                                if len(atk_seq_ratio) % 2 == 0 and all(isinstance(x, int) or isinstance(x, float) for x in atk_seq_ratio) and leq(0.0, atk_seq_ratio[0]) and all(leq(atk_seq_ratio[i], atk_seq_ratio[i+1]) for i in range(len(atk_seq_ratio)-1)) and leq(atk_seq_ratio[-1], 1.0):
-                                    seq_ratio[atk_type][current_subtick] = atk_seq_ratio
-                                elif all(isinstance(l, list) and len(l) % 2 == 0 and all(isinstance(x, int) or isinstance(x, float) for x in l) and leq(0.0, l[0]) and all(leq(l[i], l[i+1]) for i in range(len(l)-1)) and leq(l[-1], 1.0) for l in atk_seq_ratio) and len(atk_seq_ratio) == attack_tick_to_subtick:
-                                    seq_ratio[atk_type][current_subtick] = atk_seq_ratio[i]
-                                else:
-                                    raise ValueError(f"Invalid type for seq ratio: {atk_seq_ratio}")
-                            else:
-                                raise ValueError(f"Invalid type for seq ratio: {atk_seq_ratio}")
-                        if 'loop size' in atk[atk_type]:
-                            atk_loop_size = atk[atk_type]['loop size']
-                            if isinstance(atk_loop_size, list):
-                                if all(isinstance(x, int) and smallest_psize <= x <= largest_psize for x in atk_loop_size):
-                                    loop_size[atk_type][current_subtick] = atk_loop_size
-                                elif all(isinstance(l, list) and all(isinstance(x, int) and smallest_psize <= x <= largest_psize for x in l) for l in atk_loop_size) and len(atk_loop_size) == attack_tick_to_subtick:
-                                    loop_size[atk_type][current_subtick] = atk_loop_size[i]
-                                else:
-                                    raise ValueError(f"Invalid type for loop size: {atk_loop_size}")
+                    for atk_type, fields in attacks:
+                        for table, values, add in fields:
+                            if add:
+                                table[current_subtick] += values[i]
                             else:
-                                raise ValueError(f"Invalid type for loop size: {atk_loop_size}")
-                        if 'loop count' in atk[atk_type]:
-                            atk_loop_count = atk[atk_type]['loop count']
-                            if isinstance(atk_loop_count, list):
-                                if all(isinstance(x, int) and x >= 0 for x in atk_loop_count):
-                                    loop_count[atk_type][current_subtick] = atk_loop_count
-                                elif all(isinstance(l, list) and all(isinstance(x, int) and x >= 0 for x in l) for l in atk_loop_count) and len(atk_loop_count) == attack_tick_to_subtick:
-                                    loop_count[atk_type][current_subtick] = atk_loop_count[i]
-                                else:
-                                    raise ValueError(f"Invalid type for loop count: {atk_loop_count}")
-                            else:
-                                raise ValueError(f"Invalid type for loop count: {atk_loop_count}")
-                        if len(loop_size[atk_type][current_subtick]) != len(loop_count[atk_type][current_subtick]):
-                            raise ValueError(f"Length of loop size and loop count of attack {atk_type} differs on tick {current_tick} (subtick {current_subtick}): {loop_size[atk_type][current_subtick]} and {loop_count[atk_type][current_subtick]}")
-                        if 'loop ratio' in atk[atk_type]:
-                            atk_loop_ratio = atk[atk_type]['loop ratio']
-                            if isinstance(atk_loop_ratio, list):
-                                if len(atk_loop_ratio) % 2 == 0 and all(isinstance(x, int) or isinstance(x, float) for x in atk_loop_ratio) and leq(0.0, atk_loop_ratio[0]) and all(leq(atk_loop_ratio[i], atk_loop_ratio[i+1]) for i in range(len(atk_loop_ratio)-1)) and leq(atk_loop_ratio[-1], 1.0):
-                                    loop_ratio[atk_type][current_subtick] = atk_loop_ratio
-                                elif all(isinstance(l, list) and len(l) % 2 == 0 and all(isinstance(x, int) or isinstance(x, float) for x in l) and leq(0.0, l[0]) and all(leq(l[i], l[i+1]) for i in range(len(l)-1)) and leq(l[-1], 1.0) for l in atk_loop_ratio) and len(atk_loop_ratio) == attack_tick_to_subtick:
-                                    loop_ratio[atk_type][current_subtick] = atk_loop_ratio[i]
-                                else:
-                                    raise ValueError(f"Invalid type for loop ratio: {atk_loop_ratio}")
-                            else:
-                                raise ValueError(f"Invalid type for loop ratio: {atk_loop_ratio}")
-                        if 'loop rate ratio' in atk[atk_type]:
-                            atk_loop_rate_ratio = atk[atk_type]['loop rate ratio']
-                            if (isinstance(atk_loop_rate_ratio, int) or isinstance(atk_loop_rate_ratio, float)) and leq(0.0, atk_loop_rate_ratio) and leq(atk_loop_rate_ratio, 1.0):
-                                loop_rate[atk_type][current_subtick] += atk_loop_rate_ratio * attack_volume * 125 * 1000 * 1000 / attack_tick_to_subtick
-                            elif isinstance(atk_loop_rate_ratio, list) and all((isinstance(x, int) or isinstance(x, float)) and leq(0.0, x) and leq(x, 1.0) for x in atk_loop_rate_ratio) and len(atk_loop_rate_ratio) == attack_tick_to_subtick:
-                                loop_rate[atk_type][current_subtick] += atk_loop_rate_ratio[i] * attack_volume * 125 * 1000 * 1000 / attack_tick_to_subtick
-                            else:
-                                raise ValueError(f"Invalid type for loop rate ratio: {atk_loop_rate_ratio}")
+                                table[current_subtick] = values[i]
+                        for kind in ["seq", "loop"]:
+                            size, count = tables[f"{kind}_size"][atk_type][current_subtick], tables[f"{kind}_count"][atk_type][current_subtick]
+                            if len(size) != len(count):
+                                raise ValueError(f"Length of {kind} size and {kind} count of attack {atk_type} differs on tick {current_tick} (subtick {current_subtick}): {size} and {count}")
             current_ticks = []
         else:
             raise ValueError(f"Invalid key in attack profile: {key}")
-    return max_tick, ratio, rate, seq_size, seq_count, seq_ratio, loop_size, loop_count, loop_ratio, loop_rate
-
-def generate_attack_ip(n_unique_ip: int) -> list[bytes]:
+    return (max_tick, tables["ratio"], tables["rate"], tables["seq_size"], tables["seq_count"], tables["seq_ratio"],
+            tables["loop_size"], tables["loop_count"], tables["loop_ratio"], tables["loop_rate"])
+
+class SubtickSchedule:
+    # Values of subticks stored only at the subticks where they change
+    def __init__(self, values: list):
+        self.length = len(values)
+        self.starts = []
+        self.values = []
+        for subtick, value in enumerate(values):
+            if not self.values or value != self.values[-1]:
+                self.starts.append(subtick)
+                self.values.append(value)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, subtick: int):
+        if not 0 <= subtick < self.length:
+            raise IndexError(f"Subtick out of range: {subtick}")
+        return self.values[bisect_right(self.starts, subtick) - 1]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SubtickSchedule) and (self.length, self.starts, self.values) == (other.length, other.starts, other.values)
+
+# IP divisions of the ratios of each subtick, as schedules; subticks with the same ratio share a division
+def get_ip_division(ratio: dict[str, list[list[int | float]]], attack_unique_ip: int) -> dict[str, SubtickSchedule]:
+    divisions = {}
+    ip_division = {}
+    for atk in ratio:
+        values = []
+        for l in ratio[atk]:
+            key = tuple(l)
+            if key not in divisions:
+                divisions[key] = divide_list_by_ratio(attack_unique_ip, [l[i] - l[i-1] for i in range(len(l)) if i > 0])
+            values.append(divisions[key])
+        ip_division[atk] = SubtickSchedule(values)
+    return ip_division
+
+# get_rate and IP divisions of an attack profile, cached in cache_dir by the hash of the profile, the parameters and this module
+# Returns max_tick, the tables of get_rate, and the IP divisions of ratio, seq ratio and loop ratio
+def compile_attack_profile(attack_profile: list[dict], attack_key: list[str], attack_volume: int, attack_tick_to_subtick: int, attack_start_subtick: int, attack_unique_ip: int,
+                           cache_dir: str | None = compiled_profile_dir) -> tuple:
+    path = None
+    if cache_dir:
+        h = hashlib.sha256()
+        h.update(json.dumps([attack_profile, attack_key, attack_volume, attack_tick_to_subtick, attack_start_subtick, attack_unique_ip], sort_keys=True).encode())
+        with open(os.path.realpath(__file__), "rb") as f:
+            h.update(f.read())
+        path = os.path.join(cache_dir, f"{h.hexdigest()}.pkl")
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    compiled = get_rate(attack_profile, attack_key, attack_volume, attack_tick_to_subtick, attack_start_subtick)
+    ratio, seq_ratio, loop_ratio = compiled[1], compiled[5], compiled[8]
+    compiled += (get_ip_division(ratio, attack_unique_ip), get_ip_division(seq_ratio, attack_unique_ip), get_ip_division(loop_ratio, attack_unique_ip))
+    if path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        except OSError:
+            pass
+    return compiled
+
+def generate_attack_ip(n_unique_ip: int, rng: Random = global_random) -> list[bytes]:
     distinct_ip = set()
     while len(distinct_ip) < n_unique_ip:
-        new_ip = [randint(0, (256**4) - 1) for _ in range(n_unique_ip - len(distinct_ip))]
+        new_ip = [rng.randint(0, (256**4) - 1) for _ in range(n_unique_ip - len(distinct_ip))]
         distinct_ip.update(new_ip)
     return [pkt.int_to_bytes(ip, 4) for ip in distinct_ip]
 
-def generate_benign_flowkey(n_unique_flowkey: int) -> list[tuple[bytes, bytes, bytes, bytes]]:
+def generate_benign_flowkey(n_unique_flowkey: int, rng: Random = global_random) -> list[tuple[bytes, bytes, bytes, bytes]]:
     distinct_flowkey = set()
     while len(distinct_flowkey) < n_unique_flowkey:
-        new_flowkey = [(randint(0, (256**4) - 1), randint(1, 65535), randint(0, (256**4) - 1), randint(1, 65535)) for _ in range(n_unique_flowkey - len(distinct_flowkey))]
+        new_flowkey = [(rng.randint(0, (256**4) - 1), rng.randint(1, 65535), rng.randint(0, (256**4) - 1), rng.randint(1, 65535)) for _ in range(n_unique_flowkey - len(distinct_flowkey))]
         distinct_flowkey.update(new_flowkey)
     return [[pkt.int_to_bytes(src_ip, 4), pkt.int_to_bytes(src_port, 2), pkt.int_to_bytes(dst_ip, 4), pkt.int_to_bytes(dst_port, 2)] for src_ip, src_port, dst_ip, dst_port in distinct_flowkey]
 
+# Values drawn by draw(rng, n) until n of them have distinct keys (packed uint64), in the order they were drawn
+def unique_draws(n: int, rng: np.random.Generator, draw, key=lambda values: values) -> np.ndarray:
+    values = draw(rng, 0)
+    while len(values) < n:
+        values = np.concatenate([values, draw(rng, n - len(values))])
+        _, first = np.unique(key(values), return_index=True)
+        values = values[np.sort(first)]
+    return values
+
+# 4-tuples of benign flows as rows of (src_ip, src_port, dst_ip, dst_port)
+def generate_benign_flowkey_array(n_unique_flowkey: int, rng: np.random.Generator) -> np.ndarray:
+    def draw(rng: np.random.Generator, n: int) -> np.ndarray:
+        ip = rng.integers(0, 256**4, (n, 2), dtype=np.uint64)
+        port = rng.integers(1, 65536, (n, 2), dtype=np.uint64)
+        return np.stack([ip[:, 0], port[:, 0], ip[:, 1], port[:, 1]], axis=1)
+    # 96-bit 4-tuples mixed into 64 bits; distinct keys are distinct 4-tuples, and rare collisions of keys are just drawn again
+    def key(flowkey: np.ndarray) -> np.ndarray:
+        return ((flowkey[:, 0] << np.uint64(16)) | flowkey[:, 1]) * np.uint64(0x9E3779B97F4A7C15) + ((flowkey[:, 2] << np.uint64(16)) | flowkey[:, 3])
+    flowkey = unique_draws(n_unique_flowkey, rng, draw, key)
+    population = np.empty(n_unique_flowkey, dtype=[("src_ip", ">u4"), ("src_port", ">u2"), ("dst_ip", ">u4"), ("dst_port", ">u2")])
+    for i, name in enumerate(population.dtype.names):
+        population[name] = flowkey[:, i]
+    return population
+
+def generate_attack_ip_array(n_unique_ip: int, rng: np.random.Generator) -> np.ndarray:
+    return unique_draws(n_unique_ip, rng, lambda rng, n: rng.integers(0, 256**4, n, dtype=np.uint64)).astype(">u4")
+
+# Population of n drawn from seed, from cache_dir if another run drew it already; the arrays are read-only
+def load_population(kind: str, n: int, seed: int, generate, cache_dir: str = population_dir) -> np.ndarray:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{kind} {n} {seed:016x}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    population = generate(n, np.random.default_rng(seed))
+    try:
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+            np.save(f, population)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+        return np.load(path, mmap_mode="r")
+    except OSError:
+        return population
+
+tcp_states = ["BEGIN", "SYN", "SNACK", "ACK", "FIN1", "ACK_FIN1", "FIN2", "ACK_FIN2", "RST"]
+tcp_types = [None, "", "_DNS", "_HTTP", "_HTTPS", "_Memcached"]
+
+class BenignPopulation:
+    # Benign flows in columns: 4-tuples as rows of big-endian bytes (read-only, possibly memory-mapped) and TCP_state, TCP_type, TCP_dst_port as codes
+    # Rows are BenignFlow views, which read and write like the lists [src_ip, src_port, dst_ip, dst_port, TCP_state, TCP_type, TCP_dst_port]
+    def __init__(self, flowkey: np.ndarray):
+        self.flowkey = flowkey
+        self.rows = memoryview(flowkey.view(np.uint8))
+        self.tcp_state = bytearray(len(flowkey))    # index of tcp_states
+        self.tcp_type = bytearray(len(flowkey))     # index of tcp_types
+        self.tcp_dst_port = array.array("i", [-1]) * len(flowkey)
+
+    def __len__(self) -> int:
+        return len(self.flowkey)
+
+    def __getitem__(self, index: int):
+        return BenignFlow(self, index)
+
+    # memoryview can't be pickled (e.g., in checkpoints)
+    def __getstate__(self) -> dict:
+        state = dict(vars(self))
+        del state["rows"]
+        return state
+
+    def __setstate__(self, state: dict):
+        vars(self).update(state)
+        self.rows = memoryview(self.flowkey.view(np.uint8))
+
+class BenignFlow:
+    __slots__ = ["population", "index"]
+
+    def __init__(self, population: BenignPopulation, index: int):
+        self.population = population
+        self.index = index
+
+    def __iter__(self):
+        population, index = self.population, self.index
+        row = population.rows[12*index: 12*index+12].tobytes()
+        tcp_dst_port = population.tcp_dst_port[index]
+        return iter([row[:4], row[4:6], row[6:10], row[10:], tcp_states[population.tcp_state[index]], tcp_types[population.tcp_type[index]],
+                     None if tcp_dst_port < 0 else pkt.int_to_bytes(tcp_dst_port, 2)])
+
+    def __getitem__(self, i: int):
+        return list(self)[i]
+
+    def __setitem__(self, i: int, value):
+        if i == 4:
+            self.population.tcp_state[self.index] = tcp_states.index(value)
+        elif i == 5:
+            self.population.tcp_type[self.index] = tcp_types.index(value)
+        elif i == 6:
+            self.population.tcp_dst_port[self.index] = -1 if value is None else int.from_bytes(value, byteorder='big')
+        else:
+            raise ValueError(f"4-tuple of a benign flow is read-only: {i}")
+
 def split_packet(src_ip: bytes, src_port: bytes, dst_ip: bytes, dst_port: bytes, protocol: str, packet_size: int, tick: int, attack_type) -> list[pkt.Packet]:
     packets = []
     while packet_size > largest_psize:
@@ -636,7 +929,7 @@ def split_packet(src_ip: bytes, src_port: bytes, dst_ip: bytes, dst_port: bytes,
         packets.append(pkt.Packet(src_ip, src_port, dst_ip, dst_port, protocol, max(packet_size, 64), tick, attack_type))
     return packets
 
-def combine_lists(lists: list[list]):
+def combine_lists(lists: list[list], rng: Random = global_random):
     result = []
     pointers = [0] * len(lists)  # Initialize pointers for each list
 
@@ -653,7 +946,7 @@ def combine_lists(lists: list[list]):
         probabilities = [remaining / total_remaining for remaining in remaining_elements]
 
         # Select a list index based on the calculated probabilities
-        selected_list_index = choices(range(len(lists)), weights=probabilities, k=1)[0]
+        selected_list_index = rng.choices(range(len(lists)), weights=probabilities, k=1)[0]
 
         # Append the selected element to the result
         result.append(lists[selected_list_index][pointers[selected_list_index]])
@@ -876,6 +1169,90 @@ class TestAttackGenerator(unittest.TestCase):
         else:
             raise Exception("Total packet volume is less than 0.5Gbps*4s\n")
 
+    def test_compile_attack_profile(self):
+        import tempfile
+        attack_profile = [{'tick': [0, 2]},
+                          {'attacks': [{'UDP flood': {'ratio': [[0.0, 0.5], [0.5, 1.0]], 'rate ratio': 0.5}},
+                                       {'SYN flood': {'seq ratio': [0.0, 1.0], 'seq size': [64], 'seq count': [2]}}]}]
+        attack_key = get_attack_key(attack_profile)
+        with tempfile.TemporaryDirectory() as path:
+            compiled = compile_attack_profile(attack_profile, attack_key, 1, 2, 1, 100, path)
+            self.assertEqual(len(os.listdir(path)), 1)
+            self.assertEqual(compile_attack_profile(attack_profile, attack_key, 1, 2, 1, 100, path), compiled)
+        max_tick, ratio, rate, _, seq_count, _, _, _, _, _, ip_division, _, _ = compiled
+        self.assertEqual(max_tick, 2)
+        self.assertEqual(ratio['UDP flood'], [[0.0, 0.0], [0.0, 0.5], [0.5, 1.0], [0.0, 0.0], [0.0, 0.0], [0.0, 0.5], [0.5, 1.0]])
+        self.assertEqual(rate['UDP flood'][1], 0.5 * 125 * 1000 * 1000 / 2)
+        self.assertEqual(seq_count['SYN flood'][6], [2])
+        self.assertEqual(ip_division['UDP flood'][1], [0, 50])
+        self.assertEqual(ip_division['UDP flood'].starts, [0, 1, 3, 5])
+        with self.assertRaises(ValueError):
+            get_rate([{'tick': 0}, {'attacks': [{'UDP flood': {'ratio': [0.5, 0.2]}}]}], ['UDP flood'], 1, 2, 0)
+
+    def test_loop_engine(self):
+        # with a single attacker IP, both engines walk its loop the same way
+        attack_profile = [{'tick': [0, 1]},
+                          {'attacks': [{'HTTP flood': {'loop ratio': [0.0, 1.0], 'loop size': [64, 100, 200], 'loop count': [2, 0, 3], 'loop rate ratio': 0.01}}]},
+                          {'tick': 2},
+                          {'attacks': [{'HTTP flood': {'loop ratio': [0.0, 1.0], 'loop size': [80, 90], 'loop count': [1, 4], 'loop rate ratio': 0.01}},
+                                       {'SYN flood': {'loop ratio': [0.0, 1.0], 'loop size': [64], 'loop count': [3], 'loop rate ratio': 0.005}}]}]
+        import tempfile
+        sizes = {}
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as path:
+            os.chdir(path)  # compiled attack profiles are cached under the working directory
+            try:
+                for loop_engine in loop_engines:
+                    ag = AttackGenerator(10, 1, attack_profile, 0, 0.01, {'HTTP flood': 2, 'SYN flood': 1}, 2, 2, 0, loop_engine)
+                    sizes[loop_engine] = []
+                    for subtick in range(6):
+                        ag.generate(subtick)
+                        # attacks of a subtick are interleaved at random
+                        sizes[loop_engine].append({atk_type: [p.packet_size for p in ag.traffic[subtick] if p.attack_type == atk_type] for atk_type in [11, 13]})
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(sizes["vectorized"], sizes["sequential"])
+        self.assertTrue(all(subtick_sizes[11] for subtick_sizes in sizes["sequential"]))
+
+    def test_population(self):
+        import tempfile
+        import pickle
+        with tempfile.TemporaryDirectory() as path:
+            flowkey = load_population("benign", 1000, 1, generate_benign_flowkey_array, path)
+            self.assertEqual(len(np.unique(flowkey)), 1000)
+            self.assertTrue(all(flowkey["src_port"] > 0) and all(flowkey["dst_port"] > 0))
+            self.assertTrue(np.array_equal(load_population("benign", 1000, 1, generate_benign_flowkey_array, path), flowkey))
+            self.assertIsInstance(load_population("benign", 1000, 1, generate_benign_flowkey_array, path), np.memmap)
+            attack_ip = load_population("attack", 1000, 1, generate_attack_ip_array, path)
+            self.assertEqual(len(set(attack_ip.tolist())), 1000)
+
+            benign_flowkey = BenignPopulation(flowkey)
+            src_ip, src_port, dst_ip, dst_port, tcp_state, tcp_type, tcp_dst_port = benign_flowkey[7]
+            self.assertEqual((src_ip, src_port), (pkt.int_to_bytes(int(flowkey[7]["src_ip"]), 4), pkt.int_to_bytes(int(flowkey[7]["src_port"]), 2)))
+            self.assertEqual((tcp_state, tcp_type, tcp_dst_port), ("BEGIN", None, None))
+            benign_flowkey[7][4], benign_flowkey[7][5], benign_flowkey[7][6] = "SYN", "_HTTPS", pkt.int_to_bytes(443, 2)
+            benign_flowkey = pickle.loads(pickle.dumps(benign_flowkey))
+            self.assertEqual(list(benign_flowkey[7])[1:], [src_port, dst_ip, dst_port, "SYN", "_HTTPS", pkt.int_to_bytes(443, 2)])
+            with self.assertRaises(ValueError):
+                benign_flowkey[7][0] = src_ip
+
+    def test_rng_streams(self):
+        self.assertIs(RandomStreams().get("benign flow"), global_random)
+        victim_ip = pkt.ip_to_bytes("192.168.0.1")
+        attack_ip = [pkt.ip_to_bytes("10.0.0.1"), pkt.ip_to_bytes("10.0.0.2")]
+        traffic = []
+        for n_attack in [0, 5]:
+            streams = RandomStreams(1)
+            benign_flowkey = [list(flowkey) + ["BEGIN", None, None] for flowkey in generate_benign_flowkey(10, Random(1))]
+            for tick in range(20):
+                for _ in range(n_attack):
+                    syn_flood(tick, victim_ip, benign_flowkey, attack_ip, 0, streams)
+                traffic.append([vars(p) for p in benign(tick, victim_ip, benign_flowkey, attack_ip, 0, streams)])
+        # benign traffic doesn't depend on how much attack traffic is drawn
+        self.assertEqual(traffic[:20], traffic[20:])
+        self.assertNotEqual(RandomStreams(1).get("SYN flood").random(), RandomStreams(1).get("ACK flood").random())
+        self.assertNotEqual(RandomStreams(1).get("SYN flood").random(), RandomStreams(2).get("SYN flood").random())
+
 if __name__ == '__main__':
     unittest.main()
     # print(list(set(quic_servers)))
@@ -2,12 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import json
+import copy
+import sys
+
+metric_families = ["true_value", "rate", "fpr_fnr", "mem_usage"]
+metric_tiers = {
+    "full":     ["true_value", "rate", "fpr_fnr"],  # mem_usage is still controlled by "mem_usage"
+    "fpr":      ["fpr_fnr"],
+    "upload":   []  # uploaded packets, counter size and other statistics of Cerberus are always collected
+}
 
 class Params:
-    def __init__(self, setting: str):
-        param_file = f"params/{setting}.json"
-        with open(param_file, mode="r") as j_object:
-            j_data = json.load(j_object)
+    # j_data: contents of the params file, to build params in memory instead of reading params/{setting}.json
+    def __init__(self, setting: str, overrides: dict = None, j_data: dict = None):
+        if j_data is None:
+            param_file = f"params/{setting}.json"
+            with open(param_file, mode="r") as j_object:
+                j_data = json.load(j_object)
+        else:
+            j_data = copy.deepcopy(j_data)
+        if overrides:
+            j_data.update(overrides)
+        self.j_data = j_data    # effective contents of the params file
 
         self.task_match_action_table = dict_with_int_key(j_data["task_match_action_table"])
         self.reg_alloc_table = dict_with_int_key(j_data["reg_alloc_table"])
@@ -17,7 +33,7 @@ class Params:
         self.pcap_file = j_data["pcap_file"]
         self.benign_volume = j_data["benign_volume"]    # Gbps
         self.attack_volume = j_data["attack_volume"]    # Gbps
-        self.atk_profile = j_data["atk_profile"]
+        self.atk_profile = j_data["atk_profile"]    # name of a YAML file in atk_profile/, or the attack profile itself
         self.benign_unique_flowkey = j_data["benign_unique_flowkey"]
         self.attack_unique_ip = j_data["attack_unique_ip"]
         self.tick_divisor = j_data["tick_divisor"]
@@ -38,7 +54,42 @@ class Params:
         self.statistics_cycle_subtick = j_data["statistics_cycle_subtick"]  # (1/tick_divisor) second
         self.cp_processing_threshold = j_data["cp_processing_threshold"] * 1000 * 1000 * 1000 / 8   # Bps
         self.data_to_control_channel_bandwidth = j_data["data_to_control_channel_bandwidth"] * 1000 * 1000 * 1000 / 8   # Bps
-        self.mem_usage = j_data["mem_usage"]
+        self.checkpoint_cycle = j_data.get("checkpoint_cycle", 0)   # ticks between checkpoints (0: no checkpoint)
+        self.profile = j_data.get("profile", False)             # stage timers and throughput per subtick
+        self.profile_ticks = j_data.get("profile_ticks", None)  # [start, end) ticks to run under cProfile
+        self.mem_usage_interval = j_data.get("mem_usage_interval", 1)    # subticks between tracemalloc samples (0: no tracemalloc)
+        self.re_sample_size = j_data.get("re_sample_size", 0)  # flows per task whose exact value is tracked (0: all flows)
+        self.re_bootstrap = j_data.get("re_bootstrap", 1000)    # bootstrap resamples for confidence interval of relative error
+        self.re_confidence = j_data.get("re_confidence", 0.95)
+        self.metrics = {family: family in parse_metrics(j_data.get("metrics", "full")) for family in metric_families}
+        self.metrics["mem_usage"] = self.metrics["mem_usage"] or j_data["mem_usage"]
+        self.mem_usage = self.metrics["mem_usage"]
+        self.cp_process = j_data.get("cp_process", False)       # run control plane in its own process
+        self.cp_queue_size = j_data.get("cp_queue_size", 4096)  # records in the data-to-control plane queue
+        self.cp_delay = j_data.get("cp_delay", 64)  # packets updated after a record before its result from the control plane process is applied
+        self.loop_engine = j_data.get("loop_engine", "sequential")  # "vectorized" draws loop attack packets in batches (same distribution, different random stream)
+        self.population = j_data.get("population", "python")    # "numpy" draws benign flows and attacker IPs with NumPy and keeps benign flows in columns (for millions of flows)
+        self.rng = j_data.get("rng", "global")      # "streams" gives each component of traffic generation its own random stream derived from seed
+        self.sample_rate = j_data.get("sample_rate", 1.0)   # preview: simulate only this fraction of connections (see preview.py)
+
+        if self.checkpoint_cycle < 0:
+            raise ValueError(f"Value checkpoint_cycle should be nonnegative: {self.checkpoint_cycle}")
+        if self.profile_ticks is not None and (len(self.profile_ticks) != 2 or self.profile_ticks[0] >= self.profile_ticks[1]):
+            raise ValueError(f"Value profile_ticks should be [start, end) with start < end: {self.profile_ticks}")
+        if self.profile_ticks is not None and not self.profile:
+            print(f"Warning: profile_ticks {self.profile_ticks} is ignored without profile", file=sys.stderr, flush=True)
+        if self.cp_delay < 0:
+            raise ValueError(f"Value cp_delay should be nonnegative: {self.cp_delay}")
+        if not 0 < self.sample_rate <= 1:
+            raise ValueError(f"Value sample_rate should be in (0, 1]: {self.sample_rate}")
+        if self.mem_usage_interval < 0:
+            raise ValueError(f"Value mem_usage_interval should be nonnegative: {self.mem_usage_interval}")
+        if self.re_sample_size < 0:
+            raise ValueError(f"Value re_sample_size should be nonnegative: {self.re_sample_size}")
+        if self.re_bootstrap <= 0:
+            raise ValueError(f"Value re_bootstrap should be positive: {self.re_bootstrap}")
+        if not 0 < self.re_confidence < 1:
+            raise ValueError(f"Value re_confidence should be between 0 and 1: {self.re_confidence}")
 
         # shrink experiment by 2**shrink_ratio_exp
         if self.attack_start_subtick < 0:
@@ -89,6 +140,32 @@ class Params:
         print(f"CP_PROCESSING_THRESHOLD: {self.cp_processing_threshold} Bps")
         print(f"DATA_TO_CONTROL_CHANNEL_BANDWIDTH: {self.data_to_control_channel_bandwidth} Bps")
         print(f"MEM_USAGE: {self.mem_usage}")
+        print(f"CHECKPOINT_CYCLE: {self.checkpoint_cycle} seconds")
+        print(f"PROFILE: {self.profile}")
+        print(f"PROFILE_TICKS: {self.profile_ticks}")
+        print(f"MEM_USAGE_INTERVAL: {self.mem_usage_interval} subticks")
+        print(f"RE_SAMPLE_SIZE: {self.re_sample_size}")
+        print(f"RE_BOOTSTRAP: {self.re_bootstrap}")
+        print(f"RE_CONFIDENCE: {self.re_confidence}")
+        print(f"METRICS: {[family for family in metric_families if self.metrics[family]]}")
+        print(f"CP_PROCESS: {self.cp_process}")
+        print(f"CP_QUEUE_SIZE: {self.cp_queue_size}")
+        print(f"CP_DELAY: {self.cp_delay}")
+        print(f"LOOP_ENGINE: {self.loop_engine}")
+        print(f"POPULATION: {self.population}")
+        print(f"RNG: {self.rng}")
+        print(f"SAMPLE_RATE: {self.sample_rate}")
+
+# Metrics are given as a tier name, or as a list (or comma-separated string) of metric families
+def parse_metrics(metrics: str | list[str]) -> list[str]:
+    if isinstance(metrics, str):
+        if metrics in metric_tiers:
+            return metric_tiers[metrics]
+        metrics = [x.strip() for x in metrics.split(",") if x.strip()]
+    for family in metrics:
+        if family not in metric_families:
+            raise ValueError(f"Incorrect metric: {family} (tiers: {list(metric_tiers)}, families: {metric_families})")
+    return list(metrics)
 
 def dict_with_int_key(d: dict[str]) -> dict[int]:
     tmp = dict()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+import numpy as np
+import hashlib
+import unittest
+
+n_group = 10        # random groups of sampled connections, for error bars
+count_names = ["true_positive", "false_positive", "false_negative", "true_negative", "uploaded", "packet"]
+
+# 64-bit hash of a connection (unordered src_ip, dst_ip), independent of the CRC hashes of the sketches
+@lru_cache(maxsize=60000)
+def connection_hash(src_ip: bytes, dst_ip: bytes, seed: int) -> int:
+    pair = src_ip + dst_ip if src_ip <= dst_ip else dst_ip + src_ip
+    return int.from_bytes(hashlib.blake2b(pair, digest_size=8, key=seed.to_bytes(8, "little", signed=True)).digest(), "little")
+
+# Flows of a task are sampled whole only if its keys include both src_ip and dst_ip; a dst_ip-only key would mix sampled and skipped connections
+def check_task_keys(flowkey_table: dict, defense_table: dict):
+    for task_id in flowkey_table:
+        for name, key in [("task_key", flowkey_table[task_id][1]), ("defense_task_key", defense_table[task_id][1])]:
+            if "src_ip" not in key or "dst_ip" not in key:
+                raise ValueError(f"Preview (sample_rate < 1) needs src_ip and dst_ip in {name} of task {task_id}: {key}")
+
+class Preview:
+    # Simulate only the packets of a hash-consistent sample_rate of connections; the other packets are skipped
+    # Both directions of a connection and all packets of an attacker to the victim are kept or dropped together
+    # Flow keys of all tasks include src_ip and dst_ip (see check_task_keys), so sampled flows are counted exactly and only shared loads (upload channel, rates) are weighted by 1/sample_rate
+    # Sampled connections are split into n_group random groups by their hash; the spread of the estimates of the groups gives the error bars
+    def __init__(self, sample_rate: float, seed: int):
+        self.sample_rate = sample_rate
+        self.weight = 1 / sample_rate
+        self.seed = seed
+        self.threshold = int(sample_rate * 2**64)
+        self.counts = np.zeros((n_group, len(count_names)), dtype=np.int64)
+
+    # Random group of the connection of the packet, or None if it is not sampled
+    def group(self, p) -> int | None:
+        h = connection_hash(p.src_ip, p.dst_ip, self.seed)
+        if h >= self.threshold:
+            return None
+        return h % n_group
+
+    def add(self, group: int, blocked: bool, attack: bool, uploaded: bool):
+        counts = self.counts[group]
+        counts[(0 if blocked else 2) + (0 if attack else 1)] += 1
+        counts[4] += uploaded
+        counts[5] += 1
+
+    # Estimate of the whole run (from all groups) and its standard error (from the estimates of single groups)
+    @staticmethod
+    def estimate(numerator: np.ndarray, denominator: np.ndarray, scale: float = 100) -> list[float | None]:
+        total = denominator.sum()
+        value = numerator.sum() / total * scale if total else 0
+        valid = denominator > 0
+        if valid.sum() < 2:
+            return [float(value), None]
+        groups = numerator[valid] / denominator[valid] * scale
+        return [float(value), float(np.std(groups, ddof=1) / np.sqrt(valid.sum()))]
+
+    # FPR, FNR and uploaded packet ratio (%), and uploaded packets of the whole traffic, each as [estimate, standard error]
+    # Relative error of each task as [mean, standard error] over its flows, from the histograms of run_sim
+    def summary(self, re_cerb: dict[int, list[int]] = None, shrink_ratio_exp: int = 0) -> dict:
+        tp, fp, fn, tn, uploaded, packet = self.counts.T
+        uploaded_total = uploaded * n_group * self.weight * 2**shrink_ratio_exp   # estimate of the whole traffic from each group
+        summary = {"sample_rate": self.sample_rate,
+                   "groups": n_group,
+                   "sampled_packet": int(packet.sum()),
+                   "fpr": self.estimate(fp, fp + tn),
+                   "fnr": self.estimate(fn, tp + fn),
+                   "uploaded_packet_ratio": self.estimate(uploaded, packet),
+                   "uploaded_packet": [float(uploaded.sum() * self.weight * 2**shrink_ratio_exp), float(np.std(uploaded_total, ddof=1) / np.sqrt(n_group))],
+                   "relative_error": {}}
+        bins = (np.arange(1000) + 0.5) / 1000
+        for task_id, count in (re_cerb or {}).items():
+            count = np.array(count)
+            n = count.sum()
+            if n == 0:
+                continue
+            mean = (bins * count).sum() / n
+            std = np.sqrt((count * (bins - mean)**2).sum() / max(n - 1, 1))
+            summary["relative_error"][task_id] = [float(mean), float(std / np.sqrt(n))]
+        return summary
+
+############################################
+# Unit Test
+############################################
+class TestPreview(unittest.TestCase):
+    def test_sample(self):
+        from packet import packet as pkt
+        preview = Preview(0.25, 1)
+        victim_ip = pkt.ip_to_bytes("192.168.0.1")
+        packets = [pkt.Packet(pkt.int_to_bytes(i, 4), pkt.int_to_bytes(0, 2), victim_ip, pkt.int_to_bytes(0, 2), "UDP", 64, 0, 5) for i in range(4000)]
+        groups = [preview.group(p) for p in packets]
+        sampled = sum(group is not None for group in groups)
+        self.assertTrue(800 <= sampled <= 1200)
+        # both directions of a connection are sampled together
+        for p, group in zip(packets[:100], groups):
+            reply = pkt.Packet(victim_ip, p.dst_port, p.src_ip, p.src_port, "UDP", 64, 0, 0)
+            self.assertEqual(preview.group(reply), group)
+
+        for p, group in zip(packets, groups):
+            if group is not None:
+                attack = int.from_bytes(p.src_ip, "big") % 2 == 0
+                preview.add(group, blocked=attack, attack=attack, uploaded=attack)
+        summary = preview.summary({0: [0] * 500 + [10] + [0] * 499})
+        self.assertEqual(summary["fpr"][0], 0)
+        self.assertEqual(summary["fnr"][0], 0)
+        self.assertAlmostEqual(summary["uploaded_packet_ratio"][0], 50, delta=10)
+        self.assertAlmostEqual(summary["uploaded_packet"][0], 2000, delta=400)
+        self.assertGreater(summary["uploaded_packet"][1], 0)
+        self.assertAlmostEqual(summary["relative_error"][0][0], 0.5005)
+        self.assertEqual(summary["relative_error"][0][1], 0)
+
+    def test_task_keys(self):
+        flowkey_table = {0: [[], ["src_ip", "dst_ip"], ["plus"], 1, False], 1: [[], ["dst_ip", "dst_port"], ["plus"], 1, False]}
+        defense_table = {0: [[], ["dst_ip", "src_ip"], 1, "pass", "drop"], 1: [[], ["src_ip", "dst_ip"], 1, "pass", "drop"]}
+        with self.assertRaises(ValueError):
+            check_task_keys(flowkey_table, defense_table)
+        check_task_keys({0: flowkey_table[0]}, {0: defense_table[0]})
+
+if __name__ == '__main__':
+    unittest.main()
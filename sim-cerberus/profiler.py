@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+import cProfile
+import time
+import unittest
+
+class Profiler:
+    # Wall-clock time per stage and packet/byte throughput per subtick
+    # Stages are inclusive: time of a nested stage (e.g., co_monitoring inside update) is also counted in the outer stage
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stage_time = {}
+        self.stage_count = {}
+        self.packets = []
+        self.bytes = []
+        self.seconds = []
+        self.cprofile = None
+        self.wrapped = []   # (obj, name, original or None if it was not an attribute of obj itself)
+
+    def add(self, stage: str, seconds: float):
+        if stage not in self.stage_time:
+            self.stage_time[stage] = 0.0
+            self.stage_count[stage] = 0
+        self.stage_time[stage] += seconds
+        self.stage_count[stage] += 1
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    # Replace obj.name (method or module function) with a timed wrapper; nothing is added to the call when not profiling
+    def wrap(self, obj, name: str, stage: str = None):
+        original = getattr(obj, name)
+        self.wrapped.append((obj, name, vars(obj)[name] if name in vars(obj) else None))
+        stage = stage or name
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        setattr(obj, name, timed)
+        return original
+
+    def unwrap(self):
+        for obj, name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, original)
+        self.wrapped = []
+
+    def add_subtick(self, n_packet: int, n_byte: int, seconds: float):
+        self.packets.append(n_packet)
+        self.bytes.append(n_byte)
+        self.seconds.append(seconds)
+
+    def enable_cprofile(self):
+        if self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+        self.cprofile.enable()
+
+    def disable_cprofile(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    # The dump can be read by pstats, snakeviz or flameprof
+    def dump_cprofile(self, filename: str) -> bool:
+        if self.cprofile is None:
+            return False
+        self.cprofile.dump_stats(filename)
+        return True
+
+    def summary(self) -> dict:
+        total = time.perf_counter() - self.start_time
+        return {"total": total,
+                "stages": {stage: [self.stage_time[stage], self.stage_count[stage]] for stage in self.stage_time},
+                "packets": self.packets,
+                "bytes": self.bytes,
+                "seconds": self.seconds}
+
+    def print_summary(self):
+        summary = self.summary()
+        total = summary["total"]
+        print(f"{'Stage':<24}{'Time (s)':>12}{'Share (%)':>12}{'Calls':>12}{'us/call':>12}")
+        for stage, (seconds, count) in sorted(summary["stages"].items(), key=lambda x: -x[1][0]):
+            print(f"{stage:<24}{seconds:>12.2f}{seconds/total*100:>12.1f}{count:>12}{seconds/count*1e6:>12.2f}")
+        print(f"{'Total':<24}{total:>12.2f}")
+        seconds = sum(self.seconds)
+        if seconds > 0:
+            print(f"Throughput: {sum(self.packets)/seconds:.0f} packets/s, {sum(self.bytes)*8/seconds/1000/1000:.2f} Mbps simulated")
+
+############################################
+# Unit Test
+############################################
+class TestProfiler(unittest.TestCase):
+    def test_wrap(self):
+        class Target:
+            def double(self, x):
+                return 2 * x
+        profiler = Profiler()
+        target = Target()
+        profiler.wrap(target, "double", "stage")
+        self.assertEqual([target.double(x) for x in range(5)], [0, 2, 4, 6, 8])
+        with profiler.stage("stage"):
+            pass
+        self.assertEqual(profiler.stage_count["stage"], 6)
+        self.assertGreaterEqual(profiler.stage_time["stage"], 0)
+        profiler.unwrap()
+        self.assertNotIn("double", vars(target))
+
+if __name__ == '__main__':
+    unittest.main()
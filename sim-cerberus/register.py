@@ -3,15 +3,17 @@
 
 from common import *
 import cms as cms
+import counters
 import unittest
 
 class Register:
-    def __init__(self, n_task: int, counter_sizes: list[int], array_sizes: list[int], elephant_array_sizes: list[int], n_hash: int, counter_size: int = 32, cms_array_size: int = 16):
+    def __init__(self, n_task: int, counter_sizes: list[int], array_sizes: list[int], elephant_array_sizes: list[int], n_hash: int, counter_size: int = 32, cms_array_size: int = 16, count: dict[str, int] = None):
         self.counter_size = counter_size
         self.cms_array_size = 2**cms_array_size # Initial array size = 2**16
         self.n_task = n_task
         self.n_hash = n_hash
-        self.cms = [cms.CountMinSketch(counter_sizes[i], 2**array_sizes[i], n_hash) for i in range(n_task)]
+        self.count = counters.count if count is None else count     # event counters of the owning Cerberus
+        self.cms = [cms.CountMinSketch(counter_sizes[i], 2**array_sizes[i], n_hash, self.count) for i in range(n_task)]
         # Note: we do not allow size change of elephant region for simplicity
         if elephant_array_sizes:
             self.elephant_region = [{} for _ in range(n_task)] # counter size is same as self.counter_size
@@ -19,6 +21,7 @@ class Register:
         else:
             self.elephant_region = []
             self.elephant_array_sizes = []
+        self.elephant_key_bytes = [0] * len(self.elephant_region)  # total size of flow keys in elephant region
         # self.integrity_check()
 
     # Check if initial reigister size changed
@@ -40,6 +43,7 @@ class Register:
         # IF elephant -> update elephant -> (list[overflow], list[current_value])
         # ELSE -> update cms
         if self.is_elephant(task_index, element):
+            self.count["elephant_hit"] += 1
             return self.update_elephant(task_index, operation, element, value)
 
         if operation == "plus":
@@ -80,11 +84,25 @@ class Register:
         for element in evicted_keys:
             read_value = self.elephant_region[task_index].pop(element)
             result[element] = self.cms[task_index].plus(element, read_value)
+            self.elephant_key_bytes[task_index] -= sys.getsizeof(element)
+            self.count["elephant_evict"] += 1
 
         for element in inserted_keys:
             self.elephant_region[task_index][element] = 0
+            self.elephant_key_bytes[task_index] += sys.getsizeof(element)
+            self.count["elephant_insert"] += 1
         return result
 
+    def clear_elephant_region(self):
+        self.elephant_region = [{} for _ in range(self.n_task)]
+        self.elephant_key_bytes = [0] * self.n_task
+
+    def memory_usage(self) -> int:
+        return sum(x.memory_usage() for x in self.cms)
+
+    def elephant_memory_usage(self) -> int:
+        return sum(sys.getsizeof(self.elephant_region[i]) + self.elephant_key_bytes[i] for i in range(len(self.elephant_region)))
+
     def is_elephant(self, task_index: int, element) -> bool:
         # Check if flow is elephant
         return self.elephant_region and element in self.elephant_region[task_index]
@@ -2,30 +2,76 @@
 # -*- coding: utf-8 -*-
 
 from itertools import combinations
-import subprocess
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
+import multiprocessing as mp
 from datetime import datetime
+import threading
+import traceback
 import time
 import os
+import sys
 import glob
 import flowkey
+import params
+import run_sim
+import scheduler
+import manifest
+from work_queue import WorkQueue
+from sweep_spec import SweepSpec, exclude_exp
 
-exclude_exp = [3, 14, 15]               # Coremelt, ACK flood, RST/FIN flood
 large_exp = [12, 13, 14, 15]
+runs_per_worker = 20                    # workers are replaced after this many experiments to cap memory fragmentation
+
+progress_queue = None   # set in each worker by init_worker
 
 def file_exists(directory: str, prefix: str) -> bool:
     pattern = os.path.join(directory, f"{prefix}*")
     matching_files = glob.glob(pattern)
     return True if matching_files else False
 
-def run_program(param_filename: str, exp_name: str):
-    with open(f"log/{param_filename}.out", 'w') as out_file, open(f"log/{param_filename}.err", 'w') as err_file:
-        subprocess.run(
-            ['python3', 'run_sim.py', param_filename, exp_name],
-            stdout=out_file,
-            stderr=err_file,
-            text=True
-        )
+def format_seconds(seconds: float) -> str:
+    hours, rem = divmod(seconds, 3600)
+    minutes, seconds = divmod(rem, 60)
+    return f"{int(hours):02}:{int(minutes):02}:{seconds:05.2f}"
+
+def init_worker(queue):
+    global progress_queue
+    progress_queue = queue
+
+# Runs in a long-lived worker, which imported run_sim and its dependencies once
+# Returns the results filename, the peak memory and the wall time of the run
+# The run is recorded in the manifest under key, and counts as done only after its results are saved
+def run_program(param_filename: str, exp_name: str, key: str, setting: dict = None) -> tuple[str, int, float]:
+    def progress(next_tick: int, num_tick: int):
+        progress_queue.put((param_filename, next_tick, num_tick))
+    with open(f"log/{param_filename}.out", 'w') as out_file, open(f"log/{param_filename}.err", 'w') as err_file, redirect_stdout(out_file), redirect_stderr(err_file):
+        print(f"Started experiment {param_filename} {exp_name} at {datetime.now()} (worker {os.getpid()})", flush=True)
+        start_time = time.time()
+        scheduler.reset_peak_memory()
+        runs = manifest.Manifest()
+        runs.start(key, param_filename, exp_name)
+        try:
+            filename = run_sim.main(param_filename, exp_name, resume=True, progress=progress, j_data=setting)
+        except BaseException as e:
+            traceback.print_exc()
+            runs.fail(key, param_filename, exp_name, repr(e))
+            raise
+        elapsed_time = time.time() - start_time
+        runs.finish(key, param_filename, exp_name, filename, elapsed_time)
+        print(f"Execution time: {format_seconds(elapsed_time)}", flush=True)
+        print(f"Finished experiment {param_filename} {exp_name} at {datetime.now()}", flush=True)
+    return filename, scheduler.peak_memory(), elapsed_time
+
+# Print progress of running experiments reported by workers, every 10% of ticks
+def report_progress(queue):
+    reported = {}
+    while (message := queue.get()) is not None:
+        param_filename, next_tick, num_tick = message
+        percent = next_tick * 100 // num_tick // 10 * 10
+        if percent > reported.get(param_filename, 0):
+            reported[param_filename] = percent
+            print(f"Progress {param_filename}: {percent}% ({next_tick}/{num_tick} ticks)", flush=True)
 
 def exp_count(n_comb: int, exp_name: str):
     combination_path = f"combination {n_comb} {exp_name}/" if exp_name else f"combination {n_comb}/"
@@ -57,50 +103,109 @@ def exp_count(n_comb: int, exp_name: str):
     print(f"Left normal experiments: {len(left_exp_normal)}/{total_exp_normal}\t{left_exp_normal}", flush=True)
     print(f"Left large experiments: {len(left_exp_large)}/{total_exp_large}\t{left_exp_large}", flush=True)
 
-def main(n_comb: int, exp_name: str):
-    combination_path = f"combination {n_comb} {exp_name}/" if exp_name else f"combination {n_comb}/"
+# Experiments are submitted longest first by their predicted runtime, and packed against memory_budget (default: 80% of system memory) by their predicted peak memory
+# With work_queue, experiments are shared through queue/<combination>/ with other nodes running the same sweep on the same directory
+# spec: experiments of the sweep (default: the params files written by setting_maker_comb); their settings are handed to workers, which don't read params files
+def main(n_comb: int, exp_name: str, max_workers: int = os.cpu_count(), memory_budget: int = None, work_queue: bool = False, spec: SweepSpec = None):
+    spec = spec or SweepSpec(n_comb, exp_name, in_memory=False)
+    combination_path = spec.combination_path
     if not os.path.exists(f"results/{combination_path}"):
         os.makedirs(f"results/{combination_path}")
     if not os.path.exists(f"log/{combination_path}"):
         os.makedirs(f"log/{combination_path}")
 
-    with ProcessPoolExecutor(max_workers=10) as pool_normal, ProcessPoolExecutor(max_workers=2) as pool_large:  # pool_normal expected mem_usage < 600MB, pool_large expected mem_usage < 1100MB
-        total_defense = list(range(1, 16))
-        total_exp_normal = 0
-        total_exp_large = 0
-        left_exp_normal = []
-        left_exp_large = []
-        fk = flowkey.Flowkey()
-        futures = {}
-        for defense_nos in combinations(total_defense, n_comb):
-            is_bf = [fk.get_flowkey(x)[4] for x in defense_nos]
-            if (n_comb - sum(is_bf) >= 2 or n_comb == 1) and not any(n in defense_nos for n in exclude_exp):
-                filename = "_".join([str(x) for x in defense_nos])
-                if not file_exists(f"results/{combination_path}", filename):
-                    param_filename = f"{combination_path}{filename}"
-                    if not any(n in defense_nos for n in large_exp):
-                        left_exp_normal.append(filename)
-                        futures[pool_normal.submit(run_program, param_filename, exp_name)] = filename, "normal"
-                    else:
-                        left_exp_large.append(filename)
-                        futures[pool_large.submit(run_program, param_filename, exp_name)] = filename, "large"
+    # an experiment is left unless the manifest has completed results of the same params, attack profile and code (possibly from another sweep)
+    runs = manifest.Manifest()
+    version = manifest.code_version()
+    settings = spec.settings()
+    keys = {}
+    total_exp = len(settings)
+    left_exp = []
+    reused_exp = []
+    recorded = runs.recorded_results()
+    for filename, setting in settings.items():
+        keys[filename] = manifest.experiment_key(setting, version)
+        results = runs.completed(keys[filename])
+        if results is None and runs.get(keys[filename]) is None:
+            results = runs.adopt(keys[filename], f"{combination_path}{filename}", exp_name, recorded)     # results of sweeps before the manifest
+        if results is None:
+            left_exp.append(filename)
+            continue
+        reused = manifest.reuse_results(results, f"{combination_path}{filename}", exp_name)
+        if reused != results:
+            runs.reused(keys[filename], reused)
+            reused_exp.append(filename)
+    if reused_exp:
+        print(f"Reused results of the same experiments: {reused_exp}", flush=True)
+    print(f"Left experiments: {len(left_exp)}/{total_exp}\t{left_exp}", flush=True)
+    wq = None
+    if work_queue:
+        wq = WorkQueue(f"queue/{combination_path}")
+        wq.add(left_exp)
+        wq.start_heartbeat()
+        left_exp = wq.names("pending")
+        print(f"Node {wq.node} joined the work queue: {len(left_exp)} pending, {len(wq.names('claimed'))} claimed by other nodes", flush=True)
 
-                if not any(n in defense_nos for n in large_exp):
-                    total_exp_normal += 1
+    history = scheduler.MemoryHistory()
+    model = scheduler.RuntimeModel()
+    ctx = mp.get_context("spawn")     # max_tasks_per_child can't be used with fork
+    queue = ctx.Queue()
+    reporter = threading.Thread(target=report_progress, args=(queue,), daemon=True)
+    reporter.start()
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, initializer=init_worker, initargs=(queue,), max_tasks_per_child=runs_per_worker) as pool:
+        sched = scheduler.MemoryScheduler(pool, max_workers, memory_budget, claim=wq.claim if wq else None)
+        estimated = {}
+        features = {}
+        def add(filename: str):
+            param_filename = f"{combination_path}{filename}"
+            param = params.Params(param_filename, j_data=settings[filename])
+            estimated[filename] = scheduler.estimate_memory(param)
+            features[filename] = scheduler.runtime_features(param)
+            sched.add(filename, run_program, (param_filename, exp_name, keys[filename], settings[filename]), history.predict(param_filename, estimated[filename]), model.predict(features[filename]))
+        for filename in left_exp:
+            add(filename)
+        print(f"Memory budget: {sched.memory_budget/scheduler.MB:.0f}MB, workers: {max_workers}, ETA: {format_seconds(sched.eta())}", flush=True)
+
+        while True:
+            for filename, future in sched.run():
+                try:
+                    results_filename, peak, seconds = future.result()
+                    history.add(f"{combination_path}{filename}", estimated[filename], peak)
+                    history.save()
+                    model.add(f"{combination_path}{filename}", features[filename], seconds)
+                    model.save()
+                    if wq:
+                        wq.complete(filename, results_filename)
+                    print(f"Finished experiment {filename} ({peak/scheduler.MB:.0f}MB, {format_seconds(seconds)}): {results_filename}", flush=True)
+                except Exception as e:
+                    if wq:
+                        wq.fail(filename, repr(e))
+                    print(f"Failed experiment {filename}: {e!r}", flush=True)
+                if wq:
+                    print(f"Queue: {len(wq.names('pending'))} pending, {len(wq.names('claimed'))} claimed, {len(wq.names('done'))} done, {len(wq.names('failed'))} failed", flush=True)
                 else:
-                    total_exp_large += 1
-        print(f"Left normal experiments: {len(left_exp_normal)}/{total_exp_normal}\t{left_exp_normal}", flush=True)
-        print(f"Left large experiments: {len(left_exp_large)}/{total_exp_large}\t{left_exp_large}", flush=True)
-
-        for future in as_completed(futures):
-            filename, pool_type = futures[future]
-            print(f"Finished experiment {filename} ({pool_type})", flush=True)
-            if pool_type == "large":
-                left_exp_large.remove(filename)
-            elif pool_type == "normal":
-                left_exp_normal.remove(filename)
-            print(f"Left normal experiments: {len(left_exp_normal)}/{total_exp_normal}\t{left_exp_normal}", flush=True)
-            print(f"Left large experiments: {len(left_exp_large)}/{total_exp_large}\t{left_exp_large}", flush=True)
+                    left_exp.remove(filename)
+                    print(f"Left experiments: {len(left_exp)}/{total_exp}\t{left_exp}", flush=True)
+                if sched.pending or sched.running:
+                    print(f"ETA: {format_seconds(sched.eta())}", flush=True)
+            if not wq:
+                break
+            # take over experiments of crashed nodes, and wait until the claims of other nodes are finished
+            requeued = wq.requeue_expired()
+            if requeued:
+                print(f"Requeued expired claims: {requeued}", flush=True)
+            pending = wq.names("pending")
+            if pending:
+                for filename in pending:
+                    add(filename)
+            elif wq.names("claimed"):
+                time.sleep(wq.heartbeat_interval)
+            else:
+                break
+    if wq:
+        wq.stop_heartbeat()
+    queue.put(None)
+    reporter.join()
 
 if __name__ == '__main__':
     n_comb = 1
@@ -109,9 +214,9 @@ if __name__ == '__main__':
     print(f"Started experiment combination {n_comb} {exp_name} at {datetime.now()}", flush=True)
     start_time = time.time()
     # exp_count(n_comb, exp_name)
-    main(n_comb, exp_name)
+    # --in-memory: generate params and attack profiles of the sweep instead of reading the files of setting_maker_comb
+    spec = SweepSpec(n_comb, exp_name, in_memory="--in-memory" in sys.argv[1:])
+    main(n_comb, exp_name, work_queue="--queue" in sys.argv[1:], spec=spec)
     elapsed_time = time.time() - start_time
-    hours, rem = divmod(elapsed_time, 3600)
-    minutes, seconds = divmod(rem, 60)
-    print(f"Execution time: {int(hours):02}:{int(minutes):02}:{seconds:05.2f}", flush=True)
+    print(f"Execution time: {format_seconds(elapsed_time)}", flush=True)
     print(f"Finished experiment combination {n_comb} {exp_name} at {datetime.now()}", flush=True)
@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import cerberus
+import counters
+import ground_truth
+import profiler
+import preview
 from packet import attack_generator as gen
 import save_results
 import defense
@@ -9,12 +13,17 @@ import flowkey
 import params
 from common import *
 import numpy as np
+from contextlib import nullcontext
 from datetime import datetime
 import time
 from tqdm import tqdm
 import random
+import pickle
+import hashlib
+import json
+import os
 import sys
-# import tracemalloc
+import tracemalloc
 
 defense_dict = {
     -1: "Pcap",
@@ -36,199 +45,362 @@ defense_dict = {
     15: "RST FIN flood"
 }
 
-def update_true_value(task_id: int, operation: str, flow_key, amount: int, true_value: list[dict]):
-    if operation == "plus":
-        if flow_key in true_value[task_id]:
-            true_value[task_id][flow_key] += amount
-        else:
-            true_value[task_id][flow_key] = amount
-    elif operation == "minus":
-        if flow_key in true_value[task_id]:
-            true_value[task_id][flow_key] -= amount
-        else:
-            true_value[task_id][flow_key] = -amount
-    elif operation == "setbitTrue":
-        if flow_key in true_value[task_id]:
-            true_value[task_id][flow_key] |= amount
-        else:
-            true_value[task_id][flow_key] = amount
-    elif operation == "setbitFalse":
-        true_value[task_id][flow_key] = amount
-    else:
-        raise ValueError(f"Incorrect operation: {operation}")
-
-def relative_error_cerb(cerb: cerberus.Cerberus, true_value: list[dict], task_id: int) -> list[int]:
-    re = []
-    for flow_key in true_value[task_id]:
-        read_value = cerb.read(task_id, flow_key)
-        if true_value[task_id][flow_key] != 0:
-            re.append(min(abs(read_value - true_value[task_id][flow_key]) / true_value[task_id][flow_key], 1))
-        elif read_value == 0:
-            re.append(0)
-        else:
-            re.append(1)
+def relative_error_cerb(cerb: cerberus.Cerberus, true_value: ground_truth.GroundTruth, task_id: int) -> list[int]:
+    flow_keys, true = true_value.flows(task_id)
+    read_value = cerb.read_many(task_id, flow_keys)
+    nonzero = true != 0
+    re = np.where(read_value == 0, 0.0, 1.0)
+    re[nonzero] = np.minimum(np.abs(read_value[nonzero] - true[nonzero]) / true[nonzero], 1)
     count, _ = np.histogram(re, bins=1000, range=(0, 1))
     return count.tolist()
 
-def main(param_filename: str, exp_name: str):
-    task_per_reg = []
-    slice_per_registers = []
-    cp_slice_per_tasks = []
-    elephant_array_sizes = []
-    array_size_per_registers = []
-    n_register = 0
-    re_cerb = {}
-    param = params.Params(param_filename)
-    if param.mem_usage:
-        tracemalloc.start()
-    mem_usage = {x: [] for x in ["Total", "Cerberus", "True_value", "Traffic"]}
-    fpr = []
-    fnr = []
-    for task_id in sorted(param.reg_alloc_table):
-        reg_id, dp_counter_size, cp_counter_size, array_size, elephant_array_size = param.reg_alloc_table[task_id]
-        if n_register <= reg_id:
-            task_per_reg.append([])
-            slice_per_registers.append([])
-            array_size_per_registers.append([])
-            elephant_array_sizes.append([])
-            n_register += 1
-        task_per_reg[reg_id].append(task_id)
-        slice_per_registers[reg_id].append(dp_counter_size)
-        cp_slice_per_tasks.append(cp_counter_size)
-        array_size_per_registers[reg_id].append(array_size)
-        elephant_array_sizes[reg_id].append(elephant_array_size)
-        re_cerb[task_id] = [0] * 1000   # count
-    if not param.elephant_region:
-        elephant_array_sizes = [[] for _ in range(n_register)]
-    refresh_cycle_per_attack = {defense_dict[param.task_match_action_table[i]['defense_no']]: param.refresh_cycle[i] for i in param.task_match_action_table}
-
+def make_tables(param: params.Params) -> tuple[dict, dict]:
     df = defense.Defense()
     defense_table = {task_id: df.get_defense(param.task_match_action_table[task_id]["defense_no"]) if "defense_condition_key" not in param.task_match_action_table[task_id]
                      else [param.task_match_action_table[task_id]["defense_condition_key"], param.task_match_action_table[task_id]["defense_task_key"], param.task_match_action_table[task_id]["defense_threshold"], param.task_match_action_table[task_id]["if_action"], param.task_match_action_table[task_id]["else_action"]]
                      for task_id in param.task_match_action_table}
+    # defense_threshold alone overrides the threshold of a predefined defense
+    for task_id in param.task_match_action_table:
+        if "defense_condition_key" not in param.task_match_action_table[task_id] and "defense_threshold" in param.task_match_action_table[task_id]:
+            defense_table[task_id] = list(defense_table[task_id])
+            defense_table[task_id][2] = param.task_match_action_table[task_id]["defense_threshold"]
     fk = flowkey.Flowkey()
     flowkey_table = {task_id: fk.get_flowkey(param.task_match_action_table[task_id]["defense_no"]) if "condition_key" not in param.task_match_action_table[task_id]
                      else [param.task_match_action_table[task_id]["condition_key"], param.task_match_action_table[task_id]["task_key"], param.task_match_action_table[task_id]["action"], param.task_match_action_table[task_id]["value"], param.task_match_action_table[task_id]["is_bf"]]
                      for task_id in param.task_match_action_table}
+    return defense_table, flowkey_table
 
-    cerb = cerberus.Cerberus(task_per_reg, slice_per_registers, cp_slice_per_tasks, array_size_per_registers, elephant_array_sizes, n_register, flowkey_table, defense_table, param)
-    true_value = [{} for _ in range(len(cp_slice_per_tasks))]
-    # PCAP_FILE not used
-    random.seed(param.seed)
-    generator = gen.AttackGenerator(param.benign_unique_flowkey, param.attack_unique_ip, param.atk_profile, param.benign_volume, param.attack_volume, refresh_cycle_per_attack, param.tick_divisor, param.attack_tick_to_subtick, param.attack_start_subtick)
-    true_positive = 0   # blocked malicious
-    false_positive = 0  # blocked benign
-    false_negative = 0  # unblocked malicious
-    true_negative = 0   # unblocked benign
-    rate = {atk: [] for atk in generator.attack_str_key + ["Attack total", "Benign"]}
-
-    epoch = [0] * len(sum(task_per_reg, []))
-    current_window = [0] * len(sum(task_per_reg, []))
-
-    num_tick = ((generator.max_tick+1)*param.attack_tick_to_subtick + param.attack_start_subtick - 1)//param.tick_divisor + 1
-    expected_attack_total_bytes = sum([sum(generator.rate[atk]) for atk in generator.rate]) \
-                                + sum([sum([sum([x*y for x, y in zip(generator.seq_size[atk][i], generator.seq_count[atk][i])])
-                                            * sum(generator.seq_ratio[atk][i][2*j+1] - generator.seq_ratio[atk][i][2*j] for j in range(len(generator.seq_ratio[atk][i])//2))
-                                            for i in range(len(generator.seq_size[atk]))]) for atk in generator.seq_size]) * param.attack_unique_ip \
-                                + sum([sum(generator.loop_rate[atk]) for atk in generator.loop_rate])
-    benign_total_bytes = param.benign_volume*num_tick * 125 * 1000 * 1000
-    total_length = round(expected_attack_total_bytes + benign_total_bytes)
-    pbar = tqdm(total=total_length)
-
-    random.seed(param.seed)
-    for tick in range(num_tick):
-        for subtick in range(param.tick_divisor):
-            current_subtick = tick * param.tick_divisor + subtick
-            generator.generate(current_subtick)
-            for atk in rate:
-                rate[atk].append(0)
-
-            for p in generator.traffic[current_subtick]:
-                # update CMS and blocklist, and block
-                blocked = cerb.update(p)
-                for task_id in sorted(param.task_match_action_table):
-                    condition_key, task_key, task_action, task_value, _ = flowkey_table[task_id]
-                    condition, flow_key = cerberus.find_flowkey(condition_key, task_key, p)
-                    if (condition):
-                        amount = p.packet_size if task_value == 0 else task_value
-                        for operation in task_action:
-                            update_true_value(task_id, operation, flow_key, amount, true_value)
-
-                # accumulate whether blocking was successful
-                if any(blocked):
-                    if 1 <= p.attack_type <= 15:
-                        true_positive += 1
-                    else:
-                        false_positive += 1
-                else:
-                    if 1 <= p.attack_type <= 15:
-                        false_negative += 1
-                    else:
-                        true_negative += 1
+class Simulation:
+    # generator: traffic generator shared with other simulations in lockstep (built from param if None)
+    def __init__(self, param: params.Params, generator: gen.AttackGenerator = None):
+        self.param = param
+        self.metrics = param.metrics
+        task_per_reg = []
+        slice_per_registers = []
+        cp_slice_per_tasks = []
+        elephant_array_sizes = []
+        array_size_per_registers = []
+        n_register = 0
+        self.re_cerb = {}
+        if param.mem_usage and param.mem_usage_interval:
+            tracemalloc.start()
+        self.mem_usage = {x: [] for x in ["Total", "Cerberus", "True_value", "Traffic", "Sketch", "Elephant", "Blocklist"]}
+        self.traced_memory = 0
+        self.fpr = []
+        self.fnr = []
+        self.n_packet = 0
+        for task_id in sorted(param.reg_alloc_table):
+            reg_id, dp_counter_size, cp_counter_size, array_size, elephant_array_size = param.reg_alloc_table[task_id]
+            if n_register <= reg_id:
+                task_per_reg.append([])
+                slice_per_registers.append([])
+                array_size_per_registers.append([])
+                elephant_array_sizes.append([])
+                n_register += 1
+            task_per_reg[reg_id].append(task_id)
+            slice_per_registers[reg_id].append(dp_counter_size)
+            cp_slice_per_tasks.append(cp_counter_size)
+            array_size_per_registers[reg_id].append(array_size)
+            elephant_array_sizes[reg_id].append(elephant_array_size)
+            self.re_cerb[task_id] = [0] * 1000   # count
+        if not param.elephant_region:
+            elephant_array_sizes = [[] for _ in range(n_register)]
+        refresh_cycle_per_attack = {defense_dict[param.task_match_action_table[i]['defense_no']]: param.refresh_cycle[i] for i in param.task_match_action_table}
+
+        defense_table, flowkey_table = make_tables(param)
+        if param.sample_rate < 1:
+            preview.check_task_keys(flowkey_table, defense_table)
+
+        self.task_ids = sum(task_per_reg, [])
+        self.cerb = cerberus.Cerberus(task_per_reg, slice_per_registers, cp_slice_per_tasks, array_size_per_registers, elephant_array_sizes, n_register, flowkey_table, defense_table, param)
+        self.true_value = ground_truth.GroundTruth(flowkey_table, sample_size=param.re_sample_size)
+        self.preview = preview.Preview(param.sample_rate, param.seed) if param.sample_rate < 1 else None
+        # PCAP_FILE not used
+        random.seed(param.seed)
+        self.generator = generator or gen.AttackGenerator(param.benign_unique_flowkey, param.attack_unique_ip, param.atk_profile, param.benign_volume, param.attack_volume, refresh_cycle_per_attack, param.tick_divisor, param.attack_tick_to_subtick, param.attack_start_subtick, param.loop_engine, param.population, param.rng, param.seed)
+        self.rate = {atk: [] for atk in self.generator.attack_str_key + ["Attack total", "Benign"]} if self.metrics["rate"] else {}
+
+        self.epoch = [0] * len(self.task_ids)
+        self.current_window = [0] * len(self.task_ids)
+        self.num_tick = ((self.generator.max_tick+1)*param.attack_tick_to_subtick + param.attack_start_subtick - 1)//param.tick_divisor + 1
+        random.seed(param.seed)
+
+        self.next_tick = 0
+        self.processed_bytes = 0
+        self.profiler = None
+        if param.profile:
+            self.start_profiler()
+
+    def start_profiler(self, prof: profiler.Profiler = None):
+        self.profiler = prof or profiler.Profiler()
+        self.profiler.wrap(self.generator, "generate")
+        self.profiler.wrap(gen, "combine_lists")
+        self.profiler.wrap(self.cerb, "update")
+        self.profiler.wrap(self.cerb.control_plane, "co_monitoring")
+        self.profiler.wrap(self.cerb, "update_subtick")
+        self.profiler.wrap(self.cerb, "update_tick")
+        self.profiler.wrap(self.true_value, "add", "true_value")
+        self.profiler.wrap(self.true_value, "flush", "true_value")
+
+    def stage(self, stage: str):
+        return self.profiler.stage(stage) if self.profiler else nullcontext()
+
+    def expected_total_bytes(self) -> int:
+        generator = self.generator
+        expected_attack_total_bytes = sum([sum(generator.rate[atk]) for atk in generator.rate]) \
+                                    + sum([sum([sum([x*y for x, y in zip(generator.seq_size[atk][i], generator.seq_count[atk][i])])
+                                                * sum(generator.seq_ratio[atk][i][2*j+1] - generator.seq_ratio[atk][i][2*j] for j in range(len(generator.seq_ratio[atk][i])//2))
+                                                for i in range(len(generator.seq_size[atk]))]) for atk in generator.seq_size]) * self.param.attack_unique_ip \
+                                    + sum([sum(generator.loop_rate[atk]) for atk in generator.loop_rate])
+        benign_total_bytes = self.param.benign_volume*self.num_tick * 125 * 1000 * 1000
+        return round(expected_attack_total_bytes + benign_total_bytes)
+
+    # Run until end_tick (default: the end of the experiment); can be continued by calling again
+    # progress(next_tick, num_tick) is called after every tick
+    def run(self, checkpoint_path: str = None, end_tick: int = None, progress=None):
+        self.pbar = tqdm(total=self.expected_total_bytes(), initial=self.processed_bytes)
+        for tick in range(self.next_tick, self.num_tick if end_tick is None else min(end_tick, self.num_tick)):
+            self.run_tick(tick)
+            self.next_tick = tick + 1
+            if progress:
+                progress(self.next_tick, self.num_tick)
+            if checkpoint_path and self.param.checkpoint_cycle and self.next_tick % self.param.checkpoint_cycle == 0 and self.next_tick < self.num_tick:
+                self.save_checkpoint(checkpoint_path)
+        self.processed_bytes = self.pbar.n
+        self.pbar.close()
+
+    # Checkpoints are taken at tick boundaries, where the control plane process has no record in flight
+    def save_checkpoint(self, path: str):
+        prof = self.profiler
+        if prof:
+            prof.unwrap()
+        state = {"simulation": self, "key": checkpoint_key(self.param), "random": random.getstate()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+        if prof:
+            self.start_profiler(prof)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if "pbar" in state:
+            state["processed_bytes"] = state.pop("pbar").n
+        state["profiler"] = None     # timings belong to the process that measured them
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.param.mem_usage and self.param.mem_usage_interval:
+            tracemalloc.start()
+        if self.param.profile:
+            self.start_profiler()
+
+    def run_tick(self, tick: int):
+        profile_tick = self.profiler and self.param.profile_ticks and self.param.profile_ticks[0] <= tick < self.param.profile_ticks[1]
+        if profile_tick:
+            self.profiler.enable_cprofile()
+        for subtick in range(self.param.tick_divisor):
+            current_subtick = tick * self.param.tick_divisor + subtick
+            start_time = time.perf_counter()
+            self.generator.generate(current_subtick)
+            self.process_subtick(current_subtick, self.generator.traffic[current_subtick])
+            if self.profiler:
+                self.profiler.add_subtick(len(self.generator.traffic[current_subtick]), sum(p.packet_size for p in self.generator.traffic[current_subtick]), time.perf_counter() - start_time)
+            self.generator.delete_traffic(current_subtick)
+        self.end_tick(tick)
+        if profile_tick:
+            self.profiler.disable_cprofile()
+
+    def process_subtick(self, current_subtick: int, traffic: list):
+        self.begin_subtick(current_subtick)
+        for p in traffic:
+            self.process_packet(p, current_subtick)
+        self.end_subtick(current_subtick)
+
+    def begin_subtick(self, current_subtick: int):
+        self.true_positive = 0   # blocked malicious
+        self.false_positive = 0  # blocked benign
+        self.false_negative = 0  # unblocked malicious
+        self.true_negative = 0   # unblocked benign
+        for atk in self.rate:
+            self.rate[atk].append(0)
 
-                rate[defense_dict[p.attack_type]][current_subtick] += p.packet_size / 125 / 1000 / 1000 / (param.statistics_cycle_subtick/param.tick_divisor)
+    def process_packet(self, p, current_subtick: int):
+        # preview: packets of connections that are not sampled are skipped
+        if self.preview:
+            group = self.preview.group(p)
+            if group is None:
+                self.pbar.update(p.packet_size)
+                return
+            uploaded = self.cerb.uploaded_packet[self.cerb.n_task]
+
+        # update CMS and blocklist, and block
+        blocked = self.cerb.update(p)
+        if self.preview:
+            self.preview.add(group, any(blocked), 1 <= p.attack_type <= 15, self.cerb.uploaded_packet[self.cerb.n_task] > uploaded)
+        if self.metrics["true_value"]:
+            for task_id, flow_key, amount in self.cerb.matched_flows:
+                self.true_value.add(task_id, flow_key, amount)
+
+        # accumulate whether blocking was successful
+        if self.metrics["fpr_fnr"]:
+            if any(blocked):
+                if 1 <= p.attack_type <= 15:
+                    self.true_positive += 1
+                else:
+                    self.false_positive += 1
+            else:
                 if 1 <= p.attack_type <= 15:
-                    rate["Attack total"][current_subtick] += p.packet_size / 125 / 1000 / 1000 / (param.statistics_cycle_subtick/param.tick_divisor)
-                pbar.update(p.packet_size)
-
-            cerb.update_subtick(current_subtick)
-            if param.mem_usage:
-                current, peak = tracemalloc.get_traced_memory()
-                mem_usage["Total"].append(current / 1000 / 1000)
-                mem_usage["Cerberus"].append(getsize(cerb) / 1000 / 1000)
-                mem_usage["True_value"].append(getsize(true_value) / 1000 / 1000)
-                mem_usage["Traffic"].append(getsize(generator.traffic) / 1000 / 1000)
-            generator.delete_traffic(current_subtick)
-
-            # evaluate fpr, fnr
-            if true_negative + false_positive != 0:
-                fpr.append(false_positive / (true_negative + false_positive) * 100)
+                    self.false_negative += 1
+                else:
+                    self.true_negative += 1
+
+        rate = self.rate
+        if rate:
+            rate[defense_dict[p.attack_type]][current_subtick] += p.packet_size * self.cerb.weight / 125 / 1000 / 1000 / (self.param.statistics_cycle_subtick/self.param.tick_divisor)
+            if 1 <= p.attack_type <= 15:
+                rate["Attack total"][current_subtick] += p.packet_size * self.cerb.weight / 125 / 1000 / 1000 / (self.param.statistics_cycle_subtick/self.param.tick_divisor)
+        self.n_packet += 1
+        self.pbar.update(p.packet_size)
+
+    def end_subtick(self, current_subtick: int):
+        self.true_value.flush()
+        self.cerb.update_subtick(current_subtick)
+        if self.param.mem_usage:
+            self.collect_mem_usage(current_subtick)
+
+        # evaluate fpr, fnr
+        if self.metrics["fpr_fnr"]:
+            if self.true_negative + self.false_positive != 0:
+                self.fpr.append(self.false_positive / (self.true_negative + self.false_positive) * 100)
             else:
-                fpr.append(0)
-            if true_positive + false_negative != 0:
-                fnr.append(false_negative / (true_positive + false_negative) * 100)
+                self.fpr.append(0)
+            if self.true_positive + self.false_negative != 0:
+                self.fnr.append(self.false_negative / (self.true_positive + self.false_negative) * 100)
             else:
-                fnr.append(0)
-            true_positive = 0
-            false_positive = 0
-            false_negative = 0
-            true_negative = 0
+                self.fnr.append(0)
 
+    # Each component reports its own footprint; tracemalloc is only read every mem_usage_interval subticks
+    # Without tracemalloc, total is the sum of the components
+    def collect_mem_usage(self, current_subtick: int):
+        cerb_usage = self.cerb.memory_usage()
+        usage = {"Cerberus": sum(cerb_usage.values()), "True_value": self.true_value.memory_usage(), "Traffic": self.generator.memory_usage()} | cerb_usage
+        if self.param.mem_usage_interval:
+            if current_subtick % self.param.mem_usage_interval == 0:
+                self.traced_memory, _ = tracemalloc.get_traced_memory()
+            usage["Total"] = self.traced_memory
+        else:
+            usage["Total"] = usage["Cerberus"] + usage["True_value"] + usage["Traffic"]
+        for x in self.mem_usage:
+            self.mem_usage[x].append(usage[x] / 1000 / 1000)
+
+    def end_tick(self, tick: int):
         # evaluate relative error when window changes
-        cerb.update_tick(tick)
-        for task_id in sum(task_per_reg, []):
-            if current_window[task_id] != cerb.current_window[task_id]:
-                current_window[task_id] = cerb.current_window[task_id]
-                re_cerb[task_id] = list_elementwise_add(re_cerb[task_id], relative_error_cerb(cerb, true_value, task_id))
-                # print(f"Task {task_id}\tEpoch {epoch[task_id]} finished: {len(true_value[task_id])}", flush=True)   # number of distinct flowkeys
-                print(f"Task {task_id}\tEpoch {epoch[task_id]} finished", flush=True)
-                true_value[task_id].clear()
-                epoch[task_id] += 1
-
-    filename = f"results/{param_filename} {exp_name} {str(datetime.now()).replace(':', ';')}"
-    relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, cp_max_info \
-                 = save_results.draw_statistics(cerb, param, param_filename, filename, len(param.task_match_action_table), defense_dict, re_cerb, fpr, fnr, rate, mem_usage)
-    maxbits_used = save_results.draw_cp_max_bits(cerb, param, param_filename, filename, defense_dict)
-
-    # save results into json
-    save_results.save_results(param_filename, filename, relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, maxbits_used, cp_max_info)
-    # save params into json
-    save_results.save_params(param, filename)
-    # save attack profile into yaml
-    save_results.save_attack_profile(generator, param, filename)
-
-    print(f"Results are saved at {filename}", flush=True)
+        self.cerb.update_tick(tick)
+        for task_id in self.task_ids:
+            if self.current_window[task_id] != self.cerb.current_window[task_id]:
+                self.current_window[task_id] = self.cerb.current_window[task_id]
+                if self.metrics["true_value"]:
+                    with self.stage("relative_error"):
+                        self.re_cerb[task_id] = list_elementwise_add(self.re_cerb[task_id], relative_error_cerb(self.cerb, self.true_value, task_id))
+                # print(f"Task {task_id}\tEpoch {self.epoch[task_id]} finished: {self.true_value.n_flow(task_id)}", flush=True)   # number of distinct flowkeys
+                print(f"Task {task_id}\tEpoch {self.epoch[task_id]} finished", flush=True)
+                self.true_value.clear(task_id)
+                self.epoch[task_id] += 1
+
+    def save(self, param_filename: str, exp_name: str) -> str:
+        param = self.param
+        cerb = self.cerb
+        filename = f"results/{param_filename} {exp_name} {str(datetime.now()).replace(':', ';')}"
+        cerb.close()
+        with self.stage("save_results"):
+            relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, cp_max_info, cp_backlog \
+                         = save_results.draw_statistics(cerb, param, param_filename, filename, len(param.task_match_action_table), defense_dict, self.re_cerb, self.fpr, self.fnr, self.rate, self.mem_usage)
+            maxbits_used = save_results.draw_cp_max_bits(cerb, param, param_filename, filename, defense_dict)
+        relative_error_ci = save_results.relative_error_ci(param, self.re_cerb) if param.re_sample_size and self.metrics["true_value"] else {}
+        preview_summary = self.preview.summary(self.re_cerb if self.metrics["true_value"] else None, param.shrink_ratio_exp) if self.preview else {}
+        profile = {}
+        if self.profiler:
+            self.profiler.unwrap()
+            profile = self.profiler.summary()
+            if self.profiler.cprofile is not None:
+                profile["cprofile"] = f"{filename} ticks {param.profile_ticks[0]}-{param.profile_ticks[1]}.prof"
+                self.profiler.dump_cprofile(profile["cprofile"])
+
+        # hash cache counters depend on the process (the cache is shared and starts cold on resume), so they are not saved
+        counter_history = {name: value for name, value in cerb.counter_history.items() if name not in counters.process_names}
+        # save results into json
+        save_results.save_results(param_filename, filename, relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, maxbits_used, cp_max_info, cp_backlog, relative_error_ci, profile, counter_history, preview_summary)
+        # save params into json
+        save_results.save_params(param, filename)
+        # save attack profile into yaml
+        save_results.save_attack_profile(self.generator, param, filename)
+
+        if self.profiler:
+            self.profiler.print_summary()
+        print(f"Results are saved at {filename}", flush=True)
+        return filename
+
+# Returns None if the checkpoint is of another experiment, e.g., taken before the params file was changed
+def load_checkpoint(path: str, key: str = None) -> Simulation | None:
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    if key is not None and state.get("key") != key:
+        return None
+    random.setstate(state["random"])
+    sim = state["simulation"]
+    # hash_crc cache starts cold in this process
+    cache_info = hash_crc.cache_info()
+    sim.cerb.counter_snapshot["hash_hit"] = cache_info.hits
+    sim.cerb.counter_snapshot["hash_miss"] = cache_info.misses
+    return sim
+
+def checkpoint_path(param_filename: str, exp_name: str) -> str:
+    return f"checkpoints/{param_filename} {exp_name}.pkl"
+
+# Experiment of a checkpoint: effective params with the attack profile itself instead of its file name
+def checkpoint_key(param: params.Params) -> str:
+    setting = dict(param.j_data)
+    setting["atk_profile"] = gen.load_attack_profile(setting["atk_profile"])
+    return hashlib.sha256(json.dumps(setting, sort_keys=True).encode()).hexdigest()
+
+# j_data: contents of the params file, e.g., generated by a sweep; the params file is not read then
+def main(param_filename: str, exp_name: str, overrides: dict = None, resume: bool = False, progress=None, j_data: dict = None) -> str:
+    path = checkpoint_path(param_filename, exp_name)
+    param = params.Params(param_filename, overrides, j_data)
+    sim = None
+    if resume and os.path.exists(path):
+        sim = load_checkpoint(path, checkpoint_key(param))
+        if sim is None:
+            print(f"Discarded checkpoint of {param_filename} {exp_name}: params have changed", flush=True)
+            os.remove(path)
+        else:
+            print(f"Resumed {param_filename} {exp_name} from tick {sim.next_tick}", flush=True)
+    if sim is None:
+        sim = Simulation(param)
+    sim.run(path, progress=progress)
+    filename = sim.save(param_filename, exp_name)
+    if os.path.exists(path):
+        os.remove(path)
+    return filename
 
 if __name__ == '__main__':
     param_filename = "1_5_11_13"
     exp_name = "best new 195"
-    if len(sys.argv) >= 3:
-        param_filename = sys.argv[1]
-        exp_name = " ".join(sys.argv[2:])
+    overrides = {}
+    resume = "--resume" in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--metrics=") and arg != "--resume"]
+    for arg in sys.argv[1:]:
+        if arg.startswith("--metrics="):    # e.g., --metrics=fpr or --metrics=fpr_fnr,rate
+            overrides["metrics"] = arg[len("--metrics="):]
+    if len(args) >= 2:
+        param_filename = args[0]
+        exp_name = " ".join(args[1:])
 
     print(f"Started experiment {param_filename} {exp_name} at {datetime.now()}", flush=True)
     start_time = time.time()
-    main(param_filename, exp_name)
+    main(param_filename, exp_name, overrides, resume)
     elapsed_time = time.time() - start_time
     hours, rem = divmod(elapsed_time, 3600)
     minutes, seconds = divmod(rem, 60)
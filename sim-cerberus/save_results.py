@@ -31,6 +31,25 @@ def evaluate(count: list[int], defense: str, ax, plt_color: str):
     else:
         return None
 
+# Bootstrap confidence interval of the relative error CDF
+# Resampling flows with replacement is a multinomial draw over the histogram bins
+def relative_error_ci(param: params.Params, re_cerb) -> dict:
+    rng = np.random.default_rng(param.seed)
+    alpha = (1 - param.re_confidence) / 2
+    bins_count = np.arange(0, 1 + 1/1000, 1/1000).tolist()
+    ci = {}
+    for task_id in sorted(param.task_match_action_table):
+        count = np.array(re_cerb[task_id])
+        n = count.sum()
+        if n == 0:
+            continue
+        resampled = rng.multinomial(n, count / n, size=param.re_bootstrap)
+        cdf = np.cumsum(resampled, axis=1) / n
+        ci[task_id] = bins_count[1:], np.quantile(cdf, alpha, axis=0).tolist(), np.quantile(cdf, 1 - alpha, axis=0).tolist(), int(n)
+    ci['confidence'] = param.re_confidence
+    ci['sample_size'] = param.re_sample_size
+    return ci
+
 def draw_statistics(cerb: cerberus.Cerberus, param: params.Params, param_filename: str, filename: str, global_index: int, defense_dict, re_cerb, fpr, fnr, rate, mem_usage):
     fig, axes = plt.subplots(ncols=3, nrows=3, figsize=(12, 12))
     axs = axes.ravel()
@@ -167,6 +186,8 @@ def draw_statistics(cerb: cerberus.Cerberus, param: params.Params, param_filenam
         rate_info[i] = np.arange(0, param.statistics_cycle_subtick/param.tick_divisor*len(rate[atk]), param.statistics_cycle_subtick/param.tick_divisor).tolist(), rate[atk], atk, plt_color
         ymax = max(ymax, max(rate[atk]))
         i += 1
+    if not rate:    # rate is not collected
+        ymax = 0
     rate_info['min_y'] = 0
     margin = (ymax - rate_info['min_y']) * 0.05
     ymin, ymax = rate_info['min_y']-margin, ymax+margin
@@ -253,6 +274,13 @@ def draw_statistics(cerb: cerberus.Cerberus, param: params.Params, param_filenam
     overflowed_packet_ratio['ylabel'] = 'Overflowed packet (%)'
     overflowed_packet_ratio['legend'] = True
 
+    cp_backlog = {}
+    if param.cp_process:
+        cp_backlog[0] = np.arange(0, param.statistics_cycle_subtick/param.tick_divisor*len(cerb.cp_backlog_history), param.statistics_cycle_subtick/param.tick_divisor).tolist(), cerb.cp_backlog_history, global_color
+        cp_backlog['xlabel'] = 'Time (second)'
+        cp_backlog['ylabel'] = 'CP queue backlog (records)'
+        cp_backlog['legend'] = False
+
     cp_max_info = {}
     for task_id in sorted(param.task_match_action_table):
         cp_max_info[task_id] = np.arange(0, param.statistics_cycle_tick*len(cerb.cp_max_history[task_id]), param.statistics_cycle_tick).tolist(), cerb.cp_max_history[task_id], defense_dict[param.task_match_action_table[task_id]["defense_no"]], task_color[task_id]
@@ -260,7 +288,8 @@ def draw_statistics(cerb: cerberus.Cerberus, param: params.Params, param_filenam
     fig.tight_layout()
     # fig.suptitle(f"{param_filename} {exp_name}", y=1.02, fontsize='xx-large')
     fig.savefig(f"{filename}.png", bbox_inches='tight')
-    return relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, cp_max_info
+    plt.close(fig)
+    return relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, cp_max_info, cp_backlog
 
 def draw_cp_max_bits(cerb: cerberus.Cerberus, param: params.Params, param_filename: str, filename: str, defense_dict):
     maxbits_used = {0: []}
@@ -291,9 +320,10 @@ def draw_cp_max_bits(cerb: cerberus.Cerberus, param: params.Params, param_filena
     plt.tight_layout()
     # fig.suptitle(f"{param_filename} {exp_name}", y=1.02, fontsize='x-large')
     plt.savefig(f"{filename} max bits.png", bbox_inches='tight')
+    plt.close(fig)
     return maxbits_used
 
-def save_results(param_filename: str, filename: str, relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, maxbits_used, cp_max_info):
+def save_results(param_filename: str, filename: str, relative_error, fpr_info, fnr_info, counter_size, uploaded_packet, uploaded_packet_ratio, rate_info, cp_not_processed, mem_usage_info, bandwidth_utilization, overflowed_packet_ratio, maxbits_used, cp_max_info, cp_backlog, relative_error_ci, profile, counter_history, preview):
     with open(f"{filename}.json", "w") as json_file:
         json.dump({"relative_error" : relative_error,
                    "fpr_info" : fpr_info,
@@ -308,6 +338,11 @@ def save_results(param_filename: str, filename: str, relative_error, fpr_info, f
                    "overflowed_packet_ratio" : overflowed_packet_ratio,
                    "maxbits_used" : maxbits_used,
                    "cp_max_info" : cp_max_info,
+                   "cp_backlog" : cp_backlog,
+                   "relative_error_ci" : relative_error_ci,
+                   "profile" : profile,
+                   "counter_history" : counter_history,
+                   "preview" : preview,
                    "setting" : param_filename}
                    , json_file, indent=4)
 
@@ -335,7 +370,23 @@ def save_params(param: params.Params, filename: str):
                    "statistics_cycle_tick" : param.statistics_cycle_tick,
                    "statistics_cycle_subtick" : param.statistics_cycle_subtick,
                    "cp_processing_threshold" : param.cp_processing_threshold*8/1000/1000/1000,
-                   "data_to_control_channel_bandwidth" : param.data_to_control_channel_bandwidth*8/1000/1000/1000}
+                   "data_to_control_channel_bandwidth" : param.data_to_control_channel_bandwidth*8/1000/1000/1000,
+                   "mem_usage" : param.mem_usage,
+                   "cp_process" : param.cp_process,
+                   "cp_queue_size" : param.cp_queue_size,
+                   "cp_delay" : param.cp_delay,
+                   "loop_engine" : param.loop_engine,
+                   "population" : param.population,
+                   "rng" : param.rng,
+                   "sample_rate" : param.sample_rate,
+                   "checkpoint_cycle" : param.checkpoint_cycle,
+                   "profile" : param.profile,
+                   "profile_ticks" : param.profile_ticks,
+                   "mem_usage_interval" : param.mem_usage_interval,
+                   "re_sample_size" : param.re_sample_size,
+                   "re_bootstrap" : param.re_bootstrap,
+                   "re_confidence" : param.re_confidence,
+                   "metrics" : [family for family in params.metric_families if param.metrics[family]]}
                    , json_file, indent=4)
 
 def save_attack_profile(generator: gen.AttackGenerator, param: params.Params, filename: str):
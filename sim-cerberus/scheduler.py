@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import wait, FIRST_COMPLETED
+from functools import lru_cache
+from common import POINTER_SIZE
+from packet import attack_generator as gen
+from packet import packet as pkt
+import params
+import numpy as np
+import statistics
+import random
+import json
+import time
+import os
+import sys
+import unittest
+
+MB = 1024 * 1024
+base_memory = 100 * MB      # interpreter, imports and attack profile of a worker
+counter_memory = POINTER_SIZE + 32  # list slot and int object of a sketch counter
+flow_memory = 300           # ground truth of a flow: key, dict entry and value
+packet_memory = 1000        # Packet object with its attributes
+benign_flow_memory = {"python": 520, "numpy": 80}   # benign flow of AttackGenerator, at the peak while flows are drawn
+attack_ip_memory = 250      # attacker IP with its loop state
+mean_packet_size = 600      # bytes on the wire, benign and attack traffic
+history_file = "log/mem_history.json"
+runtime_history_file = "log/runtime_history.json"
+packet_task_seconds = 10e-6 # wall time per packet and task, used until enough runs are measured
+
+# Peak memory (bytes) of run_sim for the params, from the sizes of its main data structures
+def estimate_memory(param: params.Params) -> int:
+    n_task = len(param.task_match_action_table)
+    # data plane and control plane sketches of every task, and the blocklist
+    counters = sum(param.n_hash * 2**reg[3] * 2 for reg in param.reg_alloc_table.values()) + 2 * param.n_hash * 2**param.blocklist_size
+    if param.elephant_region:
+        counters += sum(2**reg[4] for reg in param.reg_alloc_table.values())
+    # exact value of every benign and attack flow in each task
+    flows = 0
+    if param.metrics["true_value"]:
+        flows = param.benign_unique_flowkey + param.attack_unique_ip
+        if param.re_sample_size:
+            flows = min(flows, param.re_sample_size)
+        flows *= n_task
+    # traffic of the current and the next subtick (responses are scheduled one subtick later)
+    packets = 2 * (param.benign_volume + param.attack_volume) * 125 * 1000 * 1000 / param.tick_divisor / mean_packet_size
+    population = param.benign_unique_flowkey * benign_flow_memory[param.population] + param.attack_unique_ip * attack_ip_memory
+    return round(base_memory + counters * counter_memory + flows * flow_memory + packets * packet_memory + population)
+
+class MemoryHistory:
+    # Estimated and measured peak memory of finished runs, kept in a JSON file across sweeps
+    # Runs measured before with the same params are predicted by their measurement, others by the estimate scaled by the median of measured/estimated
+    def __init__(self, path: str = history_file):
+        self.path = path
+        self.runs = {}  # param_filename: [estimated, measured]
+        if os.path.exists(path):
+            with open(path, mode="r") as j_object:
+                self.runs = json.load(j_object)
+
+    def predict(self, param_filename: str, estimated: int) -> int:
+        if param_filename in self.runs and self.runs[param_filename][0] == estimated:
+            return self.runs[param_filename][1]
+        if not self.runs:
+            return estimated
+        return round(estimated * statistics.median(measured / estimated for estimated, measured in self.runs.values()))
+
+    def add(self, param_filename: str, estimated: int, measured: int):
+        self.runs[param_filename] = [estimated, measured]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as j_object:
+            json.dump(self.runs, j_object, indent=4)
+        os.replace(f"{self.path}.tmp", self.path)
+
+# Mean size of packets of the attack (or benign traffic) that count towards its volume, from a fixed random sample
+@lru_cache(maxsize=None)
+def sample_packet_size(atk: str, n_sample: int = 1000) -> float:
+    state = random.getstate()
+    random.seed(0)
+    benign_flowkey = [[src_ip, src_port, dst_ip, dst_port, "BEGIN", None, None] for src_ip, src_port, dst_ip, dst_port in gen.generate_benign_flowkey(64)]
+    attack_ip = gen.generate_attack_ip(64)
+    victim_ip = pkt.ip_to_bytes("192.168.0.1")
+    sizes = []
+    for _ in range(n_sample):
+        for p in gen.attack_functions[atk](0, victim_ip, benign_flowkey, attack_ip, 0):
+            if atk == "Benign" or not (p.attack_type == 0 and p.tick != 0):
+                sizes.append(p.packet_size)
+    random.setstate(state)
+    return sum(sizes) / len(sizes)
+
+# Features of the runtime of run_sim: expected packets, packets times tasks (updates of every task per packet) and ticks
+def runtime_features(param: params.Params) -> list[float]:
+    attack_profile = gen.load_attack_profile(param.atk_profile)
+    attack_key = sorted(gen.get_attack_key(attack_profile), key=lambda x: list(gen.attack_functions).index(x.split("/")[0]))
+    # compiled like AttackGenerator does, so that the cache is warm for the run
+    max_tick, _, rate, _, seq_count, seq_ratio, loop_size, loop_count, _, loop_rate, _, _, _ \
+        = gen.compile_attack_profile(attack_profile, attack_key, param.attack_volume, param.attack_tick_to_subtick, param.attack_start_subtick, param.attack_unique_ip)
+    num_tick = ((max_tick+1)*param.attack_tick_to_subtick + param.attack_start_subtick - 1)//param.tick_divisor + 1
+    packets = param.benign_volume * 125 * 1000 * 1000 / param.attack_tick_to_subtick * num_tick * param.tick_divisor / sample_packet_size("Benign")
+    for atk in attack_key:
+        atk_str = atk.split("/")[0]
+        if any(rate[atk]):
+            packets += sum(rate[atk]) / sample_packet_size(atk_str)
+        for count, ratio in zip(seq_count[atk], seq_ratio[atk]):
+            packets += sum(count) * param.attack_unique_ip * sum(ratio[2*j+1] - ratio[2*j] for j in range(len(ratio)//2))
+        for size, count, subtick_rate in zip(loop_size[atk], loop_count[atk], loop_rate[atk]):
+            if subtick_rate and any(count):
+                packets += subtick_rate * sum(count) / sum(x*y for x, y in zip(size, count))
+    # a preview still generates every packet, but only sampled ones update the tasks
+    return [packets, packets * len(param.task_match_action_table) * param.sample_rate, num_tick]
+
+class RuntimeModel:
+    # Wall time of finished runs and a linear model on runtime_features fitted to them
+    # Until there are more runs than features, runtime is proportional to packets times tasks
+    def __init__(self, path: str = runtime_history_file):
+        self.path = path
+        self.runs = {}  # param_filename: [features, seconds]
+        if os.path.exists(path):
+            with open(path, mode="r") as j_object:
+                self.runs = json.load(j_object)
+        self.coef = None
+        self.fit()
+
+    def fit(self):
+        if not self.runs or len(self.runs) <= len(next(iter(self.runs.values()))[0]) + 1:
+            self.coef = None
+            return
+        x = np.array([features + [1.0] for features, _ in self.runs.values()])
+        y = np.array([seconds for _, seconds in self.runs.values()])
+        self.coef = np.linalg.lstsq(x, y, rcond=None)[0]
+
+    def predict(self, features: list[float]) -> float:
+        if self.coef is None:
+            if not self.runs:
+                return features[1] * packet_task_seconds
+            return features[1] * statistics.median(seconds / features[1] for features, seconds in self.runs.values() if features[1] > 0)
+        # a fitted model may extrapolate below zero
+        return max(float(np.dot(features + [1.0], self.coef)), features[1] * packet_task_seconds / 10)
+
+    def add(self, param_filename: str, features: list[float], seconds: float):
+        self.runs[param_filename] = [features, seconds]
+        self.fit()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as j_object:
+            json.dump(self.runs, j_object, indent=4)
+        os.replace(f"{self.path}.tmp", self.path)
+
+def meminfo(key: str) -> int | None:
+    try:
+        with open("/proc/meminfo", mode="r") as f:
+            for line in f:
+                if line.startswith(f"{key}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def total_memory() -> int:
+    total = meminfo("MemTotal")
+    return total if total is not None else os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+def available_memory() -> int:
+    available = meminfo("MemAvailable")
+    return available if available is not None else os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+# Peak resident memory of this process since the last reset_peak_memory()
+def peak_memory() -> int:
+    try:
+        with open("/proc/self/status", mode="r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def reset_peak_memory():
+    # supported by Linux; elsewhere the peak covers the whole life of the process
+    try:
+        with open("/proc/self/clear_refs", mode="w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+class MemoryScheduler:
+    # Submit jobs to a pool while their predicted peak memory fits in the budget and free memory of the system
+    # Jobs are submitted longest (predicted seconds) first, skipping those that don't fit; a job larger than the budget runs alone
+    # If claim is given, a job is submitted only if claim(name) succeeds, and dropped otherwise (e.g., claimed by another node)
+    def __init__(self, pool, max_workers: int, memory_budget: int = None, min_available: int = 512 * MB, poll_interval: float = 5.0, claim=None):
+        self.pool = pool
+        self.claim = claim
+        self.max_workers = max_workers
+        self.memory_budget = memory_budget if memory_budget is not None else round(0.8 * total_memory())
+        self.min_available = min_available
+        self.poll_interval = poll_interval
+        self.pending = []   # (seconds, memory, name, fn, args)
+        self.running = {}   # future: (seconds, memory, name, start time)
+
+    def add(self, name: str, fn, args: tuple, memory: int, seconds: float = 0.0):
+        self.pending.append((seconds, memory, name, fn, args))
+
+    def used_memory(self) -> int:
+        return sum(memory for _, memory, _, _ in self.running.values())
+
+    def fits(self, memory: int, available: int) -> bool:
+        if not self.running:
+            return True
+        if len(self.running) >= self.max_workers or self.used_memory() + memory > self.memory_budget:
+            return False
+        # back off under memory pressure; running jobs may not have reached their peak yet
+        return available - memory >= self.min_available
+
+    def submit_fitting(self):
+        self.pending.sort(key=lambda x: (-x[0], -x[1]))
+        available = available_memory()
+        for job in list(self.pending):
+            seconds, memory, name, fn, args = job
+            if self.fits(memory, available):
+                self.pending.remove(job)
+                if self.claim and not self.claim(name):
+                    continue
+                if memory > self.memory_budget:
+                    print(f"Experiment {name} is expected to use {memory/MB:.0f}MB, more than the budget {self.memory_budget/MB:.0f}MB; running it alone", flush=True)
+                self.running[self.pool.submit(fn, *args)] = seconds, memory, name, time.time()
+                available -= memory
+
+    # Predicted seconds until all jobs are done, assigning pending jobs in order to the worker that frees up first
+    def eta(self) -> float:
+        now = time.time()
+        workers = sorted(max(seconds - (now - start), 0.0) for seconds, _, _, start in self.running.values())
+        workers += [0.0] * (self.max_workers - len(workers))
+        for seconds, _, _, _, _ in self.pending:
+            workers.sort()
+            workers[0] += seconds
+        return max(workers) if workers else 0.0
+
+    # Yields (name, future) of finished jobs until all jobs are done
+    def run(self):
+        while self.pending or self.running:
+            self.submit_fitting()
+            done, _ = wait(list(self.running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                _, _, name, _ = self.running.pop(future)
+                yield name, future
+
+############################################
+# Unit Test
+############################################
+class TestScheduler(unittest.TestCase):
+    def test_history(self):
+        history = MemoryHistory("/nonexistent/mem_history.json")
+        self.assertEqual(history.predict("a", 100), 100)
+        history.add("a", 100, 200)
+        history.add("b", 100, 300)
+        self.assertEqual(history.predict("a", 100), 200)
+        self.assertEqual(history.predict("c", 100), 250)
+
+    def test_packing(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
+        lock = threading.Lock()
+        state = {"memory": 0, "peak": 0}
+        def job(memory):
+            with lock:
+                state["memory"] += memory
+                state["peak"] = max(state["peak"], state["memory"])
+            time.sleep(0.01)
+            with lock:
+                state["memory"] -= memory
+            return memory
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            scheduler = MemoryScheduler(pool, 4, memory_budget=10, min_available=-sys.maxsize, poll_interval=0.01)
+            for i, memory in enumerate([6, 5, 4, 3, 2, 1, 12]):
+                scheduler.add(str(i), job, (memory,), memory, memory)
+            finished = {name: future.result() for name, future in scheduler.run()}
+        self.assertEqual(len(finished), 7)
+        self.assertEqual(finished["6"], 12)
+        self.assertLessEqual(state["peak"], 12)
+
+    def test_runtime(self):
+        model = RuntimeModel("/nonexistent/runtime_history.json")
+        self.assertAlmostEqual(model.predict([0, 1000, 1]), 1000 * packet_task_seconds)
+        for i in range(1, 7):
+            model.add(str(i), [i, 2*i, i % 3], 3*i + 1)
+        self.assertIsNotNone(model.coef)
+        self.assertAlmostEqual(model.predict([10, 20, 1]), 31)
+
+    def test_eta(self):
+        scheduler = MemoryScheduler(None, 2, memory_budget=10)
+        for seconds in [4, 3, 2, 1]:
+            scheduler.add(str(seconds), None, (), 1, seconds)
+        scheduler.pending.sort(key=lambda x: -x[0])
+        self.assertEqual(scheduler.eta(), 5)
+
+if __name__ == '__main__':
+    unittest.main()
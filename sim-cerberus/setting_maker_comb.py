@@ -9,7 +9,8 @@ import os
 import json
 import yaml
 
-def make_json(defense_nos: tuple[int], combination_path: str, filename: str):
+# Contents of the params file of a combination of defenses
+def combination_setting(defense_nos: tuple[int], atk_profile: str | list[dict]) -> dict:
     fk = flowkey.Flowkey()
     is_bf = [fk.get_flowkey(x)[4] for x in defense_nos]
     dp_counter_size = allocate_slice(32, is_bf)
@@ -34,40 +35,43 @@ def make_json(defense_nos: tuple[int], combination_path: str, filename: str):
                "crc_polynomial_degree can be one of [8, 16, 24, 32, 64] (24 or above is recommended)"
               ]
 
+    return {"task_match_action_table" : task_match_action_table,
+            "reg_alloc_table" : reg_alloc_table,
+            "blocklist_size": 16,
+            "shrink_ratio_exp": 0,
+            "pcap_file" : "202404251400.pcap",
+            "benign_volume" : 1,
+            "attack_volume" : 10,
+            "atk_profile" : atk_profile,
+            "benign_unique_flowkey" : 30000,
+            "attack_unique_ip" : 10000,
+            "tick_divisor" : 10,
+            "attack_start_subtick": 0,
+            "attack_tick_to_subtick": 10,
+            "refresh_cycle" : [4] * len(defense_nos),
+            "n_hash" : 4,
+            "crc_polynomial_degree" : 32,
+            "seed" : 1234,
+            "elephant_region" : False,
+            "elephant_cycle" : 1,
+            "adaptive_memory" : True,
+            "adaptive_memory_cycle" : 1,
+            "statistics_cycle_tick" : 1,
+            "statistics_cycle_subtick" : 1,
+            "cp_processing_threshold" : 2,
+            "data_to_control_channel_bandwidth" : 10,
+            "mem_usage" : False,
+            "__comment__": comment}
+
+def make_json(defense_nos: tuple[int], combination_path: str, filename: str):
     path = f"params/{combination_path}"
     if not os.path.exists(path):
         os.makedirs(path)
     with open(f"{path}{filename}.json", "w") as json_file:
-        json.dump({"task_match_action_table" : task_match_action_table,
-                    "reg_alloc_table" : reg_alloc_table,
-                    "blocklist_size": 16,
-                    "shrink_ratio_exp": 0,
-                    "pcap_file" : "202404251400.pcap",
-                    "benign_volume" : 1,
-                    "attack_volume" : 10,
-                    "atk_profile" : f"{combination_path}{filename}",
-                    "benign_unique_flowkey" : 30000,
-                    "attack_unique_ip" : 10000,
-                    "tick_divisor" : 10,
-                    "attack_start_subtick": 0,
-                    "attack_tick_to_subtick": 10,
-                    "refresh_cycle" : [4] * len(defense_nos),
-                    "n_hash" : 4,
-                    "crc_polynomial_degree" : 32,
-                    "seed" : 1234,
-                    "elephant_region" : False,
-                    "elephant_cycle" : 1,
-                    "adaptive_memory" : True,
-                    "adaptive_memory_cycle" : 1,
-                    "statistics_cycle_tick" : 1,
-                    "statistics_cycle_subtick" : 1,
-                    "cp_processing_threshold" : 2,
-                    "data_to_control_channel_bandwidth" : 10,
-                    "mem_usage" : False,
-                    "__comment__": comment}
-                    , json_file, indent=4)
+        json.dump(combination_setting(defense_nos, f"{combination_path}{filename}"), json_file, indent=4)
 
-def make_yaml(defense_nos: tuple[int], combination_path: str, filename: str):
+# Attack profile of a combination of defenses: one attack per tick, ordered by packet size
+def combination_attack_profile(defense_nos: tuple[int]) -> list[dict]:
     result = []
     small_packet = [x for x in defense_nos if x in [12, 13]]
     small_middle_packet = [x for x in defense_nos if x in [1]]
@@ -88,12 +92,14 @@ def make_yaml(defense_nos: tuple[int], combination_path: str, filename: str):
     for i in range(16):
         result.append({'tick' : i})
         result.append({'attacks' : [{defense_dict[attack_order[i%len(attack_order)]] : {'ratio' : [0.0, 1.0], 'rate ratio': 1.0}}]})
+    return result
 
+def make_yaml(defense_nos: tuple[int], combination_path: str, filename: str):
     path = f"atk_profile/{combination_path}"
     if not os.path.exists(path):
         os.makedirs(path)
     with open(f"{path}{filename}.yaml", "w") as yaml_file:
-        yaml.dump(result, yaml_file, default_flow_style=False)
+        yaml.dump(combination_attack_profile(defense_nos), yaml_file, default_flow_style=False)
 
 def main(n_comb: int, exp_name: str):
     combination_path = f"combination {n_comb} {exp_name}/" if exp_name else f"combination {n_comb}/"
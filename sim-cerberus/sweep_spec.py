@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from setting_maker_comb import combination_setting, combination_attack_profile
+from itertools import combinations, product
+import flowkey
+import params
+import copy
+import json
+import unittest
+
+exclude_exp = [3, 14, 15]               # Coremelt, ACK flood, RST/FIN flood
+
+# Combinations of n_comb defenses that are simulated: at least two non-Bloom-filter tasks, and no excluded defense
+def sweep_combinations(n_comb: int) -> list[tuple[int]]:
+    total_defense = list(range(1, 16))
+    fk = flowkey.Flowkey()
+    result = []
+    for defense_nos in combinations(total_defense, n_comb):
+        is_bf = [fk.get_flowkey(x)[4] for x in defense_nos]
+        if (n_comb - sum(is_bf) >= 2 or n_comb == 1) and not any(n in defense_nos for n in exclude_exp):
+            result.append(defense_nos)
+    return result
+
+class SweepSpec:
+    # Experiments of a combination sweep: every combination of n_comb defenses times every point of grid {params key: [values]}
+    # In memory, params and attack profiles are generated as setting_maker_comb would write them, and no file is read;
+    # otherwise they are read from params/<combination>/ (and atk_profile/<combination>/) written by setting_maker_comb
+    def __init__(self, n_comb: int, exp_name: str, grid: dict[str, list] = None, in_memory: bool = True):
+        self.n_comb = n_comb
+        self.exp_name = exp_name
+        self.grid = grid or {}
+        self.in_memory = in_memory
+        self.combination_path = f"combination {n_comb} {exp_name}/" if exp_name else f"combination {n_comb}/"
+
+    # {experiment name: contents of its params file}; experiment names are the combination and the grid point, e.g. "1_5 attack_volume=20"
+    def settings(self) -> dict[str, dict]:
+        settings = {}
+        for defense_nos in sweep_combinations(self.n_comb):
+            filename = "_".join([str(x) for x in defense_nos])
+            if self.in_memory:
+                setting = combination_setting(defense_nos, combination_attack_profile(defense_nos))
+            else:
+                with open(f"params/{self.combination_path}{filename}.json", mode="r") as j_object:
+                    setting = json.load(j_object)
+            for point in product(*self.grid.values()):
+                name = " ".join([filename] + [f"{key}={value}" for key, value in zip(self.grid, point)])
+                settings[name] = copy.deepcopy(setting)
+                settings[name].update(zip(self.grid, point))
+        return settings
+
+    def params(self) -> dict[str, params.Params]:
+        return {name: params.Params(f"{self.combination_path}{name}", j_data=setting) for name, setting in self.settings().items()}
+
+############################################
+# Unit Test
+############################################
+class TestSweepSpec(unittest.TestCase):
+    def test_settings(self):
+        spec = SweepSpec(1, "test", {"attack_volume": [10, 20], "seed": [1]})
+        settings = spec.settings()
+        self.assertEqual(len(settings), 2 * len(sweep_combinations(1)))
+        self.assertEqual(settings["1 attack_volume=20 seed=1"]["attack_volume"], 20)
+        param = spec.params()["13 attack_volume=10 seed=1"]
+        self.assertEqual(param.task_match_action_table, {0: {"defense_no": 13}})
+        self.assertEqual(param.atk_profile[1], {'attacks': [{'SYN flood': {'ratio': [0.0, 1.0], 'rate ratio': 1.0}}]})
+        # params are copied, so that experiments don't share nested tables
+        self.assertIsNot(settings["1 attack_volume=10 seed=1"]["reg_alloc_table"], settings["1 attack_volume=20 seed=1"]["reg_alloc_table"])
+
+if __name__ == '__main__':
+    unittest.main()
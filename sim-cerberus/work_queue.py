@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import socket
+import os
+import unittest
+
+class WorkQueue:
+    # Queue of experiments in a directory shared by several nodes; no central service is needed
+    # Each experiment is a file in one of pending/, claimed/, done/ or failed/
+    # A node claims an experiment by hard-linking pending/<name> to claimed/<name>, which fails if the link exists (also on NFS)
+    # The modification time of a claim is its heartbeat; claims older than lease_seconds are moved back to pending/
+    def __init__(self, path: str, node: str = None, lease_seconds: float = 600.0, heartbeat_interval: float = 60.0):
+        self.path = path
+        self.node = node or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.held = set()   # names claimed by this node
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.heartbeat_thread = None
+        for state in ["pending", "claimed", "done", "failed"]:
+            os.makedirs(os.path.join(path, state), exist_ok=True)
+
+    def file(self, state: str, name: str) -> str:
+        return os.path.join(self.path, state, name)
+
+    def names(self, state: str) -> list[str]:
+        return sorted(os.listdir(os.path.join(self.path, state)))
+
+    # Current time of the file server, so that nodes with skewed clocks agree on expiry
+    def now(self) -> float:
+        probe = os.path.join(self.path, ".clock")
+        with open(probe, "a"):
+            pass
+        os.utime(probe)
+        return os.stat(probe).st_mtime
+
+    # Add experiments that are not pending, claimed, done or failed yet; returns the added names
+    def add(self, names: list[str]) -> list[str]:
+        added = []
+        for name in names:
+            try:
+                os.close(os.open(self.file("pending", name), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            # another node may have claimed or finished it before the pending file was created
+            if any(os.path.exists(self.file(state, name)) for state in ["claimed", "done", "failed"]):
+                self.remove("pending", name)
+            else:
+                added.append(name)
+        return added
+
+    def remove(self, state: str, name: str):
+        try:
+            os.remove(self.file(state, name))
+        except FileNotFoundError:
+            pass
+
+    def claim(self, name: str) -> bool:
+        try:
+            os.link(self.file("pending", name), self.file("claimed", name))
+        except (FileExistsError, FileNotFoundError):
+            return False
+        self.remove("pending", name)
+        with open(self.file("claimed", name), "w") as f:
+            f.write(self.node)
+        with self.lock:
+            self.held.add(name)
+        return True
+
+    def owner(self, name: str) -> str | None:
+        try:
+            with open(self.file("claimed", name), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def release(self, name: str, state: str, message: str = ""):
+        with self.lock:
+            self.held.discard(name)
+        with open(self.file(state, name), "w") as f:
+            f.write(f"{self.node}\n{message}")
+        # the claim may have expired and been taken by another node meanwhile
+        if self.owner(name) == self.node:
+            self.remove("claimed", name)
+        self.remove("pending", name)
+
+    def complete(self, name: str, message: str = ""):
+        self.release(name, "done", message)
+
+    def fail(self, name: str, message: str = ""):
+        self.release(name, "failed", message)
+
+    def heartbeat(self):
+        with self.lock:
+            held = list(self.held)
+        for name in held:
+            if self.owner(name) == self.node:
+                os.utime(self.file("claimed", name))
+            else:
+                print(f"Lost the claim of {name}", flush=True)
+                with self.lock:
+                    self.held.discard(name)
+
+    # Move claims whose heartbeat expired (e.g., of a crashed node) back to pending/; returns the requeued names
+    def requeue_expired(self) -> list[str]:
+        now = self.now()
+        requeued = []
+        for name in self.names("claimed"):
+            try:
+                expired = os.stat(self.file("claimed", name)).st_mtime < now - self.lease_seconds
+                if expired and name not in self.held:
+                    os.rename(self.file("claimed", name), self.file("pending", name))
+                    requeued.append(name)
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def start_heartbeat(self):
+        def run():
+            while not self.stop_event.wait(self.heartbeat_interval):
+                self.heartbeat()
+        self.stop_event.clear()
+        self.heartbeat_thread = threading.Thread(target=run, daemon=True)
+        self.heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        self.stop_event.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join()
+            self.heartbeat_thread = None
+
+############################################
+# Unit Test
+############################################
+class TestWorkQueue(unittest.TestCase):
+    def test_claim(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as path:
+            a = WorkQueue(path, "a", lease_seconds=30)
+            b = WorkQueue(path, "b", lease_seconds=30)
+            self.assertEqual(a.add(["x", "y"]), ["x", "y"])
+            self.assertEqual(b.add(["x", "y", "z"]), ["z"])
+            self.assertTrue(a.claim("x"))
+            self.assertFalse(b.claim("x"))
+            self.assertEqual(b.add(["x"]), [])
+            a.complete("x")
+            self.assertEqual(a.names("done"), ["x"])
+            self.assertEqual(a.names("pending"), ["y", "z"])
+
+            # a crashed node stops heartbeating its claim
+            self.assertTrue(b.claim("y"))
+            old = a.now() - 60
+            os.utime(b.file("claimed", "y"), (old, old))
+            self.assertEqual(a.requeue_expired(), ["y"])
+            self.assertTrue(a.claim("y"))
+            b.heartbeat()
+            self.assertEqual(a.owner("y"), "a")
+            self.assertEqual(b.held, set())
+
+if __name__ == '__main__':
+    unittest.main()